@@ -0,0 +1,265 @@
+"""Admission control in front of the model.
+
+Two gates, both cheap to fail:
+
+1. A token bucket per user. A student who sends faster than their tier
+   allows gets a 429 with ``Retry-After`` straight away. Buckets live in
+   process, or in Redis so every API worker sees the same balance.
+2. A global budget of model calls, handed out by fair queuing. Each
+   request starts at ``max(virtual time, user's last finish tag)``, finishes
+   ``1 / weight`` later, and the smallest finish tag runs next. Virtual time
+   is the start tag of the latest request granted a slot, whether it queued
+   or not, so a user's tags never run ahead of it through quiet periods. A
+   user flooding the API only pushes their own tags back, so everyone else
+   keeps their place, and a higher tier's weight moves its requests forward. When the queue is full, or a
+   request has waited too long, it is turned away with a 429 rather than
+   left to pile up.
+
+Tiers match the Premium page (Free, Plus, Ultra) and are read from the
+token's ``app_metadata``, which users cannot edit themselves.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TIER_WEIGHTS = {"free": 1.0, "plus": 4.0, "ultra": 8.0}
+
+
+def tier_from_claims(claims: dict) -> str:
+    tier = (claims.get("app_metadata") or {}).get("tier")
+    return tier if tier in TIER_WEIGHTS else "free"
+
+
+class Overloaded(Exception):
+    """Request refused; the client may retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """In-process buckets in a bounded LRU.
+
+    A bucket untouched for ``burst / rate`` seconds is full again, so
+    evicting idle users loses nothing that matters.
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Spend ``cost`` tokens; returns 0 if allowed, else seconds until it would be."""
+        now = self.clock()
+        tokens, stamp = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+_TAKE_SCRIPT = """
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisTokenBuckets:
+    """Buckets shared by all workers, updated atomically by a Lua script.
+
+    If Redis is unreachable requests are let through: a rate limiter must
+    not take the tutor down with it.
+    """
+
+    def __init__(self, url: str, prefix: str = "fynq:rate:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        try:
+            wait = await self._take(keys=[self.prefix + key], args=[rate, burst, time.time(), cost])
+        except Exception:
+            logger.warning("Redis rate limit check failed", exc_info=True)
+            return 0.0
+        return float(wait)
+
+
+class FairScheduler:
+    """``capacity`` slots shared by weighted flows (see the module docstring)."""
+
+    def __init__(self, capacity: int, max_queue: int = 256, max_wait: float = 10.0):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.rejected = 0
+        self._queue: list[tuple[float, int, float, asyncio.Future]] = []
+        self._waiting = 0
+        self._finish: dict[str, float] = {}
+        self._vtime = 0.0
+        self._order = itertools.count()
+        self._hold = 1.0  # moving average of seconds a slot is held
+
+    @property
+    def queued(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> float:
+        return max(1.0, self._hold * (self._waiting + 1) / self.capacity)
+
+    async def acquire(self, flow: str, weight: float = 1.0) -> None:
+        start = max(self._vtime, self._finish.get(flow, 0.0))
+        tag = start + 1.0 / weight
+        if self.active < self.capacity and not self._waiting:
+            self._finish[flow] = tag
+            self._vtime = start
+            self.active += 1
+            return
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Too many requests waiting for the model", self.retry_after())
+        self._finish[flow] = tag
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (tag, next(self._order), start, granted))
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if granted.done():
+                self.release()  # handed a slot just as we gave up
+            else:
+                granted.cancel()
+                self._waiting -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise Overloaded("Timed out waiting for the model", self.retry_after()) from None
+            raise
+
+    def release(self, held: float | None = None) -> None:
+        if held is not None:
+            self._hold += (held - self._hold) * 0.1
+        while self._queue:
+            _, _, start, granted = heapq.heappop(self._queue)
+            if granted.cancelled():
+                continue
+            self._waiting -= 1
+            self._vtime = max(self._vtime, start)
+            granted.set_result(None)  # the slot passes straight to the waiter
+            return
+        self.active -= 1
+        if len(self._finish) > 4 * (self.capacity + self.max_queue):
+            # Flows whose tag is behind virtual time would start from it anyway.
+            self._finish = {flow: tag for flow, tag in self._finish.items() if tag > self._vtime}
+
+
+class Ticket:
+    """A granted model slot; release it when the answer is done."""
+
+    def __init__(self, scheduler: FairScheduler | None):
+        self._scheduler = scheduler
+        self._started = time.monotonic()
+
+    def release(self) -> None:
+        if self._scheduler is not None:
+            scheduler, self._scheduler = self._scheduler, None
+            scheduler.release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Rate limit per user, then queue fairly for a model slot.
+
+    ``rate`` (requests per second) and ``burst`` are for the Free tier and
+    are scaled by the tier weight. ``rate=0`` turns the buckets off and
+    ``scheduler=None`` the global budget.
+    """
+
+    def __init__(self, buckets=None, scheduler: FairScheduler | None = None, rate: float = 0.0,
+                 burst: float = 10.0, weights: dict[str, float] = TIER_WEIGHTS):
+        self.buckets = buckets if buckets is not None else TokenBuckets()
+        self.scheduler = scheduler
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights
+        self.throttled = 0
+
+    async def check_rate(self, user_id: str, tier: str) -> None:
+        if self.rate <= 0:
+            return
+        weight = self.weights.get(tier, 1.0)
+        wait = await self.buckets.take(user_id, self.rate * weight, self.burst * weight)
+        if wait > 0:
+            self.throttled += 1
+            raise Overloaded("Rate limit exceeded", wait)
+
+    async def pace(self, user_id: str, tier: str, max_wait: float = 60.0) -> None:
+        """Take one request from the bucket, waiting up to ``max_wait`` seconds for it.
+
+        For work the user has already queued, such as the rest of a worksheet,
+        which should slow down to the tier's rate rather than fail.
+        """
+        if self.rate <= 0:
+            return
+        weight = self.weights.get(tier, 1.0)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = await self.buckets.take(user_id, self.rate * weight, self.burst * weight)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                self.throttled += 1
+                raise Overloaded("Rate limit exceeded", wait)
+            await asyncio.sleep(wait)
+
+    async def acquire(self, user_id: str, tier: str) -> Ticket:
+        """Wait for a model slot without touching the rate limit."""
+        if self.scheduler is not None:
+            await self.scheduler.acquire(user_id, self.weights.get(tier, 1.0))
+        return Ticket(self.scheduler)
+
+    async def admit(self, user_id: str, tier: str) -> Ticket:
+        await self.check_rate(user_id, tier)
+        return await self.acquire(user_id, tier)
+
+    def stats(self) -> dict:
+        stats = {"throttled": self.throttled}
+        if self.scheduler is not None:
+            stats.update(active=self.scheduler.active, queued=self.scheduler.queued,
+                         rejected=self.scheduler.rejected)
+        return stats
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
@@ -1,40 +1,78 @@
+"""ASGI entry point serving the FastAPI API and the Django project side by side.
+
+    uvicorn asgi:application
+    ASGI_PRELOAD=1 gunicorn -k uvicorn.workers.UvicornWorker -w 4 --preload asgi:application
+
+API paths (``/api/v1``, ``/metrics`` and the OpenAPI docs) are handed to
+the FastAPI app with the request scope untouched, so its own routes match
+and its middleware (CORS, body limits, metrics) is the only stack they go
+through. Every other path goes to Django, which is set up the first time
+such a request arrives; workers that only serve the API never load it.
+Lifespan events go to the FastAPI app, which starts and stops the model
+client, JWKS refresh and job workers.
+
+With ``ASGI_PRELOAD=1`` both apps are built when this module is imported,
+so a preloading server does that work once in the master and the forked
+workers share its memory. Nothing opens a connection, thread or process
+at import; that happens in the lifespan of each worker.
+"""
 import os
-import django
-from fastapi import FastAPI
-from django.core.asgi import get_asgi_application
-from fastapi.middleware.cors import CORSMiddleware
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
-django.setup()
-
-# Import your FastAPI app
-from main import app as fastapi_app
-
-# Django ASGI app
-django_asgi_app = get_asgi_application()
-
-# Add CORS to FastAPI
-fastapi_app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://localhost:8080",
-        "http://127.0.0.1:8080",
-        "https://preview--fynqai-spark-tutor-flow.lovable.app/",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-from starlette.routing import Mount
-from starlette.applications import Starlette
-
-# Mount FastAPI at /api/v1, Django at /
-application = Starlette(
-    routes=[
-        Mount("/api/v1", app=fastapi_app),
-        Mount("/", app=django_asgi_app),
-    ]
-) 
\ No newline at end of file
+
+API_PREFIXES = ("/api/v1/", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+def _load_api():
+    from main import app
+
+    return app
+
+
+def _load_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    from django.core.asgi import get_asgi_application  # runs django.setup()
+
+    from metrics import MetricsMiddleware
+
+    # Django's requests are recorded under app="django" in the API's registry.
+    return MetricsMiddleware(get_asgi_application(), app_label="django")
+
+
+class Application:
+    """Dispatches on path prefix to the API or Django, each built on first use."""
+
+    def __init__(self, load_api=_load_api, load_django=_load_django, api_prefixes=API_PREFIXES):
+        self._load_api = load_api
+        self._load_django = load_django
+        self.api_prefixes = api_prefixes
+        self._api = None
+        self._django = None
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api = self._load_api()
+        return self._api
+
+    @property
+    def django(self):
+        if self._django is None:
+            self._django = self._load_django()
+        return self._django
+
+    def preload(self) -> "Application":
+        self.api
+        self.django
+        return self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or scope["path"].startswith(self.api_prefixes):
+            return await self.api(scope, receive, send)
+        return await self.django(scope, receive, send)
+
+
+def create_app(preload: bool = False) -> Application:
+    app = Application()
+    return app.preload() if preload else app
+
+
+application = create_app(preload=os.getenv("ASGI_PRELOAD", "0") == "1")
@@ -0,0 +1,145 @@
+"""Offline verification of Supabase access tokens.
+
+Tokens are checked locally with python-jose instead of asking Supabase on
+every request. HS256 tokens are verified with the project's JWT secret and
+asymmetric ones (RS256/ES256) with keys from the project's JWKS, which is
+cached and refreshed in the background. Verified claims are kept in a
+bounded LRU keyed by the token hash until the token expires, so repeat
+calls skip the signature check entirely.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import requests
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class JWKSCache:
+    """Signing keys by ``kid``, fetched from ``url``.
+
+    :meth:`start` refreshes them every ``refresh_interval`` seconds. An
+    unknown ``kid`` (key rotation) triggers an immediate refetch, at most
+    once per ``min_refetch_interval`` seconds.
+    """
+
+    def __init__(self, url: str, refresh_interval: float = 3600.0, min_refetch_interval: float = 60.0,
+                 fetch=None):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self._fetch = fetch or self._http_fetch
+        self._keys: dict[str, dict] = {}
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def _http_fetch(self) -> dict:
+        response = requests.get(self.url, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    async def refresh(self) -> None:
+        document = await asyncio.to_thread(self._fetch)
+        self._keys = {key["kid"]: key for key in document.get("keys", []) if "kid" in key}
+        self._fetched_at = time.monotonic()
+
+    async def get(self, kid: str) -> dict | None:
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        async with self._lock:
+            if kid not in self._keys and time.monotonic() - self._fetched_at >= self.min_refetch_interval:
+                try:
+                    await self.refresh()
+                except Exception:
+                    logger.warning("JWKS fetch failed", exc_info=True)
+        return self._keys.get(kid)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_forever())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning("JWKS refresh failed; keeping previous keys", exc_info=True)
+            await asyncio.sleep(self.refresh_interval)
+
+
+class TokenVerifier:
+    def __init__(self, jwt_secret: str | None = None, jwks: JWKSCache | None = None,
+                 audience: str | None = "authenticated", cache_size: int = 10000, clock=time.time):
+        self.jwt_secret = jwt_secret
+        self.jwks = jwks
+        self.audience = audience
+        self.cache_size = cache_size
+        self._clock = clock
+        self._verified: OrderedDict[bytes, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def verify(self, token: str) -> dict:
+        """Claims of a valid token; raises :class:`InvalidToken` otherwise."""
+        digest = hashlib.sha256(token.encode()).digest()
+        claims = self._verified.get(digest)
+        if claims is not None:
+            if claims["exp"] > self._clock():
+                self._verified.move_to_end(digest)
+                self.hits += 1
+                return claims
+            del self._verified[digest]
+        self.misses += 1
+        claims = await self._verify_signature(token)
+        if "exp" not in claims:
+            raise InvalidToken("Token has no expiry")
+        self._verified[digest] = claims
+        if len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+        return claims
+
+    async def _verify_signature(self, token: str) -> dict:
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            raise InvalidToken("Malformed token") from None
+        algorithm = header.get("alg")
+        if algorithm == "HS256" and self.jwt_secret:
+            key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS and self.jwks is not None:
+            key = await self.jwks.get(header.get("kid", ""))
+            if key is None:
+                raise InvalidToken("Unknown signing key")
+        else:
+            raise InvalidToken(f"Unsupported token algorithm: {algorithm}")
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                options={"verify_aud": self.audience is not None},
+            )
+        except JWTError as e:
+            raise InvalidToken(str(e)) from None
+
+    def stats(self) -> dict:
+        return {"entries": len(self._verified), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,88 @@
+"""Answer a list of questions with bounded fan-out, streaming results as NDJSON.
+
+A worksheet of 50 questions is solved by ``concurrency`` workers pulling
+from a shared queue, so the wall time is roughly that of the slowest few
+answers instead of the sum of all of them, while one batch never holds
+more than ``concurrency`` model slots. Each result is written as one JSON
+line the moment it is ready, in completion order and tagged with the
+question's ``index``. A failed question becomes an ``error`` line and the
+rest carry on; a final ``done`` line summarizes the batch. If the client
+goes away the workers and their upstream calls are cancelled.
+"""
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+def format_ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+def default_error(e: Exception) -> dict:
+    return {"error": str(e) or type(e).__name__, "status": 500}
+
+
+class BatchSolver:
+    """Runs batches (see the module docstring) and counts their outcomes."""
+
+    def __init__(self, concurrency: int = 4,
+                 describe_error: Callable[[Exception], dict] = default_error):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.describe_error = describe_error
+        self.answered = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def run(self, questions: list[str],
+                  solve: Callable[[str], Awaitable[dict]]) -> AsyncIterator[dict]:
+        """Yield ``{"index": i, **solve(questions[i])}`` as each finishes, then a summary."""
+        todo: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(questions):
+            todo.put_nowait(item)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while not todo.empty():
+                index, question = todo.get_nowait()
+                try:
+                    result = {"index": index, **await solve(question)}
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Batch question %d failed", index, exc_info=True)
+                    result = {"index": index, **self.describe_error(e)}
+                await results.put(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(questions)))]
+        succeeded = failed = 0
+        try:
+            for _ in questions:
+                result = await results.get()
+                if "error" in result:
+                    failed += 1
+                else:
+                    succeeded += 1
+                yield result
+            yield {"done": True, "succeeded": succeeded, "failed": failed}
+        finally:
+            self.answered += succeeded
+            self.failed += failed
+            self.cancelled += len(questions) - succeeded - failed
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"answered": self.answered, "failed": self.failed, "cancelled": self.cancelled}
+
+
+async def ndjson_stream(results: AsyncIterator[dict]) -> AsyncIterator[str]:
+    try:
+        async for result in results:
+            yield format_ndjson(result)
+    finally:
+        await results.aclose()
@@ -0,0 +1,292 @@
+"""Load test of the chat API at increasing concurrency, with no network.
+
+By default requests are fed straight into the ASGI app (``--target main``
+for ``main.app``, ``asgi`` for the ``asgi.application`` composition) and
+answered by a fake model with the given latency, chunk cadence and error
+rate. With ``--url`` a running server is hit over HTTP instead; start it
+with ``LLM_BACKEND=fake`` and the ``FAKE_LLM_*`` settings, and pass
+``--server-pid`` to measure its memory.
+
+For each concurrency level it reports requests/s, latency percentiles,
+time to first token (first SSE chunk for ``--endpoint stream``) and the
+growth in resident memory per open connection. ``--output`` saves the
+run as JSON to compare later.
+
+    cd backend && python benchmarks/bench_load.py --levels 1,8,32,128 --seconds 5 \\
+        --endpoint stream --latency 0.2 --chunk-delay 0.02 --output run.json
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+os.environ["SUPABASE_URL"] = ""
+os.environ["DATABASE_URL"] = ""
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["RATE_LIMIT_PER_MINUTE"] = "0"
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import subprocess
+import time
+
+from jose import jwt
+
+PATHS = {"message": "/api/v1/chat/message", "stream": "/api/v1/chat/stream"}
+
+
+def make_token(user: str) -> str:
+    return jwt.encode(
+        {"sub": user, "aud": "authenticated", "exp": int(time.time()) + 3600},
+        os.environ["SUPABASE_JWT_SECRET"],
+        algorithm="HS256",
+    )
+
+
+def rss_bytes(pid: int | str = "self") -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def is_first_token(chunk: bytes) -> bool:
+    # SSE answers start with their first chunk event; heartbeats and a bare
+    # done/error event don't count. Plain JSON answers arrive all at once.
+    if chunk.startswith(b"event: ") or chunk.startswith(b":"):
+        return chunk.startswith(b"event: chunk")
+    return bool(chunk)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ASGIClient:
+    """Calls an ASGI app directly and times the response as it is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def post(self, path: str, body: bytes, headers: dict) -> tuple[int, float | None, bool]:
+        """Returns (status, seconds to the first chunk event or body, whether an error event came)."""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        start = time.perf_counter()
+        sent = False
+        finished = asyncio.Event()
+        status = 0
+        first = None
+        error = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status, first, error
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if first is None and is_first_token(chunk):
+                    first = time.perf_counter() - start
+                error = error or b"event: error" in chunk
+                if not message.get("more_body", False):
+                    finished.set()
+
+        await self.app(scope, receive, send)
+        finished.set()
+        return status, first, error
+
+
+class HTTPClient:
+    def __init__(self, url: str):
+        import httpx
+
+        self.client = httpx.AsyncClient(base_url=url, timeout=120,
+                                        limits=httpx.Limits(max_connections=None))
+
+    async def post(self, path: str, body: bytes, headers: dict) -> tuple[int, float | None, bool]:
+        start = time.perf_counter()
+        first = None
+        error = False
+        async with self.client.stream("POST", path, content=body, headers=headers) as response:
+            async for chunk in response.aiter_bytes():
+                if first is None and is_first_token(chunk):
+                    first = time.perf_counter() - start
+                error = error or b"event: error" in chunk
+        return response.status_code, first, error
+
+
+def load_target(args):
+    # Read by main at import: the admission budget matches the model's.
+    os.environ.setdefault("ADMISSION_CONCURRENCY", str(args.model_concurrency))
+    from llm import FakeBackend, LLMClient
+    import main
+
+    llm = LLMClient(
+        FakeBackend(
+            reply="x" * args.reply_chars,
+            latency=args.latency,
+            chunk_size=args.chunk_size,
+            chunk_delay=args.chunk_delay,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        ),
+        max_concurrency=args.model_concurrency,
+        timeout=120,
+        cache=None,
+        coalesce=False,
+    )
+    main.app.dependency_overrides[main.get_llm_client] = lambda: llm
+    if args.target == "asgi":
+        import asgi
+
+        return asgi.application
+    return main.app
+
+
+async def run_level(client, args, concurrency: int, users: list[str]) -> dict:
+    path = PATHS[args.endpoint]
+    counter = itertools.count()
+    latencies, ttfts = [], []
+    statuses: dict[int, int] = {}
+    stream_errors = 0
+    deadline = time.perf_counter() + args.seconds
+    baseline = rss_bytes(args.server_pid or "self")
+    peak = baseline
+
+    async def worker(i: int):
+        nonlocal stream_errors
+        headers = {"authorization": f"Bearer {users[i % len(users)]}", "content-type": "application/json"}
+        while time.perf_counter() < deadline:
+            body = json.dumps({"message": f"question {next(counter)}"}).encode()
+            start = time.perf_counter()
+            status, first, error = await client.post(path, body, headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if error:
+                stream_errors += 1
+            elif status == 200 and first is not None:
+                ttfts.append(first)
+
+    async def sample_memory():
+        nonlocal peak
+        while True:
+            peak = max(peak, rss_bytes(args.server_pid or "self"))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    ok = statuses.get(200, 0) - stream_errors
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {q: ms(percentile(latencies, p)) for q, p in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "ttft_ms": {q: ms(percentile(ttfts, p)) for q, p in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "rss_mb": round(peak / 2**20, 1),
+        "kb_per_connection": round((peak - baseline) / 1024 / concurrency, 1),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> list[dict]:
+    client = HTTPClient(args.url) if args.url else ASGIClient(load_target(args))
+    users = [make_token(f"bench-user-{i}") for i in range(args.users)]
+    results = []
+    for concurrency in args.levels:
+        await run_level(client, args, min(concurrency, 4), users)  # warm-up
+        results.append(await run_level(client, args, concurrency, users))
+        r = results[-1]
+        print(f"{r['concurrency']:>6}{r['rps']:>10}{r['latency_ms']['p50'] or 0:>10.1f}"
+              f"{r['latency_ms']['p95'] or 0:>10.1f}{r['latency_ms']['p99'] or 0:>10.1f}"
+              f"{r['ttft_ms']['p50'] or 0:>10.1f}{r['ttft_ms']['p99'] or 0:>10.1f}"
+              f"{r['errors']:>8}{r['kb_per_connection']:>10.1f}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("main", "asgi"), default="main")
+    parser.add_argument("--url", help="benchmark a running server instead, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, help="with --url, whose memory to sample")
+    parser.add_argument("--endpoint", choices=tuple(PATHS), default="message")
+    parser.add_argument("--levels", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32, 128],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each level")
+    parser.add_argument("--users", type=int, default=64, help="distinct signed-in users")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake model time to first chunk (s)")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--model-concurrency", type=int, default=64, help="model and admission slots")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    print(f"{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'ttft50':>10}{'ttft99':>10}{'errors':>8}{'KB/conn':>10}")
+    results = asyncio.run(run(args))
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": {k: v for k, v in vars(args).items()},
+            },
+            "levels": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Upstream calls vs. client requests under a burst of duplicate questions.
+
+Simulates a classroom where a projected problem is sent by many students at
+once, with and without coalescing. The response cache is left off so only
+single-flight is measured.
+
+    cd backend && python benchmarks/bench_singleflight.py --students 200 --questions 3
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import argparse
+import asyncio
+import random
+import time
+
+from llm import FakeBackend, LLMClient
+
+
+async def burst(client: LLMClient, students: int, questions: int, spread: float, stream: bool):
+    async def student(i: int):
+        await asyncio.sleep(random.uniform(0, spread))
+        prompt = f"Projected problem #{i % questions}: find the roots of x^2 - 6x + 8 = 0"
+        if stream:
+            return "".join([chunk async for chunk in client.stream(prompt)])
+        return (await client.generate(prompt)).text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(student(i) for i in range(students)))
+    return time.perf_counter() - start
+
+
+def run(args, coalesce: bool, stream: bool) -> dict:
+    backend = FakeBackend(latency=args.latency, chunk_size=8, chunk_delay=0.01)
+    client = LLMClient(backend, max_concurrency=args.concurrency, coalesce=coalesce)
+    elapsed = asyncio.run(burst(client, args.students, args.questions, args.spread, stream))
+    return {
+        "mode": ("stream" if stream else "message") + (" +coalesce" if coalesce else ""),
+        "requests": args.students,
+        "upstream": backend.calls,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=3, help="distinct prompts in the burst")
+    parser.add_argument("--spread", type=float, default=1.0, help="seconds over which requests arrive")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake upstream latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'mode':<20}{'requests':>10}{'upstream':>10}{'ratio':>8}{'seconds':>10}")
+    for stream in (False, True):
+        for coalesce in (False, True):
+            row = run(args, coalesce, stream)
+            ratio = row["requests"] / row["upstream"]
+            print(f"{row['mode']:<20}{row['requests']:>10}{row['upstream']:>10}{ratio:>8.1f}{row['seconds']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
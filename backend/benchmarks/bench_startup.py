@@ -0,0 +1,204 @@
+"""Cold start and per-request overhead of the ASGI entry points.
+
+Cold start is timed in fresh interpreters (median of ``--runs``), from the
+first import to the app being ready to serve:
+
+    main          ``import main``, the FastAPI app alone
+    main gemini   the same with ``LLM_BACKEND=gemini``
+    asgi          ``import asgi``: nothing is built until it is used
+    asgi+startup  ``import asgi`` plus the lifespan startup a server runs
+    asgi preload  ``ASGI_PRELOAD=1``: API and Django built at import
+    legacy        the old composition: ``django.setup()``, a Starlette
+                  mount and a second CORS layer, all at import
+    genai sdk     ``import google.generativeai``, which the Gemini backend
+                  now defers to the worker's lifespan
+
+Per-request overhead is the mean time of an unauthenticated
+``GET /api/v1/chat/history`` (rejected by auth, so the route, middleware
+and dispatch are all there is) through each entry point, fed straight in
+as ASGI calls. Rows that need Django are skipped where it isn't installed;
+the legacy per-request row then stands a 404 app in for Django, which API
+requests never reach anyway.
+
+    cd backend && python benchmarks/bench_startup.py --runs 5 --requests 5000
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+os.environ["SUPABASE_URL"] = ""
+os.environ["DATABASE_URL"] = ""
+os.environ["LLM_BACKEND"] = "fake"
+
+import argparse
+import asyncio
+import importlib.util
+import statistics
+import subprocess
+import textwrap
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.dirname(__file__) + '/../')
+HAS_DJANGO = importlib.util.find_spec("django") is not None
+
+# backend/asgi.py before the app factory, kept here to compare against.
+LEGACY_DJANGO = """
+import os
+import django
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+django_asgi_app = get_asgi_application()
+"""
+LEGACY = LEGACY_DJANGO + """
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+
+from main import METRICS_TOKEN, app as fastapi_app
+from metrics import MetricsMiddleware, metrics_endpoint
+fastapi_app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:5173", "http://127.0.0.1:5173", "http://localhost:8080",
+                   "http://127.0.0.1:8080", "https://preview--fynqai-spark-tutor-flow.lovable.app/"],
+    allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+)
+application = Starlette(routes=[
+    Route("/metrics", metrics_endpoint(METRICS_TOKEN)),
+    Mount("/api/v1", app=fastapi_app),
+    Mount("/", app=MetricsMiddleware(django_asgi_app, app_label="django")),
+])
+"""
+
+STARTUP = """
+import asyncio
+
+async def lifespan(app):
+    sent = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+
+    async def receive():
+        return next(sent)
+
+    async def send(message):
+        if message["type"] == "lifespan.startup.complete":
+            print(f"{time.perf_counter() - start:.6f}", flush=True)
+
+    await app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send)
+
+asyncio.run(lifespan(asgi.application))
+"""
+
+COLD_STARTS = {
+    "main": ("import main", {}, False),
+    "main gemini": ("import main", {"LLM_BACKEND": "gemini", "GEMINI_API_KEY": "bench"}, False),
+    "asgi": ("import asgi", {}, False),
+    "asgi+startup": ("import asgi", {}, True),
+    "asgi preload": ("import asgi", {"ASGI_PRELOAD": "1"}, False),
+    "legacy": (LEGACY, {}, False),
+    "genai sdk": ("import google.generativeai", {}, False),
+}
+NEEDS_DJANGO = {"asgi preload", "legacy"}
+
+
+def cold_start(code: str, env: dict, startup: bool, runs: int) -> float | None:
+    script = "import time\nstart = time.perf_counter()\n" + textwrap.dedent(code)
+    script += STARTUP if startup else '\nprint(f"{time.perf_counter() - start:.6f}", flush=True)\n'
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-W", "ignore", "-c", script], cwd=BACKEND_DIR,
+                                env={**os.environ, **env}, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr.strip().splitlines()[-1], file=sys.stderr)
+            return None
+        times.append(float(result.stdout.split()[0]))
+    return statistics.median(times)
+
+
+async def call(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def per_request(app, path: str, requests: int) -> float:
+    status = await call(app, path)
+    if status != 403:
+        raise RuntimeError(f"{path} answered {status}, expected 403 from auth")
+    for _ in range(min(requests, 200)):  # warm-up
+        await call(app, path)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter() - start) / requests
+
+
+def legacy_app():
+    import main
+    from starlette.responses import PlainTextResponse
+
+    # The legacy composition adds a middleware to the app the other rows already ran.
+    main.app.middleware_stack = None
+    namespace = {} if HAS_DJANGO else {"django_asgi_app": PlainTextResponse("", status_code=404)}
+    exec(LEGACY if HAS_DJANGO else LEGACY[len(LEGACY_DJANGO):], namespace)
+    return namespace["application"]
+
+
+def request_targets():
+    import main
+    from asgi import create_app
+
+    yield "main.app", main.app, "/api/v1/chat/history"
+    yield "asgi", create_app(), "/api/v1/chat/history"
+    # The old mount stripped /api/v1 before main's /api/v1 routes saw the path.
+    yield "legacy" if HAS_DJANGO else "legacy*", legacy_app(), "/api/v1/api/v1/chat/history"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per cold start")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per entry point")
+    args = parser.parse_args()
+
+    print(f"{'cold start':<14}{'ms':>10}")
+    for name, (code, env, startup) in COLD_STARTS.items():
+        if name in NEEDS_DJANGO and not HAS_DJANGO:
+            print(f"{name:<14}{'skipped (no django)':>22}")
+            continue
+        seconds = cold_start(code, env, startup, args.runs)
+        print(f"{name:<14}{'failed' if seconds is None else f'{seconds * 1000:.1f}':>10}", flush=True)
+
+    print(f"\n{'per request':<14}{'us':>10}")
+    for name, app, path in request_targets():
+        seconds = asyncio.run(per_request(app, path, args.requests))
+        print(f"{name:<14}{seconds * 1e6:>10.1f}", flush=True)
+    if not HAS_DJANGO:
+        print("* Django not installed; a 404 app stands in for it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from .database import Database
+from .files import find_file_by_hash, insert_uploaded_file
+from .history import decode_cursor, encode_cursor, latest_message_id, list_messages, list_sessions
+from .schema import create_sqlite_schema
+from .search import search_history, search_text
+from .survey import SURVEY_FIELDS, get_survey_response
+from .writer import MessageWriter
+
+__all__ = [
+    "Database",
+    "MessageWriter",
+    "SURVEY_FIELDS",
+    "create_sqlite_schema",
+    "decode_cursor",
+    "encode_cursor",
+    "find_file_by_hash",
+    "get_survey_response",
+    "insert_uploaded_file",
+    "latest_message_id",
+    "list_messages",
+    "list_sessions",
+    "search_history",
+    "search_text",
+]
@@ -0,0 +1,61 @@
+"""Thin async wrapper around a pooled SQLAlchemy engine.
+
+The app talks to the Supabase Postgres database directly (``DATABASE_URL``);
+tests and local development point the same code at SQLite. Queries are
+plain SQL run on a worker thread so the event loop never waits on the
+database driver.
+"""
+import asyncio
+
+from sqlalchemy import create_engine, event, text
+
+from .search import search_text
+
+
+class Database:
+    def __init__(self, url: str, pool_size: int = 5, **engine_kwargs):
+        if url.startswith("sqlite"):
+            engine_kwargs.setdefault("connect_args", {"check_same_thread": False})
+        else:
+            engine_kwargs.setdefault("pool_size", pool_size)
+            engine_kwargs.setdefault("pool_pre_ping", True)
+        self.engine = create_engine(url, **engine_kwargs)
+        if self.dialect == "sqlite":
+            # Used by the stand-in schema's full-text search triggers.
+            event.listen(self.engine, "connect", _register_sqlite_functions)
+
+    @property
+    def dialect(self) -> str:
+        return self.engine.dialect.name
+
+    async def fetch_all(self, sql: str, params: dict | None = None) -> list[dict]:
+        return await asyncio.to_thread(self._fetch_all, sql, params or {})
+
+    async def execute(self, sql: str, params: dict | list[dict] | None = None) -> None:
+        """Run a statement in its own transaction; a list of params is executemany."""
+        await asyncio.to_thread(self._execute, sql, params or {})
+
+    async def execute_all(self, statements: list[tuple[str, dict | list[dict]]]) -> None:
+        """Run several ``(sql, params)`` statements in one transaction."""
+        await asyncio.to_thread(self._execute_all, statements)
+
+    def _fetch_all(self, sql, params):
+        with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(text(sql), params)]
+
+    def _execute(self, sql, params):
+        with self.engine.begin() as conn:
+            conn.execute(text(sql), params)
+
+    def _execute_all(self, statements):
+        with self.engine.begin() as conn:
+            for sql, params in statements:
+                if params != []:  # an executemany with nothing to do
+                    conn.execute(text(sql), params)
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    dbapi_connection.create_function("fynq_search_text", 1, search_text, deterministic=True)
@@ -0,0 +1,34 @@
+"""Reads and writes on ``uploaded_files``."""
+import uuid
+
+
+async def find_file_by_hash(db, user_id: str, sha256: str) -> dict | None:
+    """The user's earlier upload with the same content, if any."""
+    rows = await db.fetch_all(
+        "SELECT id, file_name, file_type, file_size, file_path FROM uploaded_files"
+        " WHERE user_id = :user_id AND content_sha256 = :sha256 LIMIT 1",
+        {"user_id": user_id, "sha256": sha256},
+    )
+    if not rows:
+        return None
+    row = rows[0]
+    return {**row, "id": str(row["id"])}
+
+
+async def insert_uploaded_file(db, user_id: str, *, file_name: str, file_type: str, file_size: int,
+                               file_path: str, sha256: str) -> str:
+    file_id = str(uuid.uuid4())
+    await db.execute(
+        "INSERT INTO uploaded_files (id, user_id, file_name, file_type, file_size, file_path, content_sha256)"
+        " VALUES (:id, :user_id, :file_name, :file_type, :file_size, :file_path, :sha256)",
+        {
+            "id": file_id,
+            "user_id": user_id,
+            "file_name": file_name,
+            "file_type": file_type,
+            "file_size": file_size,
+            "file_path": file_path,
+            "sha256": sha256,
+        },
+    )
+    return file_id
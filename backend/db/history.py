@@ -0,0 +1,119 @@
+"""Keyset-paginated reads of chat sessions and messages.
+
+Pages are addressed by an opaque cursor holding the sort key of the last row
+served, so fetching page 40 of a long session costs the same index range scan
+as page 1 (no OFFSET). See the ``*_keyset_pagination_indexes`` migration for
+the matching indexes.
+"""
+import base64
+import json
+from datetime import datetime
+
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value, row_id) -> str:
+    raw = json.dumps([_iso(sort_value), str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Inverse of :func:`encode_cursor`; raises ValueError on garbage."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+    return str(sort_value), str(row_id)
+
+
+def _iso(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+async def list_sessions(db, user_id: str, limit: int = 20, cursor: str | None = None,
+                        include_archived: bool = False) -> dict:
+    """Most recently updated sessions first."""
+    params = {"user_id": user_id, "limit": min(limit, MAX_PAGE_SIZE) + 1}
+    where = ["user_id = :user_id"]
+    if not include_archived:
+        where.append("(is_archived IS NULL OR is_archived = :false)")
+        params["false"] = False
+    if cursor:
+        params["after_ts"], params["after_id"] = decode_cursor(cursor)
+        where.append("(updated_at, id) < (:after_ts, :after_id)")
+    rows = await db.fetch_all(
+        "SELECT id, title, created_at, updated_at, is_archived FROM chat_sessions"
+        f" WHERE {' AND '.join(where)}"
+        " ORDER BY updated_at DESC, id DESC LIMIT :limit",
+        params,
+    )
+    page, next_cursor = _split(rows, params["limit"] - 1, "updated_at")
+    return {
+        "sessions": [
+            {
+                "id": str(row["id"]),
+                "title": row["title"],
+                "created_at": _iso(row["created_at"]),
+                "updated_at": _iso(row["updated_at"]),
+                "is_archived": bool(row["is_archived"]),
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+async def list_messages(db, user_id: str, session_id: str, limit: int = 50,
+                        cursor: str | None = None) -> dict:
+    """One page of a session, oldest first within the page.
+
+    The first page holds the latest messages; ``next_cursor`` walks back
+    towards the start of the conversation. Sessions not owned by
+    ``user_id`` come back empty.
+    """
+    params = {"user_id": user_id, "session_id": session_id, "limit": min(limit, MAX_PAGE_SIZE) + 1}
+    where = ["m.session_id = :session_id"]
+    if cursor:
+        params["before_ts"], params["before_id"] = decode_cursor(cursor)
+        where.append("(m.created_at, m.id) < (:before_ts, :before_id)")
+    rows = await db.fetch_all(
+        "SELECT m.id, m.content, m.is_user, m.created_at FROM messages m"
+        " JOIN chat_sessions s ON s.id = m.session_id AND s.user_id = :user_id"
+        f" WHERE {' AND '.join(where)}"
+        " ORDER BY m.created_at DESC, m.id DESC LIMIT :limit",
+        params,
+    )
+    page, next_cursor = _split(rows, params["limit"] - 1, "created_at")
+    return {
+        "messages": [
+            {
+                "id": str(row["id"]),
+                "content": row["content"],
+                "sender": "user" if row["is_user"] else "bot",
+                "created_at": _iso(row["created_at"]),
+            }
+            for row in reversed(page)
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+async def latest_message_id(db, user_id: str, session_id: str) -> str | None:
+    """Id of the newest message in a session owned by ``user_id``; one index probe."""
+    rows = await db.fetch_all(
+        "SELECT m.id FROM messages m"
+        " JOIN chat_sessions s ON s.id = m.session_id AND s.user_id = :user_id"
+        " WHERE m.session_id = :session_id"
+        " ORDER BY m.created_at DESC, m.id DESC LIMIT 1",
+        {"user_id": user_id, "session_id": session_id},
+    )
+    return str(rows[0]["id"]) if rows else None
+
+
+def _split(rows: list[dict], limit: int, sort_column: str):
+    # One extra row is fetched to learn whether another page exists.
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1][sort_column], page[-1]["id"])
@@ -0,0 +1,94 @@
+"""SQLite stand-in for the Supabase tables the backend reads and writes.
+
+Mirrors the columns from ``supabase/migrations`` that the backend uses, with
+the same indexes, so queries can be tested without Postgres. Timestamps are
+stored as ISO-8601 text, which sorts the same way as ``timestamptz``.
+"""
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  title TEXT NOT NULL DEFAULT 'New Chat',
+  created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+  updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+  is_archived BOOLEAN DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+  id TEXT PRIMARY KEY,
+  session_id TEXT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+  content TEXT NOT NULL,
+  is_user BOOLEAN NOT NULL DEFAULT 1,
+  file_id TEXT,
+  created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS uploaded_files (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  file_name TEXT NOT NULL,
+  file_type TEXT NOT NULL,
+  file_size INTEGER NOT NULL,
+  file_path TEXT NOT NULL,
+  content_sha256 TEXT,
+  created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS survey_responses (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL UNIQUE,
+  learning_approach TEXT NOT NULL,
+  challenging_subject TEXT NOT NULL,
+  math_hurdle TEXT NOT NULL,
+  mistake_reaction TEXT NOT NULL,
+  feedback_preference TEXT NOT NULL,
+  study_time TEXT NOT NULL,
+  lesson_preference TEXT NOT NULL,
+  revision_method TEXT NOT NULL,
+  gamification_preference TEXT NOT NULL,
+  understanding_check TEXT NOT NULL,
+  summary TEXT,
+  created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_messages_session_created
+  ON messages (session_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated
+  ON chat_sessions (user_id, updated_at DESC, id DESC, title, created_at, is_archived);
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_user_sha256
+  ON uploaded_files (user_id, content_sha256);
+
+-- Full-text search (the Postgres migration uses GIN expression indexes instead).
+-- fynq_search_text() is registered on every connection by Database.
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, tokenize = 'porter unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS chat_sessions_fts USING fts5(body, tokenize = 'porter unicode61');
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+  INSERT INTO messages_fts (rowid, body) VALUES (new.rowid, fynq_search_text(new.content));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+  UPDATE messages_fts SET body = fynq_search_text(new.content) WHERE rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+  DELETE FROM messages_fts WHERE rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_insert AFTER INSERT ON chat_sessions BEGIN
+  INSERT INTO chat_sessions_fts (rowid, body) VALUES (new.rowid, fynq_search_text(new.title));
+END;
+CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_update AFTER UPDATE OF title ON chat_sessions BEGIN
+  UPDATE chat_sessions_fts SET body = fynq_search_text(new.title) WHERE rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_delete AFTER DELETE ON chat_sessions BEGIN
+  DELETE FROM chat_sessions_fts WHERE rowid = old.rowid;
+END;
+"""
+
+
+def create_sqlite_schema(database) -> None:
+    raw = database.engine.raw_connection()
+    try:
+        raw.driver_connection.executescript(SQLITE_SCHEMA)
+        raw.commit()
+    finally:
+        raw.close()
@@ -0,0 +1,179 @@
+"""Full-text search over a student's chat titles and messages.
+
+The index holds :func:`search_text` of each title and message, a copy in
+which LaTeX is reduced to the words a student would type: ``\\theta`` and
+``θ`` both become ``theta``, ``\\dfrac`` becomes ``frac``, and layout
+commands such as ``\\left`` and ``\\quad`` are dropped so they do not
+match searches for "left" or "right". Queries go through the same
+function, and each query word (3+ characters) also matches as a prefix.
+
+On Postgres the index is a GIN expression index maintained by the
+database on every insert or edit, whoever writes the row (see the
+``*_chat_search_index`` migration, which has a SQL copy of
+:func:`search_text`). The message index leads with ``user_id``, a copy of
+the session's owner kept on each message, so a search only visits the
+student's own entries (``*_messages_search_user_scope``). The SQLite stand-in keeps FTS5 tables up to date
+with triggers. Hits are ranked by relevance, with title hits weighted up,
+and snippets are cut from the original text around the first match.
+"""
+import re
+
+from .history import _iso, decode_cursor, encode_cursor
+
+MAX_PAGE_SIZE = 50
+MAX_TERMS = 8
+SNIPPET_CHARS = 160
+TITLE_WEIGHT = 2.0
+
+# Keep in step with public.fynq_search_text() in the migration.
+SYMBOLS = {
+    "α": "alpha", "β": "beta", "γ": "gamma", "δ": "delta", "Δ": "delta", "θ": "theta",
+    "λ": "lambda", "μ": "mu", "π": "pi", "σ": "sigma", "φ": "phi", "ω": "omega",
+    "∫": "int", "∑": "sum", "√": "sqrt", "∞": "infty",
+}
+_LAYOUT = re.compile(
+    r"\\(left|right|big|Big|bigg|Bigg|displaystyle|textstyle|quad|qquad|mathrm|mathbf|mathit|"
+    r"mathsf|mathcal|text|textrm|textbf|operatorname|begin|end|limits|nolimits)(?![a-zA-Z])"
+)
+_FRAC = re.compile(r"\\[dt]frac(?![a-zA-Z])")
+_COMMAND = re.compile(r"\\([a-zA-Z]+)")
+_MARKUP = re.compile(r"[{}^_$\\]")
+_WORD = re.compile(r"\w+")
+
+
+def search_text(text: str | None) -> str:
+    """``text`` as it is indexed (see the module docstring)."""
+    if not text:
+        return ""
+    for symbol, name in SYMBOLS.items():
+        text = text.replace(symbol, f" {name} ")
+    text = _LAYOUT.sub(" ", text)
+    text = _FRAC.sub(" frac ", text)
+    text = _COMMAND.sub(r" \1 ", text)
+    return _MARKUP.sub(" ", text)
+
+
+def query_terms(query: str) -> list[str]:
+    return [term.lower() for term in _WORD.findall(search_text(query))][:MAX_TERMS]
+
+
+def _tsquery(terms: list[str]) -> str:
+    return " & ".join(f"'{term}':*" if len(term) >= 3 else f"'{term}'" for term in terms)
+
+
+def _fts5_query(terms: list[str]) -> str:
+    return " AND ".join(f'"{term}"*' if len(term) >= 3 else f'"{term}"' for term in terms)
+
+
+_POSTGRES_SEARCH = """
+WITH q AS (SELECT to_tsquery('english', :query) AS query)
+SELECT * FROM (
+  SELECT s.id, s.id AS session_id, s.title, NULL AS message_id, NULL AS is_user, s.title AS content,
+         s.updated_at AS created_at,
+         :title_weight * ts_rank_cd(to_tsvector('english', public.fynq_search_text(s.title)), q.query) AS rank
+  FROM public.chat_sessions s, q
+  WHERE s.user_id = :user_id {archived}
+    AND to_tsvector('english', public.fynq_search_text(s.title)) @@ q.query
+  UNION ALL
+  SELECT m.id, s.id, s.title, m.id, m.is_user, m.content, m.created_at,
+         ts_rank_cd(to_tsvector('english', public.fynq_search_text(m.content)), q.query)
+  FROM public.messages m
+  JOIN public.chat_sessions s ON s.id = m.session_id {archived}, q
+  WHERE m.user_id = :user_id
+    AND to_tsvector('english', public.fynq_search_text(m.content)) @@ q.query
+) hits
+ORDER BY rank DESC, created_at DESC, id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+_SQLITE_SEARCH = """
+SELECT * FROM (
+  SELECT s.id, s.id AS session_id, s.title, NULL AS message_id, NULL AS is_user, s.title AS content,
+         s.updated_at AS created_at, -:title_weight * bm25(chat_sessions_fts) AS rank
+  FROM chat_sessions_fts JOIN chat_sessions s ON s.rowid = chat_sessions_fts.rowid
+  WHERE chat_sessions_fts MATCH :query AND s.user_id = :user_id {archived}
+  UNION ALL
+  SELECT m.id, s.id, s.title, m.id, m.is_user, m.content, m.created_at, -bm25(messages_fts)
+  FROM messages_fts
+  JOIN messages m ON m.rowid = messages_fts.rowid
+  JOIN chat_sessions s ON s.id = m.session_id AND s.user_id = :user_id {archived}
+  WHERE messages_fts MATCH :query
+)
+ORDER BY rank DESC, created_at DESC, id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+
+async def search_history(db, user_id: str, query: str, limit: int = 20, cursor: str | None = None,
+                         include_archived: bool = False) -> dict:
+    """Best matches first; a hit is a session title or one message.
+
+    Raises ValueError for a query with no words or a bad cursor.
+    """
+    terms = query_terms(query)
+    if not terms:
+        raise ValueError("Search query has no words")
+    offset = _decode_offset(cursor) if cursor else 0
+    limit = min(limit, MAX_PAGE_SIZE)
+    params = {"user_id": user_id, "limit": limit + 1, "offset": offset, "title_weight": TITLE_WEIGHT}
+    archived = ""
+    if not include_archived:
+        archived = "AND (s.is_archived IS NULL OR s.is_archived = :false)"
+        params["false"] = False
+    if db.dialect == "sqlite":
+        sql, params["query"] = _SQLITE_SEARCH, _fts5_query(terms)
+    else:
+        sql, params["query"] = _POSTGRES_SEARCH, _tsquery(terms)
+    rows = await db.fetch_all(sql.format(archived=archived), params)
+    page = rows[:limit]
+    return {
+        "results": [
+            {
+                "session_id": str(row["session_id"]),
+                "title": row["title"],
+                "message_id": str(row["message_id"]) if row["message_id"] is not None else None,
+                "sender": None if row["message_id"] is None else ("user" if row["is_user"] else "bot"),
+                "created_at": _iso(row["created_at"]),
+                **snippet(row["content"], terms),
+            }
+            for row in page
+        ],
+        "next_cursor": encode_cursor(offset + limit, "") if len(rows) > limit else None,
+    }
+
+
+def _decode_offset(cursor: str) -> int:
+    # Ranked results have no stable sort key to resume from, so pages are offsets.
+    offset, _ = decode_cursor(cursor)
+    if not offset.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(offset)
+
+
+def _matches(word: str, terms: list[str]) -> bool:
+    word = SYMBOLS.get(word, word).lower()
+    # Close enough to the index's stemming for highlighting: "projectiles" marks "projectile".
+    return any(word.startswith(term) or (len(term) > 4 and word.startswith(term[:-2])) for term in terms)
+
+
+def snippet(content: str, terms: list[str], width: int = SNIPPET_CHARS) -> dict:
+    """Up to ``width`` characters of ``content`` around its first match.
+
+    ``highlights`` are ``[start, end)`` offsets of matched words in the
+    snippet, so the client can mark them without parsing anything.
+    """
+    content = " ".join(content.split())
+    words = [m for m in re.finditer(r"\w+|[" + "".join(SYMBOLS) + "]", content) if _matches(m.group(), terms)]
+    start = 0
+    if words and words[0].start() > width // 4 and len(content) > width:
+        start = content.rfind(" ", 0, words[0].start() - width // 4) + 1
+    end = min(len(content), start + width)
+    if end < len(content) and " " in content[start:end]:
+        end = content.rfind(" ", start, end)
+    prefix = "…" if start > 0 else ""
+    text = prefix + content[start:end] + ("…" if end < len(content) else "")
+    shift = len(prefix) - start
+    return {
+        "snippet": text,
+        "highlights": [[m.start() + shift, m.end() + shift] for m in words if m.start() >= start and m.end() <= end],
+    }
@@ -0,0 +1,22 @@
+"""Reads on ``survey_responses``, the onboarding survey (one row per user)."""
+
+SURVEY_FIELDS = (
+    "learning_approach",
+    "challenging_subject",
+    "math_hurdle",
+    "mistake_reaction",
+    "feedback_preference",
+    "study_time",
+    "lesson_preference",
+    "revision_method",
+    "gamification_preference",
+    "understanding_check",
+)
+
+
+async def get_survey_response(db, user_id: str) -> dict | None:
+    rows = await db.fetch_all(
+        f"SELECT {', '.join(SURVEY_FIELDS)}, summary FROM survey_responses WHERE user_id = :user_id",
+        {"user_id": user_id},
+    )
+    return rows[0] if rows else None
@@ -0,0 +1,234 @@
+"""Write-behind persistence of chat messages.
+
+The chat endpoints hand each message to :class:`MessageWriter` and answer
+straight away; a background task writes what has queued up in one
+transaction when ``batch_size`` messages are waiting or ``flush_interval``
+seconds have passed. A batch is one multi-row insert plus one
+``chat_sessions.updated_at`` bump per session in it, on a single pooled
+connection.
+
+Ids and timestamps are assigned when a message is queued, so callers can
+return them at once and a question always sorts before its answer.
+Inserts skip ids that already exist, which makes replaying a batch safe,
+and only land in sessions owned by the message's user.
+
+If the database is unreachable the batch stays queued and is retried with
+backoff. A batch the database rejects is retried one row at a time and the
+offending rows are dropped. On shutdown everything queued is flushed; what
+cannot be written is saved to ``spill_path`` and replayed on the next start.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+INSERT_MESSAGE = (
+    "INSERT INTO messages (id, session_id, content, is_user, file_id, created_at)"
+    " SELECT :id, :session_id, :content, :is_user, :file_id, :created_at"
+    " WHERE EXISTS (SELECT 1 FROM chat_sessions WHERE id = :session_id AND user_id = :user_id)"
+    " ON CONFLICT (id) DO NOTHING"
+)
+TOUCH_SESSION = (
+    "UPDATE chat_sessions SET updated_at = :updated_at"
+    " WHERE id = :session_id AND user_id = :user_id AND updated_at < :updated_at"
+)
+
+# The database is down or the connection dropped: keep the batch and retry.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, OSError)
+
+
+@dataclass
+class PendingMessage:
+    id: str
+    session_id: str
+    user_id: str
+    content: str
+    is_user: bool
+    created_at: datetime
+    file_id: str | None = None
+
+
+class MessageWriter:
+    """Buffers messages and writes them in batches (see the module docstring).
+
+    ``database`` is called for the :class:`~db.Database` at write time, so
+    the engine is still only created once something is written.
+    """
+
+    def __init__(self, database: Callable, batch_size: int = 100, flush_interval: float = 0.2,
+                 spill_path: str | None = None, shutdown_timeout: float = 10.0,
+                 max_backoff: float = 30.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.shutdown_timeout = shutdown_timeout
+        self.max_backoff = max_backoff
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self._pending: list[PendingMessage] = []
+        self._replayed = False
+        self._last_stamp = datetime.min.replace(tzinfo=timezone.utc)
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def pending_for(self, session_id: str) -> list[PendingMessage]:
+        """Messages of ``session_id`` queued but not written yet, oldest first."""
+        return [message for message in self._pending if message.session_id == session_id]
+
+    def add(self, session_id: str, user_id: str, content: str, is_user: bool,
+            file_id: str | None = None, message_id: str | None = None) -> str:
+        """Queue a message and return its id; it is written shortly after.
+
+        ``message_id`` is for callers that announce the id before the
+        content is known, such as a streamed answer.
+        """
+        # Strictly increasing, so messages queued in the same microsecond keep their order.
+        stamp = max(datetime.now(timezone.utc), self._last_stamp + timedelta(microseconds=1))
+        self._last_stamp = stamp
+        message = PendingMessage(message_id or str(uuid.uuid4()), session_id, user_id, content, is_user, stamp, file_id)
+        self._pending.append(message)
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return message.id
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._replay_spill()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        backoff = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+                backoff = self.flush_interval
+            except TRANSIENT_ERRORS:
+                logger.warning("Could not write %d queued messages; retrying in %.1fs",
+                               len(self._pending), backoff, exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+
+    async def flush(self) -> None:
+        """Write everything queued so far, one batch at a time."""
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                dropped = 0
+                try:
+                    await self._write(batch)
+                except TRANSIENT_ERRORS:
+                    self.failures += 1
+                    raise
+                except Exception:
+                    self.failures += 1
+                    logger.error("Message batch rejected; writing its rows one by one", exc_info=True)
+                    dropped = await self._write_rows(batch)
+                del self._pending[:len(batch)]
+                self.written += len(batch) - dropped
+                self.dropped += dropped
+                self.batches += 1
+            if self._replayed:
+                os.remove(self.spill_path)
+                self._replayed = False
+
+    async def _write_rows(self, batch: list[PendingMessage]) -> int:
+        """Write ``batch`` row by row; returns how many rows were rejected."""
+        dropped = 0
+        for message in batch:
+            try:
+                await self._write([message])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception:
+                dropped += 1
+                logger.error("Dropping message %s for session %s", message.id, message.session_id,
+                             exc_info=True)
+        return dropped
+
+    async def _write(self, batch: list[PendingMessage]) -> None:
+        db = self.database()
+        stamp = _sqlite_timestamp if db.dialect == "sqlite" else (lambda value: value)
+        rows = [{**asdict(message), "created_at": stamp(message.created_at)} for message in batch]
+        latest: dict[tuple[str, str], datetime] = {}
+        for message in batch:
+            key = (message.session_id, message.user_id)
+            latest[key] = max(latest.get(key, message.created_at), message.created_at)
+        touches = [
+            {"session_id": session_id, "user_id": user_id, "updated_at": stamp(updated_at)}
+            for (session_id, user_id), updated_at in latest.items()
+        ]
+        await db.execute_all([(INSERT_MESSAGE, rows), (TOUCH_SESSION, touches)])
+
+    async def aclose(self) -> None:
+        """Stop the background task and flush; spill whatever cannot be written."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), self.shutdown_timeout)
+        except Exception:
+            logger.error("Could not flush %d messages on shutdown", len(self._pending), exc_info=True)
+        if self._pending:
+            self._spill()
+
+    def _spill(self) -> None:
+        if not self.spill_path:
+            logger.error("Losing %d unwritten messages: no spill path", len(self._pending))
+            self.dropped += len(self._pending)
+            return
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a") as f:
+            for message in self._pending:
+                f.write(json.dumps({**asdict(message), "created_at": message.created_at.isoformat()}) + "\n")
+        logger.warning("Saved %d unwritten messages to %s", len(self._pending), self.spill_path)
+        self._pending.clear()
+
+    def _replay_spill(self) -> None:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path) as f:
+            spilled = [json.loads(line) for line in f if line.strip()]
+        # The file is removed once they are written; rows written twice are skipped.
+        self._replayed = True
+        self._pending[:0] = [
+            PendingMessage(**{**row, "created_at": datetime.fromisoformat(row["created_at"])}) for row in spilled
+        ]
+        if spilled:
+            logger.info("Replaying %d messages saved at the last shutdown", len(spilled))
+            self._full.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+def _sqlite_timestamp(value: datetime) -> str:
+    # Same text format as the schema's defaults, so rows sort together.
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
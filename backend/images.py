@@ -0,0 +1,173 @@
+"""Ingestion pipeline for images students attach to a question.
+
+1. The upload is read in chunks and rejected as soon as it passes the size
+   cap, so an oversized photo is never held in memory.
+2. The type is taken from the magic bytes, not the client's Content-Type.
+3. Photos are downscaled to what the model actually looks at and
+   re-encoded. This runs in a process pool to keep the event loop free.
+4. Results are keyed by the SHA-256 of the original bytes, so the same
+   worksheet photo is only processed once. The hash also matches earlier
+   uploads in ``uploaded_files``.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from llm import ImagePart
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then sent as uploaded.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+# Formats Gemini accepts. Pillow cannot decode HEIC, so those pass through untouched.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"heim", b"heis", b"mif1", b"msf1"}
+
+
+class ImageRejected(ValueError):
+    """The upload is not an acceptable image; the message is the 400 detail."""
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    sha256: str
+    width: int | None
+    height: int | None
+    original_bytes: int
+
+    def as_part(self) -> ImagePart:
+        return ImagePart(data=self.data, mime_type=self.mime_type, sha256=self.sha256)
+
+    def describe(self) -> dict:
+        return {
+            "sha256": self.sha256,
+            "mime_type": self.mime_type,
+            "width": self.width,
+            "height": self.height,
+            "bytes": len(self.data),
+            "original_bytes": self.original_bytes,
+        }
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+        return "image/heic"
+    return None
+
+
+async def read_capped(upload, max_bytes: int, chunk_size: int = READ_CHUNK_BYTES) -> bytes:
+    """Read an UploadFile, failing as soon as it grows past ``max_bytes``."""
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise ImageRejected("File too large")
+
+
+def downscale(data: bytes, mime_type: str, max_side: int, quality: int) -> tuple[bytes, str, int, int]:
+    """Fit the image within ``max_side`` pixels and re-encode it.
+
+    Runs in a worker process. Photos become JPEG; PNGs (diagrams, screenshots
+    with text) stay PNG so thin lines survive.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        if mime_type == "image/png":
+            image.save(out, format="PNG", optimize=True)
+        else:
+            mime_type = "image/jpeg"
+            image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue(), mime_type, image.width, image.height
+
+
+class ImagePipeline:
+    """Turns an upload into a :class:`PreparedImage`.
+
+    ``workers`` is the size of the process pool; 0 runs the resize in a
+    thread instead (handy for tests and single-core boxes).
+    """
+
+    def __init__(self, max_bytes: int = MAX_IMAGE_BYTES, max_side: int = 1536, quality: int = 85,
+                 workers: int = 2, cache_size: int = 256):
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = workers
+        self.cache_size = cache_size
+        self._pool: ProcessPoolExecutor | None = None
+        self._prepared: OrderedDict[str, PreparedImage] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def prepare(self, upload) -> PreparedImage:
+        data = await read_capped(upload, self.max_bytes)
+        mime_type = sniff_image_type(data[:16])
+        if mime_type is None:
+            raise ImageRejected("Invalid file type")
+        digest = hashlib.sha256(data).hexdigest()
+        prepared = self._prepared.get(digest)
+        if prepared is not None:
+            self._prepared.move_to_end(digest)
+            self.hits += 1
+            return prepared
+        self.misses += 1
+        prepared = await self._process(data, mime_type, digest)
+        self._prepared[digest] = prepared
+        if len(self._prepared) > self.cache_size:
+            self._prepared.popitem(last=False)
+        return prepared
+
+    async def _process(self, data: bytes, mime_type: str, digest: str) -> PreparedImage:
+        if Image is None or mime_type in ("image/heic", "image/gif"):
+            return PreparedImage(data, mime_type, digest, None, None, len(data))
+        loop = asyncio.get_running_loop()
+        try:
+            resized, resized_type, width, height = await loop.run_in_executor(
+                self._executor(), downscale, data, mime_type, self.max_side, self.quality
+            )
+        except Exception:
+            logger.info("Could not decode uploaded image", exc_info=True)
+            raise ImageRejected("Invalid image") from None
+        if len(resized) >= len(data):
+            # Already small; the original is the better copy.
+            resized, resized_type = data, mime_type
+        return PreparedImage(resized, resized_type, digest, width, height, len(data))
+
+    def _executor(self):
+        if self.workers <= 0:
+            return None  # default thread pool
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,21 @@
+from .brokers import RUN_TASK, CeleryBroker, InMemoryBroker, make_celery, queue_for
+from .models import FAILED, PRIORITIES, QUEUED, RUNNING, SUCCEEDED, Job
+from .runner import JobRunner
+from .store import InMemoryJobStore, RedisJobStore
+
+__all__ = [
+    "FAILED",
+    "PRIORITIES",
+    "QUEUED",
+    "RUNNING",
+    "RUN_TASK",
+    "SUCCEEDED",
+    "CeleryBroker",
+    "InMemoryBroker",
+    "InMemoryJobStore",
+    "Job",
+    "JobRunner",
+    "RedisJobStore",
+    "make_celery",
+    "queue_for",
+]
@@ -0,0 +1,95 @@
+"""Hand queued jobs to whatever runs them.
+
+:class:`CeleryBroker` publishes to one Celery queue per priority on Redis,
+so workers scale separately from the API and can be pointed at the queues
+they should drain. :class:`InMemoryBroker` runs jobs on a few asyncio tasks
+inside the API process; it stands in for Celery in tests and for
+deployments without a worker fleet.
+"""
+import asyncio
+import itertools
+import logging
+from typing import Awaitable, Callable
+
+from .models import PRIORITIES, Job
+
+logger = logging.getLogger(__name__)
+
+RUN_TASK = "fynq.jobs.run"
+
+
+def queue_for(priority: str) -> str:
+    return f"fynq.jobs.{priority}"
+
+
+def make_celery(broker_url: str):
+    """Celery app shared by :class:`CeleryBroker` and ``worker.py``."""
+    from celery import Celery
+
+    app = Celery("fynq", broker=broker_url)
+    app.conf.update(
+        task_default_queue=queue_for("normal"),
+        task_ignore_result=True,  # results go to the job store
+        # A worker killed mid-solve gives the job back instead of losing it.
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        # Long solves: don't let one worker reserve a queue's worth of them.
+        worker_prefetch_multiplier=1,
+        # A worker started with -Q high,normal,low checks them in that order.
+        broker_transport_options={"queue_order_strategy": "priority"},
+    )
+    return app
+
+
+class CeleryBroker:
+    def __init__(self, celery_app):
+        self.app = celery_app
+
+    async def submit(self, job: Job) -> None:
+        # send_task talks to Redis synchronously.
+        await asyncio.to_thread(
+            self.app.send_task, RUN_TASK, args=[job.id], queue=queue_for(job.priority)
+        )
+
+    async def aclose(self) -> None:
+        pass
+
+
+class InMemoryBroker:
+    """Priority queue drained by ``workers`` tasks calling ``run(job_id)``."""
+
+    def __init__(self, run: Callable[[str], Awaitable[None]], workers: int = 2):
+        self.run = run
+        self.workers = workers
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._order = itertools.count()
+
+    async def submit(self, job: Job) -> None:
+        if self._queue is None:
+            # Created lazily so it binds to the running loop.
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._queue.put_nowait((PRIORITIES.index(job.priority), next(self._order), job.id))
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                await self.run(job_id)
+            except Exception:
+                logger.exception("Job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every submitted job has run."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
@@ -0,0 +1,52 @@
+"""The job record shared by the API, the store and the workers."""
+from dataclasses import asdict, dataclass, field
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Highest first. Workers drain "high" before touching "low".
+PRIORITIES = ("high", "normal", "low")
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    prompt: str
+    priority: str = "normal"
+    cacheable: bool = True
+    # Prepared images as {"key", "mime_type", "sha256"}; the bytes live in storage.
+    images: list[dict] = field(default_factory=list)
+    # The chat session the answer is saved to, and the id its question was saved under.
+    chat_id: str | None = None
+    question_id: str | None = None
+    status: str = QUEUED
+    result: dict | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    finished_at: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        return cls(**data)
+
+    def public(self) -> dict:
+        """What the owner sees when polling."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
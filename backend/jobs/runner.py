@@ -0,0 +1,55 @@
+"""Executes one job: read it from the store, ask the model, write back.
+
+When the question was saved to a chat session at submit time, the answer
+is queued on ``writer`` (a :class:`~db.MessageWriter`) for the same session
+and its id returned in the result, as the chat endpoints do.
+"""
+import logging
+import time
+
+from llm import ImagePart, LLMClient
+
+from .models import FAILED, RUNNING, SUCCEEDED
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    def __init__(self, llm: LLMClient, store, storage, timeout: float | None = None, clock=time.time,
+                 writer=None):
+        self.llm = llm
+        self.store = store
+        self.storage = storage
+        self.writer = writer
+        self.timeout = timeout
+        self.clock = clock
+
+    async def run(self, job_id: str) -> None:
+        job = await self.store.get(job_id)
+        if job is None or job.done:
+            # Expired, or a redelivery of a job that already finished.
+            return
+        job.status = RUNNING
+        await self.store.put(job)
+        try:
+            images = [
+                ImagePart(data=await self.storage.read(image["key"]), mime_type=image["mime_type"],
+                          sha256=image["sha256"])
+                for image in job.images
+            ]
+            response = await self.llm.generate(
+                job.prompt, timeout=self.timeout, cache=job.cacheable, images=images or None
+            )
+            job.result = {"response": response.text, "model": response.model}
+            if response.usage is not None:
+                job.result["usage"] = response.usage.as_dict()
+            if job.question_id is not None and self.writer is not None:
+                answer_id = self.writer.add(job.chat_id, job.user_id, response.text, False)
+                job.result["message_ids"] = {"user": job.question_id, "bot": answer_id}
+            job.status = SUCCEEDED
+        except Exception as e:
+            logger.warning("Job %s failed", job_id, exc_info=True)
+            job.status = FAILED
+            job.error = str(e)
+        job.finished_at = self.clock()
+        await self.store.put(job)
@@ -0,0 +1,96 @@
+"""Where job state lives between submit, run and poll.
+
+The API and the workers only share the store, so with Celery it has to be
+:class:`RedisJobStore`. :class:`InMemoryJobStore` is for a single process
+running :class:`~jobs.brokers.InMemoryBroker` (tests, local development).
+
+``wait`` lets a poll block until the job finishes, which is how clients
+subscribe without hammering the API.
+"""
+import asyncio
+import json
+import time
+
+from .models import Job
+
+
+class InMemoryJobStore:
+    def __init__(self, ttl: float = 3600.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._jobs: dict[str, tuple[dict, float]] = {}
+        self._finished: dict[str, asyncio.Event] = {}
+
+    async def put(self, job: Job) -> None:
+        now = self.clock()
+        for job_id in [k for k, (_, expires) in self._jobs.items() if expires <= now]:
+            del self._jobs[job_id]
+        # Stored as a dict so later changes to ``job`` need another put.
+        self._jobs[job.id] = (job.to_dict(), now + self.ttl)
+        if job.done and job.id in self._finished:
+            self._finished.pop(job.id).set()
+
+    async def get(self, job_id: str) -> Job | None:
+        entry = self._jobs.get(job_id)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        return Job.from_dict(entry[0])
+
+    async def wait(self, job_id: str, timeout: float) -> Job | None:
+        job = await self.get(job_id)
+        if job is None or job.done or timeout <= 0:
+            return job
+        finished = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await self.get(job_id)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisJobStore:
+    """Jobs as JSON under ``prefix + id``; completion is published on a channel."""
+
+    def __init__(self, url: str, ttl: float = 3600.0, prefix: str = "fynq:job:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def put(self, job: Job) -> None:
+        key = self.prefix + job.id
+        await self.client.set(key, json.dumps(job.to_dict()), ex=int(self.ttl))
+        if job.done:
+            await self.client.publish(key + ":done", job.status)
+
+    async def get(self, job_id: str) -> Job | None:
+        value = await self.client.get(self.prefix + job_id)
+        return Job.from_dict(json.loads(value)) if value else None
+
+    async def wait(self, job_id: str, timeout: float) -> Job | None:
+        job = await self.get(job_id)
+        if job is None or job.done or timeout <= 0:
+            return job
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(self.prefix + job_id + ":done")
+            # It may have finished between the first read and the subscribe.
+            job = await self.get(job_id)
+            deadline = time.monotonic() + timeout
+            while job is not None and not job.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                if message is not None:
+                    job = await self.get(job_id)
+            return job
+        finally:
+            await pubsub.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
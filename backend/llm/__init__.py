@@ -0,0 +1,39 @@
+from .backends import FakeBackend, GeminiBackend, ImagePart, LLMResponse, TokenUsage, UsageMeter, create_backend
+from .cache import RedisTier, ResponseCache, make_key, normalize_prompt
+from .client import ClientDisconnected, DisconnectCheck, LLMClient, LLMError, LLMTimeoutError, Observer, Slot
+from .context import AssembledContext, ContextBuilder, LLMSummarizer, Turn, estimate_tokens
+from .prompts import PromptRegistry, SystemPrompt
+from .routing import CircuitBreaker, RoutingBackend, classify
+from .singleflight import SingleFlight
+
+__all__ = [
+    "AssembledContext",
+    "CircuitBreaker",
+    "ClientDisconnected",
+    "ContextBuilder",
+    "DisconnectCheck",
+    "FakeBackend",
+    "GeminiBackend",
+    "ImagePart",
+    "LLMClient",
+    "LLMError",
+    "LLMSummarizer",
+    "LLMResponse",
+    "LLMTimeoutError",
+    "Observer",
+    "PromptRegistry",
+    "RedisTier",
+    "ResponseCache",
+    "RoutingBackend",
+    "SingleFlight",
+    "Slot",
+    "SystemPrompt",
+    "TokenUsage",
+    "Turn",
+    "UsageMeter",
+    "classify",
+    "create_backend",
+    "estimate_tokens",
+    "make_key",
+    "normalize_prompt",
+]
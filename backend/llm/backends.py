@@ -0,0 +1,300 @@
+"""Model backends used by :class:`llm.client.LLMClient`.
+
+A backend only knows how to turn a prompt into text. Concurrency limits,
+timeouts and cancellation live in the client so every backend gets them for
+free, including the fake one used in tests.
+
+``stream`` yields text chunks and may yield one :class:`TokenUsage` at the
+end, which the client strips out and records.
+"""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from .context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenUsage:
+    input_tokens: int = 0
+    # Part of input_tokens served from the provider's context cache.
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+@dataclass(frozen=True)
+class ImagePart:
+    """An image sent alongside the prompt. ``sha256`` identifies its content."""
+
+    data: bytes
+    mime_type: str
+    sha256: str
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    model: str
+    cached: bool = False
+    usage: TokenUsage | None = None
+
+
+@dataclass
+class UsageMeter:
+    """Running totals of upstream token usage."""
+
+    requests: int = 0
+    totals: TokenUsage = field(default_factory=TokenUsage)
+
+    def add(self, usage: TokenUsage | None) -> None:
+        if usage is None:
+            return
+        self.requests += 1
+        self.totals.input_tokens += usage.input_tokens
+        self.totals.cached_input_tokens += usage.cached_input_tokens
+        self.totals.output_tokens += usage.output_tokens
+
+    def as_dict(self) -> dict:
+        totals = self.totals
+        return {
+            "requests": self.requests,
+            **totals.as_dict(),
+            "cached_input_ratio": totals.cached_input_tokens / totals.input_tokens if totals.input_tokens else 0.0,
+        }
+
+
+def _gemini_usage(response) -> TokenUsage | None:
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return None
+    return TokenUsage(
+        input_tokens=metadata.prompt_token_count,
+        cached_input_tokens=getattr(metadata, "cached_content_token_count", 0),
+        output_tokens=metadata.candidates_token_count,
+    )
+
+
+class GeminiBackend:
+    """Talks to Gemini through the async API of ``google-generativeai``.
+
+    The system prompt is sent as ``system_instruction``. With
+    ``context_cache_ttl`` set and :meth:`start` called, it is uploaded once
+    as cached content and requests reference it instead of resending it;
+    a background task extends the cache before it expires. If the cache
+    cannot be created (too short, unsupported model) requests fall back to
+    the plain ``system_instruction`` model.
+
+    The SDK is imported and configured on first use, not here: building the
+    backend is free, and a server that preloads the app before forking
+    workers opens no gRPC channel in the parent.
+    """
+
+    def __init__(self, api_key: str | None, model_name: str = "gemini-2.5-flash", system_prompt=None,
+                 context_cache_ttl: float = 0):
+        self.api_key = api_key
+        self.name = model_name
+        self.system_prompt = system_prompt
+        self.context_cache_ttl = context_cache_ttl
+        self._genai = None
+        self._base_model = None
+        self._model = None
+        self._cached_content = None
+        self._refresher: asyncio.Task | None = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._configure()
+            self._model = self._base_model
+        return self._model
+
+    @model.setter
+    def model(self, value) -> None:
+        self._model = value
+
+    def _configure(self) -> None:
+        if self._genai is not None:
+            return
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env file")
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+        self._base_model = genai.GenerativeModel(
+            self.name,
+            system_instruction=self.system_prompt.text if self.system_prompt else None,
+        )
+        self._genai = genai
+
+    @staticmethod
+    def _contents(prompt: str, images):
+        if not images:
+            return prompt
+        return [{"mime_type": image.mime_type, "data": image.data} for image in images] + [prompt]
+
+    async def generate(self, prompt: str, images=None) -> LLMResponse:
+        # generate_content_async goes through the grpc aio transport, so the
+        # event loop keeps serving other students while Gemini is thinking.
+        response = await self.model.generate_content_async(self._contents(prompt, images))
+        return LLMResponse(text=response.text, model=self.name, usage=_gemini_usage(response))
+
+    async def stream(self, prompt: str, images=None):
+        response = await self.model.generate_content_async(self._contents(prompt, images), stream=True)
+        last = None
+        async for chunk in response:
+            last = chunk
+            if chunk.text:
+                yield chunk.text
+        # Usage metadata is complete on the final chunk.
+        usage = _gemini_usage(last)
+        if usage is not None:
+            yield usage
+
+    async def start(self) -> None:
+        if not self.api_key:
+            # The rest of the API still works; chat requests fail until it is set.
+            logger.error("GEMINI_API_KEY not found in .env file")
+            return
+        self._configure()
+        if self.context_cache_ttl and self.system_prompt and self._refresher is None:
+            self._refresher = asyncio.create_task(self._keep_context_cache())
+
+    async def aclose(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        if self._cached_content is not None:
+            try:
+                await asyncio.to_thread(self._cached_content.delete)
+            except Exception:
+                logger.warning("Could not delete Gemini context cache", exc_info=True)
+            self._cached_content = None
+            self.model = self._base_model
+
+    async def _keep_context_cache(self) -> None:
+        ttl = timedelta(seconds=self.context_cache_ttl)
+        while True:
+            try:
+                if self._cached_content is None:
+                    self._cached_content = await asyncio.to_thread(
+                        self._genai.caching.CachedContent.create,
+                        model=f"models/{self.name}",
+                        display_name=self.system_prompt.version,
+                        system_instruction=self.system_prompt.text,
+                        ttl=ttl,
+                    )
+                    self.model = self._genai.GenerativeModel.from_cached_content(self._cached_content)
+                    logger.info("Gemini context cache created for %s", self.system_prompt.version)
+                else:
+                    await asyncio.to_thread(self._cached_content.update, ttl=ttl)
+            except Exception:
+                logger.warning("Gemini context cache unavailable; sending system_instruction", exc_info=True)
+                self._cached_content = None
+                self.model = self._base_model
+            # Refresh at half-life so the cache never lapses between refreshes.
+            await asyncio.sleep(self.context_cache_ttl / 2)
+
+
+class FakeBackend:
+    """Local stand-in for Gemini.
+
+    ``reply`` may be a string or a callable taking the prompt. ``latency`` is
+    the simulated upstream round trip in seconds (time to first chunk when
+    streaming); streamed replies are cut into ``chunk_size`` characters sent
+    ``chunk_delay`` seconds apart. Token usage is estimated; with
+    ``context_cached`` the system prompt counts as cached input.
+
+    A fraction ``error_rate`` of calls fail after the latency, as an
+    overloaded upstream would; pass ``seed`` to make the failures repeatable.
+    """
+
+    def __init__(self, reply="This is a fake answer.", latency: float = 0.0, name: str = "fake",
+                 chunk_size: int = 16, chunk_delay: float = 0.0, system_prompt=None,
+                 context_cached: bool = False, error_rate: float = 0.0, seed: int | None = None):
+        self.reply = reply
+        self.latency = latency
+        self.name = name
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.system_prompt = system_prompt
+        self.context_cached = context_cached
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.images_seen = 0
+
+    def _usage(self, prompt: str, text: str) -> TokenUsage:
+        system_tokens = self.system_prompt.tokens if self.system_prompt else 0
+        return TokenUsage(
+            input_tokens=system_tokens + estimate_tokens(prompt),
+            cached_input_tokens=system_tokens if self.context_cached else 0,
+            output_tokens=estimate_tokens(text),
+        )
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            raise RuntimeError("Fake upstream error")
+
+    async def generate(self, prompt: str, images=None) -> LLMResponse:
+        self.calls += 1
+        self.images_seen += len(images or ())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self._maybe_fail()
+            text = self.reply(prompt) if callable(self.reply) else self.reply
+            return LLMResponse(text=text, model=self.name, usage=self._usage(prompt, text))
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, prompt: str, images=None):
+        self.calls += 1
+        self.images_seen += len(images or ())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self._maybe_fail()
+            text = self.reply(prompt) if callable(self.reply) else self.reply
+            for i in range(0, len(text), self.chunk_size):
+                if i and self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                yield text[i:i + self.chunk_size]
+            yield self._usage(prompt, text)
+        finally:
+            self.in_flight -= 1
+
+
+def create_backend(kind: str, api_key: str | None = None, model_name: str = "gemini-2.5-flash",
+                   system_prompt=None, context_cache_ttl: float = 0, fake_options: dict | None = None):
+    """Build a backend from its name (``gemini`` or ``fake``).
+
+    ``fake_options`` are extra :class:`FakeBackend` arguments (latency,
+    chunk cadence, error rate), used to run the whole API without Gemini.
+    """
+    if kind == "fake":
+        return FakeBackend(system_prompt=system_prompt, context_cached=bool(context_cache_ttl),
+                           **(fake_options or {}))
+    if kind == "gemini":
+        return GeminiBackend(api_key, model_name, system_prompt=system_prompt,
+                             context_cache_ttl=context_cache_ttl)
+    raise ValueError(f"Unknown LLM backend: {kind}")
@@ -0,0 +1,144 @@
+"""Response cache for repeated questions.
+
+Keys are built from a normalized prompt plus the model name and system
+prompt version, so "Roots of  x^2 - 6x + 8 = 0" and "roots of x^2-6x+8=0"
+share one entry but a model or persona change never serves stale answers.
+Entries live in an in-process LRU with a TTL; an optional Redis tier lets
+several workers share hits.
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_LATEX_SPACING = re.compile(r"\\[,;:! ]|\\q?quad\b")
+_LATEX_SIZING = re.compile(r"\\(left|right|big|Big|bigg|Bigg)\b")
+_LATEX_COMMAND = re.compile(r"(\\[A-Za-z]+)")
+_SPACE_AROUND_SYMBOL = re.compile(r"\s*([^\w\s])\s*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a question used for cache keys.
+
+    Collapses whitespace, lower-cases everything except LaTeX command names
+    (``\\Delta`` and ``\\delta`` differ), drops LaTeX spacing and sizing
+    commands, ``$$`` vs ``$`` delimiters and spaces around symbols.
+    """
+    text = _LATEX_SPACING.sub(" ", prompt)
+    text = _LATEX_SIZING.sub("", text)
+    text = text.replace("$$", "$")
+    text = "".join(
+        part if part.startswith("\\") else part.lower()
+        for part in _LATEX_COMMAND.split(text)
+    )
+    text = _SPACE_AROUND_SYMBOL.sub(r"\1", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_key(prompt: str, model: str, prompt_version: str = "", normalize: bool = True) -> str:
+    text = normalize_prompt(prompt) if normalize else prompt
+    raw = "\x1f".join((model, prompt_version, text))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class RedisTier:
+    """Shared second-level cache. Failures are logged and treated as misses."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "fynq:llm:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> str | None:
+        try:
+            value = await self.client.get(self.prefix + key)
+        except Exception:
+            logger.warning("Redis cache read failed", exc_info=True)
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str) -> None:
+        try:
+            await self.client.set(self.prefix + key, value, ex=int(self.ttl))
+        except Exception:
+            logger.warning("Redis cache write failed", exc_info=True)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self.client.delete(self.prefix + key)
+        except Exception:
+            logger.warning("Redis cache delete failed", exc_info=True)
+
+
+class ResponseCache:
+    """LRU + TTL cache of model answers with an optional shared tier.
+
+    Runs on the event loop only, so no locking is needed. Set
+    ``normalize=False`` to key on the exact prompt text.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400.0, shared=None,
+                 normalize: bool = True, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.normalize = normalize
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, prompt: str, model: str, prompt_version: str = "") -> str:
+        return make_key(prompt, model, prompt_version, self.normalize)
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        if self.shared is not None:
+            value = await self.shared.get(key)
+            if value is not None:
+                self._store_local(key, value)
+                self.shared_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self._store_local(key, value)
+        if self.shared is not None:
+            await self.shared.set(key, value)
+
+    def _store_local(self, key: str, value: str) -> None:
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
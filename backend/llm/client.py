@@ -0,0 +1,229 @@
+"""Async, bounded-concurrency front door to the model backend."""
+import asyncio
+import time
+from contextlib import AbstractContextManager, aclosing, nullcontext
+from typing import AsyncIterator, Awaitable, Callable
+
+from .backends import ImagePart, LLMResponse, TokenUsage, UsageMeter
+from .cache import make_key
+from .singleflight import SingleFlight
+
+DisconnectCheck = Callable[[], Awaitable[bool]]
+# Called with ("queue_wait" | "first_token" | "total", seconds) per upstream call.
+Observer = Callable[[str, float], None]
+# Waits for and returns a held slot (released on exit), e.g. a fair-queue ticket.
+Slot = Callable[[], Awaitable[AbstractContextManager]]
+
+
+class LLMError(Exception):
+    """Base class for errors raised by :class:`LLMClient`."""
+
+
+class LLMTimeoutError(LLMError):
+    """The model did not answer within the request timeout."""
+
+
+class ClientDisconnected(LLMError):
+    """The HTTP client went away, so the upstream call was cancelled."""
+
+
+class LLMClient:
+    """Runs backend calls without blocking the event loop.
+
+    At most ``max_concurrency`` upstream calls run at once; the rest wait on a
+    semaphore. The wait counts toward ``timeout``, so a saturated worker fails
+    fast instead of piling up requests. When ``is_disconnected`` is given it is
+    polled every ``poll_interval`` seconds and the upstream call is cancelled
+    as soon as it reports True.
+
+    With a ``cache`` (see :class:`llm.cache.ResponseCache`) repeated
+    questions are answered without an upstream call; ``prompt_version`` is
+    part of the cache key so changing the system prompt starts fresh.
+
+    With ``coalesce`` on, identical prompts that are in flight at the same
+    time share one upstream call (see :class:`llm.singleflight.SingleFlight`).
+
+    ``slot``, when given to :meth:`generate` or :meth:`stream`, is taken
+    only by a call that actually goes upstream, just before it does; cache
+    hits and callers that join an identical call in flight never wait for
+    one.
+
+    ``observe`` is told how long each upstream call waited for a slot, took
+    to its first token and took in total; ``in_flight`` counts calls
+    holding a slot.
+    """
+
+    def __init__(self, backend, max_concurrency: int = 16, timeout: float = 60.0,
+                 poll_interval: float = 0.5, cache=None, prompt_version: str = "",
+                 coalesce: bool = True, observe: Observer | None = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.cache = cache
+        self.prompt_version = prompt_version
+        self.flights = SingleFlight() if coalesce else None
+        self.usage = UsageMeter()
+        self.observe = observe
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.name
+
+    async def start(self) -> None:
+        """Start backend housekeeping such as context cache refresh."""
+        if hasattr(self.backend, "start"):
+            await self.backend.start()
+
+    async def aclose(self) -> None:
+        if hasattr(self.backend, "aclose"):
+            await self.backend.aclose()
+
+    async def generate(self, prompt: str, *, timeout: float | None = None,
+                       is_disconnected: DisconnectCheck | None = None,
+                       cache: bool = True, images: list[ImagePart] | None = None,
+                       slot: Slot | None = None) -> LLMResponse:
+        """Answer ``prompt``; pass ``cache=False`` for one-off prompts such as
+        ones carrying conversation history."""
+        key = self._key(prompt, images)
+        use_cache = cache and self.cache is not None
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return LLMResponse(text=cached, model=self.model_name, cached=True)
+        if self.flights is not None:
+            call = self.flights.do(key, lambda: self._fetch(prompt, images, key, use_cache, slot))
+        else:
+            call = self._fetch(prompt, images, key, use_cache, slot)
+        return await self._run(call, timeout, is_disconnected)
+
+    async def stream(self, prompt: str, *, timeout: float | None = None,
+                     cache: bool = True, images: list[ImagePart] | None = None,
+                     slot: Slot | None = None) -> AsyncIterator[str]:
+        """Yield the answer chunk by chunk as the backend produces it.
+
+        Here ``timeout`` bounds the wait for a concurrency slot and for each
+        chunk, not the whole answer, so long explanations are not cut off
+        while they are still making progress. Closing the iterator cancels
+        the upstream call and frees the slot once no other identical stream
+        is following it.
+        """
+        key = self._key(prompt, images)
+        use_cache = cache and self.cache is not None
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        timeout = self.timeout if timeout is None else timeout
+        if self.flights is not None:
+            chunks = self.flights.stream(
+                key, lambda: self._stream_upstream(prompt, images, key, timeout, use_cache, slot)
+            )
+        else:
+            chunks = self._stream_upstream(prompt, images, key, timeout, use_cache, slot)
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+
+    def _key(self, prompt: str, images: list[ImagePart] | None = None) -> str:
+        # Images are keyed by content hash, so a re-sent photo hits the cache.
+        if images:
+            prompt = "\n".join([prompt] + [f"[image:{image.sha256}]" for image in images])
+        if self.cache is not None:
+            return self.cache.key(prompt, self.model_name, self.prompt_version)
+        return make_key(prompt, self.model_name, self.prompt_version)
+
+    async def _fetch(self, prompt: str, images, key: str, use_cache: bool, slot: Slot | None) -> LLMResponse:
+        queued = time.perf_counter()
+        with await slot() if slot is not None else nullcontext():
+            response = await self._guarded(prompt, images, queued)
+        self.usage.add(response.usage)
+        if use_cache and response.text:
+            await self.cache.set(key, response.text)
+        return response
+
+    def _observe(self, phase: str, since: float) -> float:
+        now = time.perf_counter()
+        if self.observe is not None:
+            self.observe(phase, now - since)
+        return now
+
+    async def _stream_upstream(self, prompt: str, images, key: str, timeout: float,
+                               use_cache: bool, slot: Slot | None) -> AsyncIterator[str]:
+        queued = time.perf_counter()
+        with await slot() if slot is not None else nullcontext():
+            async with aclosing(self._stream_slotted(prompt, images, key, timeout, use_cache, queued)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
+    async def _stream_slotted(self, prompt: str, images, key: str, timeout: float,
+                              use_cache: bool, queued: float) -> AsyncIterator[str]:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"No model capacity within {timeout:g}s") from None
+        started = self._observe("queue_wait", queued)
+        self.in_flight += 1
+        chunks = self.backend.stream(prompt, images=images)
+        parts = []
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(f"Model stalled for more than {timeout:g}s") from None
+                if isinstance(chunk, TokenUsage):
+                    self.usage.add(chunk)
+                    continue
+                if not parts:
+                    self._observe("first_token", started)
+                parts.append(chunk)
+                yield chunk
+            self._observe("total", started)
+        finally:
+            await chunks.aclose()
+            self.in_flight -= 1
+            self._semaphore.release()
+        # Only complete answers are cached; an abandoned stream never gets here.
+        if use_cache and parts:
+            await self.cache.set(key, "".join(parts))
+
+    async def _guarded(self, prompt: str, images, queued: float) -> LLMResponse:
+        async with self._semaphore:
+            started = self._observe("queue_wait", queued)
+            self.in_flight += 1
+            try:
+                response = await self.backend.generate(prompt, images=images)
+            finally:
+                self.in_flight -= 1
+            # Without streaming the first token arrives with the last.
+            self._observe("first_token", started)
+            self._observe("total", started)
+            return response
+
+    async def _run(self, coro, timeout, is_disconnected):
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        task = asyncio.ensure_future(coro)
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"Model did not respond within {timeout:g}s")
+                wait = remaining if is_disconnected is None else min(remaining, self.poll_interval)
+                done, _ = await asyncio.wait({task}, timeout=wait)
+                if done:
+                    return task.result()
+                if is_disconnected is not None and await is_disconnected():
+                    raise ClientDisconnected("Client disconnected before the answer was ready")
+        finally:
+            if not task.done():
+                task.cancel()
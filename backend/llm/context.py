@@ -0,0 +1,264 @@
+"""Token-budgeted conversation context with a rolling summary.
+
+Each request sends the last few turns of the session verbatim plus a summary
+of everything older, trimmed to a token budget, so prompt size stays bounded
+however long a tutoring session runs. Per-session state is cached in memory,
+keyed by user and session, so a student who sends someone else's ``chat_id``
+neither reads nor extends that conversation. The summary is refreshed by a
+background task whenever turns fall out of the recent window, never on the
+request path.
+
+With several API workers a session's turns may be answered by different
+processes, so a cached session is checked against the database before use:
+if its latest message is one this process has not seen, the session is
+reloaded (keeping the summary of turns already folded into it). A cached
+session with turns whose latest message cannot be found is reloaded too.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "[Summary of the earlier conversation]"
+RECENT_HEADER = "[Recent conversation]"
+QUESTION_HEADER = "[Current question]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English and LaTeX)."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    is_user: bool
+    text: str
+    # The message id, when known; used to tell whether a cached session is current.
+    id: str | None = field(default=None, compare=False)
+
+    def render(self) -> str:
+        return f"{'Student' if self.is_user else 'fynqAI'}: {self.text}"
+
+
+@dataclass
+class AssembledContext:
+    prompt: str
+    input_tokens: int
+    has_history: bool
+
+
+@dataclass
+class _SessionState:
+    recent: list[Turn]
+    summary: str = ""
+    # Turns that left the recent window and are not in the summary yet.
+    pending: list[Turn] = field(default_factory=list)
+    # Rendered lines and their token counts, rebuilt only when turns change.
+    lines: list[tuple[str, int]] = field(default_factory=list)
+    task: asyncio.Task | None = None
+    # Ids of every message this process knows is in the session, and of those in the summary.
+    seen: set[str] = field(default_factory=set)
+    summarized: set[str] = field(default_factory=set)
+
+    def refresh_lines(self):
+        self.lines = [(line, estimate_tokens(line)) for line in map(Turn.render, self.recent)]
+
+
+LoadTurns = Callable[[str, str, int], Awaitable[list[Turn]]]
+LatestId = Callable[[str, str], Awaitable[str | None]]
+Summarize = Callable[[str, list[Turn]], Awaitable[str]]
+
+
+class LLMSummarizer:
+    """Folds old turns into the running summary with a model call."""
+
+    def __init__(self, client, max_words: int = 200):
+        self.client = client
+        self.max_words = max_words
+
+    async def __call__(self, summary: str, turns: list[Turn]) -> str:
+        transcript = "\n".join(turn.render() for turn in turns)
+        prompt = (
+            f"Update the running summary of a JEE tutoring session in at most {self.max_words} words. "
+            "Keep the topics covered, the student's mistakes and doubts, and any results they will need later. "
+            "Reply with the summary only.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+        )
+        response = await self.client.generate(prompt, cache=False)
+        return response.text.strip()
+
+
+class ContextBuilder:
+    """Assembles the prompt for a chat turn within ``token_budget`` tokens.
+
+    ``load_turns(session_id, user_id, limit)`` returns the latest ``limit``
+    messages of a session, oldest first; it is only called when a session is
+    not cached yet or is out of date. ``summarize(summary, turns)`` returns
+    the new summary. ``latest_id(session_id, user_id)``, if given, returns
+    the id of the session's newest stored message; without it cached
+    sessions are trusted as they are.
+    """
+
+    def __init__(self, load_turns: LoadTurns, summarize: Summarize, token_budget: int = 6000,
+                 recent_messages: int = 12, summary_backlog: int = 40, summary_tokens: int = 400,
+                 max_sessions: int = 1000, latest_id: LatestId | None = None):
+        self.load_turns = load_turns
+        self.summarize = summarize
+        self.latest_id = latest_id
+        self.reloads = 0
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.summary_backlog = summary_backlog
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[tuple[str, str], _SessionState] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def build(self, session_id: str, user_id: str, question: str,
+                    reserved_tokens: int = 0) -> AssembledContext:
+        """Prompt for ``question`` in ``session_id``.
+
+        ``reserved_tokens`` is what the caller adds on top, e.g. the system
+        prompt. If the session cannot be loaded the question is sent alone.
+        """
+        key = (user_id, session_id)
+        state = self._sessions.get(key)
+        if state is None or not await self._is_current(state, session_id, user_id):
+            try:
+                state = await self._load(session_id, user_id, question, previous=state)
+            except Exception:
+                logger.warning("Could not load context for session %s", session_id, exc_info=True)
+                return AssembledContext(question, estimate_tokens(question), False)
+        else:
+            self._sessions.move_to_end(key)
+
+        question_block = f"{QUESTION_HEADER}\n{question}"
+        remaining = self.token_budget - reserved_tokens - estimate_tokens(question_block)
+        parts = []
+
+        summary = state.summary
+        if summary and remaining > 0:
+            summary = _truncate(summary, min(self.summary_tokens, remaining))
+            parts.append(f"{SUMMARY_HEADER}\n{summary}")
+            remaining -= estimate_tokens(parts[-1])
+
+        recent = []
+        for line, tokens in reversed(state.lines):
+            if tokens > remaining:
+                break
+            recent.append(line)
+            remaining -= tokens
+        if recent:
+            parts.append(RECENT_HEADER + "\n" + "\n".join(reversed(recent)))
+
+        if not parts:
+            return AssembledContext(question, estimate_tokens(question), False)
+        prompt = "\n\n".join(parts + [question_block])
+        return AssembledContext(prompt, self.token_budget - remaining - reserved_tokens, True)
+
+    def record(self, session_id: str, user_id: str, question: str, answer: str,
+               message_ids: tuple[str | None, str | None] = (None, None)) -> None:
+        """Append a finished exchange to a cached session.
+
+        ``message_ids`` are the ids the exchange is stored under, so that
+        seeing them in the database does not count as someone else's turn.
+        """
+        state = self._sessions.get((user_id, session_id))
+        if state is None:
+            return
+        state.recent += [Turn(True, question, message_ids[0]), Turn(False, answer, message_ids[1])]
+        state.seen.update(i for i in message_ids if i is not None)
+        overflow = len(state.recent) - self.recent_messages
+        if overflow > 0:
+            state.pending += state.recent[:overflow]
+            del state.recent[:overflow]
+            self._schedule(state)
+        state.refresh_lines()
+
+    async def recording(self, session_id: str, user_id: str, question: str, chunks: AsyncIterator[str],
+                        message_ids: tuple[str | None, str | None] = (None, None)) -> AsyncIterator[str]:
+        """Pass a streamed answer through and record it once complete."""
+        parts = []
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        self.record(session_id, user_id, question, "".join(parts), message_ids)
+
+    def forget(self, session_id: str, user_id: str) -> None:
+        self._sessions.pop((user_id, session_id), None)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _is_current(self, state: _SessionState, session_id: str, user_id: str) -> bool:
+        if self.latest_id is None:
+            return True
+        try:
+            latest = await self.latest_id(session_id, user_id)
+        except Exception:
+            logger.warning("Could not check context for session %s", session_id, exc_info=True)
+            return True
+        if latest is None:
+            # Nothing stored yet is only plausible for a session we know to be empty.
+            return not state.recent and not state.pending
+        # Our own turns may still be on their way to the database, so only an
+        # unknown id means another process answered in this session.
+        return latest in state.seen
+
+    async def _load(self, session_id, user_id, question, previous: _SessionState | None = None) -> _SessionState:
+        turns = await self.load_turns(session_id, user_id, self.recent_messages + self.summary_backlog)
+        # The frontend stores the student's message before asking for the answer.
+        if turns and turns[-1].is_user and turns[-1].text == question:
+            turns = turns[:-1]
+        split = max(0, len(turns) - self.recent_messages)
+        state = _SessionState(recent=turns[split:], pending=turns[:split])
+        state.seen = {turn.id for turn in turns if turn.id is not None}
+        if previous is not None:
+            # Reloaded: keep the summary and don't fold the same turns into it twice.
+            self.reloads += 1
+            if previous.task is not None:
+                previous.task.cancel()
+            state.summary = previous.summary
+            state.summarized = previous.summarized
+            state.pending = [turn for turn in state.pending if turn.id not in previous.summarized]
+        state.refresh_lines()
+        if state.pending:
+            self._schedule(state)
+        self._sessions[(user_id, session_id)] = state
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            if evicted.task is not None:
+                evicted.task.cancel()
+        return state
+
+    def _schedule(self, state: _SessionState) -> None:
+        # Keep at most one summarizer per session; it drains whatever piles up.
+        if len(state.pending) > self.summary_backlog:
+            del state.pending[:-self.summary_backlog]
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._summarize_pending(state))
+            self._tasks.add(state.task)
+            state.task.add_done_callback(self._tasks.discard)
+
+    async def _summarize_pending(self, state: _SessionState) -> None:
+        while state.pending:
+            batch, state.pending = state.pending, []
+            try:
+                state.summary = await self.summarize(state.summary, batch)
+                state.summarized.update(turn.id for turn in batch if turn.id is not None)
+            except Exception:
+                state.pending = batch + state.pending
+                logger.warning("Summary refresh failed; will retry on the next turn", exc_info=True)
+                return
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max(0, (max_tokens - 1) * 4)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
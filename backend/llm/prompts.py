@@ -0,0 +1,43 @@
+"""System prompts, loaded and versioned once at startup.
+
+The version is a hash of the prompt text. It goes into the response cache
+key, so editing ``prompt.txt`` never serves answers produced under the old
+persona.
+"""
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from .context import estimate_tokens
+
+
+@dataclass(frozen=True)
+class SystemPrompt:
+    name: str
+    text: str
+    version: str
+    tokens: int
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._prompts: dict[str, SystemPrompt] = {}
+
+    def register(self, name: str, path: str | Path) -> SystemPrompt:
+        text = Path(path).read_text(encoding="utf-8").strip()
+        return self.add(name, text)
+
+    def add(self, name: str, text: str) -> SystemPrompt:
+        digest = hashlib.sha256(text.encode()).hexdigest()[:12]
+        prompt = SystemPrompt(name=name, text=text, version=f"{name}@{digest}", tokens=estimate_tokens(text))
+        self._prompts[name] = prompt
+        return prompt
+
+    def get(self, name: str) -> SystemPrompt:
+        try:
+            return self._prompts[name]
+        except KeyError:
+            raise KeyError(f"Unknown system prompt: {name}") from None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._prompts
@@ -0,0 +1,282 @@
+"""Route each question to a fast or a strong model, hedge slow calls, fail over.
+
+:class:`RoutingBackend` looks like any other backend to :class:`LLMClient`
+and wraps two of them:
+
+- :func:`classify` picks the tier from the question itself: short factual
+  questions go to ``fast``; attachments, long or multi-part questions and
+  derivations go to ``strong``.
+- When a call has run longer than the tier's recent ``hedge_quantile``
+  latency (time to first chunk when streaming), the same call is sent
+  again and whichever answers first wins; the other is cancelled. Hedges
+  are capped at ``hedge_budget`` of all requests so a slow upstream is not
+  hit with double the load.
+- Each tier has a :class:`CircuitBreaker`. A failed call is retried once on
+  the other tier, and while a tier's breaker is open its questions go
+  straight to the other one. A stream can only fail over before its first
+  chunk.
+
+Every decision is counted in ``routes``, ``hedges`` and ``fallbacks`` for
+the metrics endpoint.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from .backends import LLMResponse, TokenUsage
+from .context import QUESTION_HEADER
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+TIERS = (FAST, STRONG)
+
+_HARD_WORDS = re.compile(
+    r"\b(prove|show that|derive|derivation|integrat\w*|differentiat\w*|evaluate|solve|"
+    r"step[- ]by[- ]step|maximi[sz]\w*|minimi[sz]\w*|limit|determinant|matrix|probability|"
+    r"how many ways|find all|equilibrium|trajectory)\b",
+    re.IGNORECASE,
+)
+_MATH = re.compile(r"\\[a-zA-Z]+|[=^∫∑√∞≤≥±]|\d+\s*[-+*/]\s*\d+|\$")
+_PARTS = re.compile(r"^\s*(\(?[a-z0-9ivx]{1,4}[.)]|[-*•])\s+", re.IGNORECASE | re.MULTILINE)
+
+
+def classify(prompt: str, has_images: bool = False, long_words: int = 80) -> tuple[str, str]:
+    """``(tier, reason)`` for a prompt; only its current question is looked at."""
+    if has_images:
+        return STRONG, "image"
+    # Conversation context in front of the question says nothing about its difficulty.
+    question = prompt.rpartition(QUESTION_HEADER)[2]
+    if len(question.split()) > long_words:
+        return STRONG, "long"
+    if len(_PARTS.findall(question)) >= 2:
+        return STRONG, "multi_part"
+    math = len(_MATH.findall(question))
+    if math >= 4 or (math and _HARD_WORDS.search(question)):
+        return STRONG, "math"
+    if _HARD_WORDS.search(question) and len(question.split()) > 12:
+        return STRONG, "reasoning"
+    return FAST, "simple"
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` errors in a row; lets one probe through every
+    ``reset_after`` seconds while open and closes when a call succeeds."""
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0, clock=time.monotonic):
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened = 0
+        self._open_since: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._open_since is not None
+
+    def allow(self) -> bool:
+        if self._open_since is None:
+            return True
+        now = self.clock()
+        if now - self._open_since < self.reset_after:
+            return False
+        # One probe per period; a probe that never reports back just waits out another.
+        self._open_since = now
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self._open_since = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self._open_since is not None or self.failures >= self.threshold:
+            if self._open_since is None:
+                self.opened += 1
+                logger.warning("Model circuit opened after %d failures", self.failures)
+            self._open_since = self.clock()
+
+
+class LatencyWindow:
+    """The last ``size`` latencies of a tier and a quantile over them."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RoutingBackend:
+    """Two backends behind one interface (see the module docstring).
+
+    ``hedge_quantile=0`` turns hedging off.
+    """
+
+    def __init__(self, fast, strong, hedge_quantile: float = 0.95, hedge_budget: float = 0.1,
+                 breaker_failures: int = 5, breaker_reset: float = 30.0, classifier=classify,
+                 clock=time.monotonic):
+        self.backends = {FAST: fast, STRONG: strong}
+        self.name = f"{fast.name}|{strong.name}"
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.classifier = classifier
+        self.breakers = {tier: CircuitBreaker(breaker_failures, breaker_reset, clock) for tier in TIERS}
+        self._latency = {(tier, mode): LatencyWindow() for tier in TIERS for mode in ("generate", "stream")}
+        self.requests = 0
+        self.routes: dict[tuple[str, str], int] = {}
+        self.hedges = {"fired": 0, "won": 0}
+        self.fallbacks = 0
+
+    @staticmethod
+    def _other(tier: str) -> str:
+        return STRONG if tier == FAST else FAST
+
+    def route(self, prompt: str, images=None) -> str:
+        self.requests += 1
+        tier, reason = self.classifier(prompt, bool(images))
+        # With both circuits open the question still goes to its own tier.
+        if not self.breakers[tier].allow() and self.breakers[self._other(tier)].allow():
+            tier, reason = self._other(tier), "circuit_open"
+        self.routes[(tier, reason)] = self.routes.get((tier, reason), 0) + 1
+        return tier
+
+    def _hedge_delay(self, tier: str, mode: str) -> float | None:
+        if not self.hedge_quantile or self.hedges["fired"] >= self.hedge_budget * self.requests:
+            return None
+        return self._latency[(tier, mode)].quantile(self.hedge_quantile)
+
+    async def _race(self, tier: str, mode: str, call):
+        """Run ``call()``, and a second copy if the first is slower than usual."""
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
+        try:
+            delay = self._hedge_delay(tier, mode)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._hedge_delay(tier, mode) is not None:
+                self.hedges["fired"] += 1
+                tasks.append(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (t for t in tasks if t in done and not t.cancelled() and t.exception() is None):
+                    if task is not primary:
+                        self.hedges["won"] += 1
+                    self._latency[(tier, mode)].add(time.perf_counter() - start)
+                    for loser in tasks:
+                        if loser is not task:
+                            await _discard(loser)
+                    return task.result()
+            return primary.result()  # every copy failed; report the first
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call(self, tier: str, mode: str, call):
+        breaker = self.breakers[tier]
+        try:
+            result = await self._race(tier, mode, call)
+        except Exception:
+            breaker.failure()
+            raise
+        breaker.success()
+        return result
+
+    async def generate(self, prompt: str, images=None) -> LLMResponse:
+        tier = self.route(prompt, images)
+
+        def call_on(tier):
+            return lambda: self.backends[tier].generate(prompt, images=images)
+
+        try:
+            return await self._call(tier, "generate", call_on(tier))
+        except Exception:
+            other = self._other(tier)
+            if not self.breakers[other].allow():
+                raise
+            logger.warning("%s model failed; retrying on %s", tier, other, exc_info=True)
+            self.fallbacks += 1
+            return await self._call(other, "generate", call_on(other))
+
+    async def stream(self, prompt: str, images=None) -> AsyncIterator[str | TokenUsage]:
+        tier = self.route(prompt, images)
+
+        def open_on(tier):
+            return lambda: _open(self.backends[tier].stream(prompt, images=images))
+
+        try:
+            head, chunks = await self._call(tier, "stream", open_on(tier))
+        except Exception:
+            other = self._other(tier)
+            if not self.breakers[other].allow():
+                raise
+            logger.warning("%s model failed; retrying on %s", tier, other, exc_info=True)
+            self.fallbacks += 1
+            tier = other
+            head, chunks = await self._call(tier, "stream", open_on(tier))
+        async with aclosing(chunks):
+            for chunk in head:
+                yield chunk
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            except Exception:
+                self.breakers[tier].failure()
+                raise
+
+    async def start(self) -> None:
+        for backend in self.backends.values():
+            if hasattr(backend, "start"):
+                await backend.start()
+
+    async def aclose(self) -> None:
+        for backend in self.backends.values():
+            if hasattr(backend, "aclose"):
+                await backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "routes": dict(self.routes),
+            "hedges": dict(self.hedges),
+            "fallbacks": self.fallbacks,
+            "open": {tier: breaker.is_open for tier, breaker in self.breakers.items()},
+        }
+
+
+async def _open(chunks: AsyncIterator) -> tuple[list, AsyncIterator]:
+    """Read up to the first text chunk, so a stream that fails to start raises here."""
+    head = []
+    try:
+        async for chunk in chunks:
+            head.append(chunk)
+            if not isinstance(chunk, TokenUsage):
+                break
+    except BaseException:
+        await chunks.aclose()
+        raise
+    return head, chunks
+
+
+async def _discard(task: asyncio.Task) -> None:
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    elif not task.cancelled() and not task.exception():
+        result = task.result()
+        if isinstance(result, tuple):  # an opened stream that lost the race
+            await result[1].aclose()
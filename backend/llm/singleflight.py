@@ -0,0 +1,133 @@
+"""Coalescing of identical in-flight model calls.
+
+When a teacher projects a problem, dozens of students send the same prompt
+within a second. Only the first request goes upstream; the others attach to
+it. The shared call is cancelled only once every attached request has left.
+"""
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
+
+
+class StreamAbandoned(Exception):
+    """The shared stream was cancelled before it finished."""
+
+
+class _Call:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """One upstream stream fanned out to any number of subscribers.
+
+    Chunks are kept until the stream finishes so late subscribers replay
+    the answer from the start before following it live.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            # Anyone still following must not mistake the cut-off answer for a complete one.
+            self.error = StreamAbandoned("Shared stream was cancelled")
+            raise
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key.
+
+    ``requests`` counts callers and ``upstream_calls`` counts calls that
+    actually ran, so their ratio is the coalescing factor.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _SharedStream] = {}
+        self.requests = 0
+        self.upstream_calls = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        self.requests += 1
+        call = self._calls.get(key)
+        if call is None:
+            self.upstream_calls += 1
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(self._calls, key, call, task))
+        call.waiters += 1
+        try:
+            # shield: one caller giving up must not cancel the others' answer.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Out of the table first, so an identical request starts afresh
+                # instead of joining a call that is being cancelled.
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        self.requests += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            self.upstream_calls += 1
+            shared = _SharedStream(fn())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda task: self._finish(self._streams, key, shared, task))
+        shared.subscribers += 1
+        try:
+            async with aclosing(shared.follow()) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                self._forget(self._streams, key, shared)
+                shared.task.cancel()
+
+    @staticmethod
+    def _forget(table: dict, key: str, entry) -> None:
+        if table.get(key) is entry:
+            del table[key]
+
+    @classmethod
+    def _finish(cls, table: dict, key: str, entry, task: asyncio.Future):
+        cls._forget(table, key, entry)
+        if not task.cancelled():
+            task.exception()  # retrieved by the waiters; silence "never retrieved"
@@ -1,75 +1,893 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-import google.generativeai as genai
+from pydantic import BaseModel, Field
+from typing import Awaitable, Literal, TypeVar
+import logging
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
+from admission import (
+    AdmissionController,
+    FairScheduler,
+    Overloaded,
+    RedisTokenBuckets,
+    TokenBuckets,
+    retry_after_header,
+    tier_from_claims,
+)
+from auth import InvalidToken, JWKSCache, TokenVerifier
+from batch import BatchSolver, default_error, ndjson_stream
+from db import (
+    Database,
+    MessageWriter,
+    find_file_by_hash,
+    get_survey_response,
+    latest_message_id,
+    list_messages,
+    list_sessions,
+    search_history,
+)
+from images import MAX_IMAGE_BYTES, ImagePipeline, ImageRejected
+from jobs import (
+    CeleryBroker,
+    InMemoryBroker,
+    InMemoryJobStore,
+    Job,
+    JobRunner,
+    RedisJobStore,
+    make_celery,
+)
+from llm import (
+    ClientDisconnected,
+    ContextBuilder,
+    LLMClient,
+    LLMSummarizer,
+    LLMTimeoutError,
+    PromptRegistry,
+    RedisTier,
+    ResponseCache,
+    RoutingBackend,
+    Turn,
+    create_backend,
+    estimate_tokens,
+)
+from metrics import REGISTRY, LoopLagMonitor, MetricsMiddleware, metrics_endpoint, observe_llm, stage
+from middleware import BodySizeLimitMiddleware
+from personalization import PersonalizationCache, SurveyListener, personalize
+from storage import LocalStorage, OffsetMismatch, UploadBusy
+from streaming import SSE_HEADERS, sse_error, sse_stream
+from uploads import MAX_UPLOAD_BYTES, UploadNotFound, UploadRejected, UploadService
+
 load_dotenv()
 
-app = FastAPI()
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await loop_lag.start()
+    await llm_client.start()
+    if jwks_cache is not None:
+        await jwks_cache.start()
+    await upload_service.storage.purge_stale(UPLOAD_EXPIRY_SECONDS)
+    if message_writer is not None:
+        await message_writer.start()
+    if survey_listener is not None:
+        await survey_listener.start()
+    yield
+    if survey_listener is not None:
+        await survey_listener.aclose()
+    if message_writer is not None:
+        await message_writer.aclose()
+    await job_broker.aclose()
+    await job_store.aclose()
+    image_pipeline.shutdown()
+    await context_builder.aclose()
+    await llm_client.aclose()
+    if jwks_cache is not None:
+        await jwks_cache.aclose()
+    await loop_lag.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",  # Assuming your frontend runs on this port
     "http://127.0.0.1:5173",
     "http://localhost:8080",  # Add this for your current frontend port
     "http://127.0.0.1:8080",  # Add this for your current frontend port
+    "https://preview--fynqai-spark-tutor-flow.lovable.app",
 ]
 
+# Room for the other form fields and multipart headers around the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_STORAGE_DIR = os.getenv("UPLOAD_STORAGE_DIR", os.path.join(os.path.dirname(__file__), "storage"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))  # resumable uploads
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+UPLOAD_EXPIRY_SECONDS = float(os.getenv("UPLOAD_EXPIRY_SECONDS", "86400"))
+
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    # First matching prefix wins, so the resumable routes come before /files/upload.
+    limits={
+        "/api/v1/chat/image": MAX_IMAGE_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/api/v1/files/uploads": UPLOAD_MAX_BYTES,
+        "/api/v1/files/upload": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    },
+)
+
+# Wraps the limiter, so its rejections still carry CORS headers the browser can read.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_methods=["GET", "POST", "PUT", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "Upload-Offset"],
 )
 
+# Added last so it sits outermost and times the whole request.
+app.add_middleware(MetricsMiddleware)
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Cheaper model for simple questions; "" sends everything to GEMINI_MODEL.
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+# Resend a call that is slower than this quantile of recent ones; 0 disables hedging.
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))  # most hedges per request
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")  # "gemini" or "fake"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))  # 0 disables the cache
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
+SYSTEM_PROMPT_PATH = os.getenv("SYSTEM_PROMPT_PATH", os.path.join(os.path.dirname(__file__), "prompt.txt"))
+# Seconds the system prompt stays in Gemini's context cache; 0 resends it with every request.
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Shape of the fake model when LLM_BACKEND=fake, e.g. for benchmarks/bench_load.py --url.
+FAKE_LLM_OPTIONS = {
+    "latency": float(os.getenv("FAKE_LLM_LATENCY", "0")),
+    "chunk_size": int(os.getenv("FAKE_LLM_CHUNK_SIZE", "16")),
+    "chunk_delay": float(os.getenv("FAKE_LLM_CHUNK_DELAY", "0")),
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+}
+
+prompt_registry = PromptRegistry()
+system_prompt = prompt_registry.register("tutor", SYSTEM_PROMPT_PATH)
+
+response_cache = None
+if RESPONSE_CACHE_SIZE > 0:
+    response_cache = ResponseCache(
+        max_entries=RESPONSE_CACHE_SIZE,
+        ttl=RESPONSE_CACHE_TTL_SECONDS,
+        shared=RedisTier(REDIS_URL, RESPONSE_CACHE_TTL_SECONDS) if REDIS_URL else None,
+    )
+
+def make_backend(model_name: str):
+    return create_backend(
+        LLM_BACKEND,
+        api_key=GEMINI_API_KEY,
+        model_name=model_name,
+        system_prompt=system_prompt,
+        context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+        fake_options=FAKE_LLM_OPTIONS,
+    )
+
+llm_router = None
+if GEMINI_FAST_MODEL:
+    llm_router = RoutingBackend(
+        make_backend(GEMINI_FAST_MODEL),
+        make_backend(GEMINI_MODEL),
+        hedge_quantile=LLM_HEDGE_QUANTILE,
+        hedge_budget=LLM_HEDGE_BUDGET,
+        breaker_failures=LLM_BREAKER_FAILURES,
+        breaker_reset=LLM_BREAKER_RESET_SECONDS,
+    )
+
+llm_client = LLMClient(
+    llm_router or make_backend(GEMINI_MODEL),
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    timeout=LLM_TIMEOUT_SECONDS,
+    cache=response_cache,
+    prompt_version=system_prompt.version,
+    observe=observe_llm,
+)
+
+# Dependency getters are `async def`: FastAPI runs plain `def` dependencies on
+# its thread pool, a thread hop each that every request (and every 429) paid.
+async def get_llm_client() -> LLMClient:
+    return llm_client
+
+# Free tier; Plus and Ultra get TIER_WEIGHTS times as much. 0 disables the limit.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+admission = AdmissionController(
+    buckets=RedisTokenBuckets(REDIS_URL) if REDIS_URL else TokenBuckets(),
+    scheduler=FairScheduler(
+        ADMISSION_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE, max_wait=ADMISSION_MAX_WAIT_SECONDS
+    ),
+    rate=RATE_LIMIT_PER_MINUTE / 60,
+    burst=RATE_LIMIT_BURST,
+)
+
+async def get_admission() -> AdmissionController:
+    return admission
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+_database = None
+
+def get_database() -> Database:
+    # Created on first use so workers that never touch the DB don't pay for it.
+    global _database
+    if _database is None:
+        if not DATABASE_URL:
+            raise HTTPException(status_code=503, detail="Database is not configured")
+        _database = Database(DATABASE_URL, pool_size=DATABASE_POOL_SIZE)
+    return _database
+
+async def get_optional_database() -> Database | None:
+    return get_database() if DATABASE_URL else None
+
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "100"))
+MESSAGE_FLUSH_SECONDS = float(os.getenv("MESSAGE_FLUSH_SECONDS", "0.2"))
+# Messages that could not be written at shutdown wait here for the next start.
+MESSAGE_SPILL_PATH = os.getenv("MESSAGE_SPILL_PATH", os.path.join(UPLOAD_STORAGE_DIR, "unwritten-messages.jsonl"))
+
+message_writer = MessageWriter(
+    get_database,
+    batch_size=MESSAGE_BATCH_SIZE,
+    flush_interval=MESSAGE_FLUSH_SECONDS,
+    spill_path=MESSAGE_SPILL_PATH,
+) if DATABASE_URL else None
+
+async def get_message_writer() -> MessageWriter | None:
+    return message_writer
+
+PERSONALIZATION_CACHE_SIZE = int(os.getenv("PERSONALIZATION_CACHE_SIZE", "10000"))  # 0 disables personalization
+# Edits are pushed by NOTIFY on Postgres; this bounds staleness when one is missed.
+PERSONALIZATION_TTL_SECONDS = float(os.getenv("PERSONALIZATION_TTL_SECONDS", "3600"))
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')
+personalization = PersonalizationCache(
+    lambda user_id: get_survey_response(get_database(), user_id),
+    max_entries=PERSONALIZATION_CACHE_SIZE,
+    ttl=PERSONALIZATION_TTL_SECONDS,
+    shared=RedisTier(REDIS_URL, PERSONALIZATION_TTL_SECONDS, prefix="fynq:profile:") if REDIS_URL else None,
+) if DATABASE_URL and PERSONALIZATION_CACHE_SIZE > 0 else None
+survey_listener = SurveyListener(DATABASE_URL, personalization) if (
+    personalization is not None and DATABASE_URL.startswith("postgres")
+) else None
+
+async def get_personalization() -> PersonalizationCache | None:
+    return personalization
+
+def save_message(writer: MessageWriter | None, session_id: str | None, user_id: str, content: str,
+                 is_user: bool, **kwargs) -> str | None:
+    """Queue a message for the session's history; returns its id, or None when
+    there is no database or ``session_id`` is not a session id."""
+    if writer is None or not session_id:
+        return None
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        return None
+    return writer.add(session_id, user_id, content, is_user, **kwargs)
+
+async def saving_answer(chunks, writer: MessageWriter, session_id: str, user_id: str,
+                        message_id: str):
+    """Pass a streamed answer through and queue it for saving once complete."""
+    parts = []
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    writer.add(session_id, user_id, "".join(parts), False, message_id=message_id)
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))  # 0 resizes in a thread instead
+
+image_pipeline = ImagePipeline(
+    max_bytes=MAX_IMAGE_BYTES,
+    max_side=IMAGE_MAX_SIDE,
+    quality=IMAGE_JPEG_QUALITY,
+    workers=IMAGE_WORKERS,
+)
+
+async def get_image_pipeline() -> ImagePipeline:
+    return image_pipeline
+
+upload_service = UploadService(
+    LocalStorage(UPLOAD_STORAGE_DIR),
+    max_bytes=MAX_UPLOAD_BYTES,
+    max_resumable_bytes=UPLOAD_MAX_BYTES,
+    chunk_bytes=UPLOAD_CHUNK_BYTES,
+)
+
+async def get_upload_service() -> UploadService:
+    return upload_service
+
+# "memory" runs jobs inside this process; "celery" hands them to `celery -A worker worker`.
+JOB_BROKER = os.getenv("JOB_BROKER", "memory")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # in-process workers for the memory broker
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_MAX_WAIT_SECONDS = 30
+
+if JOB_BROKER == "celery" and not REDIS_URL:
+    raise RuntimeError("JOB_BROKER=celery needs REDIS_URL")
+job_store = RedisJobStore(REDIS_URL, ttl=JOB_RESULT_TTL_SECONDS) if REDIS_URL else InMemoryJobStore(ttl=JOB_RESULT_TTL_SECONDS)
+job_runner = JobRunner(llm_client, job_store, upload_service.storage, timeout=JOB_TIMEOUT_SECONDS,
+                       writer=message_writer)
+job_celery = make_celery(REDIS_URL) if JOB_BROKER == "celery" else None
+job_broker = CeleryBroker(job_celery) if job_celery is not None else InMemoryBroker(job_runner.run, workers=JOB_WORKERS)
+
+async def get_job_store():
+    return job_store
+
+async def get_job_broker():
+    return job_broker
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "12"))
+CONTEXT_CACHE_SESSIONS = int(os.getenv("CONTEXT_CACHE_SESSIONS", "1000"))
+
+async def load_recent_turns(session_id: str, user_id: str, limit: int) -> list[Turn]:
+    # Read the queue first: a message flushed meanwhile is then in one of the two.
+    queued = message_writer.pending_for(session_id) if message_writer is not None else []
+    page = await list_messages(get_database(), user_id, session_id, limit=limit)
+    turns = [Turn(m["sender"] == "user", m["content"], m["id"]) for m in page["messages"]]
+    stored = {turn.id for turn in turns}
+    # The last exchange may still be waiting in the write-behind queue.
+    turns += [Turn(m.is_user, m.content, m.id) for m in queued if m.user_id == user_id and m.id not in stored]
+    return turns[-limit:]
+
+async def latest_turn_id(session_id: str, user_id: str) -> str | None:
+    return await latest_message_id(get_database(), user_id, session_id)
+
+context_builder = ContextBuilder(
+    load_recent_turns,
+    LLMSummarizer(llm_client),
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    recent_messages=CONTEXT_RECENT_MESSAGES,
+    max_sessions=CONTEXT_CACHE_SESSIONS,
+    # Another worker may have answered in the session since it was cached.
+    latest_id=latest_turn_id if DATABASE_URL else None,
+)
+
+async def get_context_builder() -> ContextBuilder:
+    return context_builder
 
 class ChatMessage(BaseModel):
     message: str
     chat_id: str | None = None
 
+class JobRequest(ChatMessage):
+    priority: Literal["high", "normal", "low"] = "normal"
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # model calls in flight per batch
+# How long one batch question may wait for the user's rate limit before it fails with a 429.
+BATCH_RATE_WAIT_SECONDS = float(os.getenv("BATCH_RATE_WAIT_SECONDS", "60"))
+
+class BatchRequest(BaseModel):
+    questions: list[str] = Field(min_length=1, max_length=BATCH_MAX_QUESTIONS)
+
+def describe_batch_error(e: Exception) -> dict:
+    if isinstance(e, Overloaded):
+        return {"error": str(e), "status": 429, "retry_after": e.retry_after}
+    if isinstance(e, LLMTimeoutError):
+        return {"error": str(e), "status": 504}
+    return default_error(e)
+
+batch_solver = BatchSolver(BATCH_CONCURRENCY, describe_error=describe_batch_error)
+
+async def get_batch_solver() -> BatchSolver:
+    return batch_solver
+
+class UploadSession(BaseModel):
+    file_name: str
+    file_size: int
+
 security = HTTPBearer()
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    # Dummy verification for now; replace with real JWT verification
-    token = credentials.credentials
-    if not token:
-        raise HTTPException(status_code=403, detail="Not authenticated")
-    # Optionally, decode and validate the JWT here
-    return token
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "3600"))
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "10000"))
+
+jwks_cache = JWKSCache(SUPABASE_JWKS_URL, refresh_interval=JWKS_REFRESH_SECONDS) if SUPABASE_JWKS_URL else None
+token_verifier = TokenVerifier(
+    jwt_secret=SUPABASE_JWT_SECRET,
+    jwks=jwks_cache,
+    audience=SUPABASE_JWT_AUDIENCE,
+    cache_size=VERIFIED_TOKEN_CACHE_SIZE,
+)
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Claims of the caller's Supabase access token."""
+    try:
+        with stage("auth"):
+            return await token_verifier.verify(credentials.credentials)
+    except InvalidToken as e:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Invalid token: {e}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+async def get_current_user_id(claims: dict = Depends(verify_token)) -> str:
+    user_id = claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token: no subject")
+    return user_id
+
+async def get_tier(claims: dict = Depends(verify_token)) -> str:
+    return tier_from_claims(claims)
+
+def too_many_requests(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+
+async def admitted(step: Awaitable[T]) -> T:
+    """Await an admission step, turning a refusal into a fast 429."""
+    try:
+        return await step
+    except Overloaded as e:
+        raise too_many_requests(e)
+
+def model_slot(admission: AdmissionController, user_id: str, tier: str):
+    """The ``slot`` for LLMClient: queue fairly for the model, but only for a
+    call that goes upstream; cache hits and coalesced followers skip it."""
+    return lambda: admission.acquire(user_id, tier)
+
+def describe_stream_error(e: Exception) -> dict:
+    if isinstance(e, Overloaded):
+        return {"detail": str(e), "status": 429, "retry_after": e.retry_after}
+    return sse_error(e)
+
+async def get_profile(
+    user_id: str = Depends(get_current_user_id),
+    cache: PersonalizationCache | None = Depends(get_personalization),
+) -> str:
+    """The caller's compiled survey fragment; empty without one."""
+    return await cache.get(user_id) if cache is not None else ""
+
+async def build_prompt(chat_message: ChatMessage, user_id: str, context: ContextBuilder,
+                       profile: str = "") -> tuple[str, bool]:
+    """Prompt to send upstream and whether its answer may be cached."""
+    if not chat_message.chat_id:
+        return personalize(profile, chat_message.message), True
+    assembled = await context.build(
+        chat_message.chat_id,
+        user_id,
+        chat_message.message,
+        reserved_tokens=system_prompt.tokens + estimate_tokens(profile),
+    )
+    # Answers that depend on earlier turns must not be served to other students.
+    # A profile is part of the prompt, so cached answers are only shared between identical ones.
+    return personalize(profile, assembled.prompt), not assembled.has_history
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token Prometheus must send, if set
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+loop_lag = LoopLagMonitor(METRICS_LOOP_LAG_INTERVAL)
+
+def _cache_lookups() -> dict:
+    stats = response_cache.stats() if response_cache is not None else {}
+    return {(result,): stats.get(result, 0) for result in ("hits", "shared_hits", "misses")}
+
+REGISTRY.collected("fynq_llm_tokens_total", "Upstream tokens by kind.", lambda: {
+    ("input",): llm_client.usage.totals.input_tokens,
+    ("cached_input",): llm_client.usage.totals.cached_input_tokens,
+    ("output",): llm_client.usage.totals.output_tokens,
+}, ("kind",), type="counter")
+REGISTRY.collected("fynq_llm_in_flight", "Upstream calls holding a model slot.", lambda: llm_client.in_flight)
+REGISTRY.collected("fynq_llm_coalesced_total", "Calls that joined an identical in-flight call.", lambda: (
+    llm_client.flights.requests - llm_client.flights.upstream_calls if llm_client.flights else 0
+), type="counter")
+if llm_router is not None:
+    REGISTRY.collected("fynq_llm_routes_total", "Questions routed to each model tier, by reason.",
+                       lambda: dict(llm_router.routes), ("tier", "reason"), type="counter")
+    REGISTRY.collected("fynq_llm_hedges_total", "Backup calls fired for slow answers, and how many won.",
+                       lambda: {(k,): v for k, v in llm_router.hedges.items()}, ("outcome",), type="counter")
+    REGISTRY.collected("fynq_llm_fallbacks_total", "Failed calls retried on the other tier.",
+                       lambda: llm_router.fallbacks, type="counter")
+    REGISTRY.collected("fynq_llm_circuit_open", "1 while a tier's circuit breaker is open.", lambda: {
+        (tier,): int(breaker.is_open) for tier, breaker in llm_router.breakers.items()
+    }, ("tier",))
+if message_writer is not None:
+    REGISTRY.collected("fynq_messages_pending", "Chat messages queued for the database.",
+                       lambda: message_writer.pending)
+    REGISTRY.collected("fynq_messages_written_total", "Chat messages by outcome.", lambda: {
+        ("written",): message_writer.written, ("dropped",): message_writer.dropped,
+    }, ("outcome",), type="counter")
+if personalization is not None:
+    REGISTRY.collected("fynq_personalization_cache_lookups_total", "Survey fragment lookups by result.", lambda: {
+        ("hits",): personalization.hits, ("shared_hits",): personalization.shared_hits,
+        ("misses",): personalization.misses,
+    }, ("result",), type="counter")
+REGISTRY.collected("fynq_batch_questions_total", "Batch questions by outcome.", lambda: {
+    (outcome,): count for outcome, count in batch_solver.stats().items()
+}, ("outcome",), type="counter")
+REGISTRY.collected("fynq_response_cache_lookups_total", "Answer cache lookups by result.",
+                   _cache_lookups, ("result",), type="counter")
+REGISTRY.collected("fynq_token_cache_lookups_total", "Verified-token cache lookups by result.", lambda: {
+    ("hits",): token_verifier.hits, ("misses",): token_verifier.misses,
+}, ("result",), type="counter")
+REGISTRY.collected("fynq_image_cache_lookups_total", "Prepared-image cache lookups by result.", lambda: {
+    ("hits",): image_pipeline.hits, ("misses",): image_pipeline.misses,
+}, ("result",), type="counter")
+REGISTRY.collected("fynq_admission", "Model slots in use and requests queued for one.", lambda: {
+    ("active",): admission.scheduler.active, ("queued",): admission.scheduler.queued,
+}, ("state",))
+REGISTRY.collected("fynq_admission_rejected_total", "Requests refused with a 429.", lambda: {
+    ("rate_limit",): admission.throttled, ("queue",): admission.scheduler.rejected,
+}, ("reason",), type="counter")
+
+app.add_route("/metrics", metrics_endpoint(METRICS_TOKEN), include_in_schema=False)
 
 @app.get("/")
 async def read_root():
     return {"message": "Hello from new backend!"}
 
 @app.post("/api/v1/chat/message")
-async def chat_message(chat_message: ChatMessage, token: str = Depends(verify_token)):
+async def chat_message(
+    chat_message: ChatMessage,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    tier: str = Depends(get_tier),
+    llm: LLMClient = Depends(get_llm_client),
+    context: ContextBuilder = Depends(get_context_builder),
+    profile: str = Depends(get_profile),
+    admission: AdmissionController = Depends(get_admission),
+    writer: MessageWriter | None = Depends(get_message_writer),
+):
+    with stage("admission"):
+        await admitted(admission.check_rate(user_id, tier))
+    with stage("prompt"):
+        prompt, cacheable = await build_prompt(chat_message, user_id, context, profile)
+    question_id = save_message(writer, chat_message.chat_id, user_id, chat_message.message, True)
     try:
-        response = model.generate_content(chat_message.message)
-        return {"response": response.text}
+        with stage("upstream"):
+            response = await llm.generate(prompt, cache=cacheable, is_disconnected=request.is_disconnected,
+                                          slot=model_slot(admission, user_id, tier))
+        answer_id = save_message(writer, chat_message.chat_id, user_id, response.text, False)
+        if chat_message.chat_id:
+            context.record(chat_message.chat_id, user_id, chat_message.message, response.text, (question_id, answer_id))
+        result = {"response": response.text}
+        if response.usage is not None:
+            result["usage"] = response.usage.as_dict()
+        if question_id is not None:
+            result["message_ids"] = {"user": question_id, "bot": answer_id}
+        with stage("serialize"):
+            return JSONResponse(result)
+    except Overloaded as e:
+        raise too_many_requests(e)
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        # Nobody is listening any more; 499 only shows up in access logs.
+        return Response(status_code=499)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/chat/stream")
+async def chat_stream(
+    chat_message: ChatMessage,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    tier: str = Depends(get_tier),
+    llm: LLMClient = Depends(get_llm_client),
+    context: ContextBuilder = Depends(get_context_builder),
+    profile: str = Depends(get_profile),
+    admission: AdmissionController = Depends(get_admission),
+    writer: MessageWriter | None = Depends(get_message_writer),
+):
+    with stage("admission"):
+        await admitted(admission.check_rate(user_id, tier))
+    with stage("prompt"):
+        prompt, cacheable = await build_prompt(chat_message, user_id, context, profile)
+    # A refused model slot arrives as an `error` event with status 429.
+    chunks = llm.stream(prompt, cache=cacheable, slot=model_slot(admission, user_id, tier))
+    done = {"model": llm.model_name}
+    question_id = save_message(writer, chat_message.chat_id, user_id, chat_message.message, True)
+    # The answer is saved when the stream completes, under the id announced in `done`.
+    answer_id = str(uuid.uuid4()) if question_id is not None else None
+    if chat_message.chat_id:
+        chunks = context.recording(chat_message.chat_id, user_id, chat_message.message, chunks, (question_id, answer_id))
+    if question_id is not None:
+        chunks = saving_answer(chunks, writer, chat_message.chat_id, user_id, answer_id)
+        done["message_ids"] = {"user": question_id, "bot": answer_id}
+    events = sse_stream(
+        chunks,
+        done=done,
+        is_disconnected=request.is_disconnected,
+        heartbeat=SSE_HEARTBEAT_SECONDS,
+        describe_error=describe_stream_error,
+    )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/api/v1/chat/batch")
+async def chat_batch(
+    batch: BatchRequest,
+    user_id: str = Depends(get_current_user_id),
+    tier: str = Depends(get_tier),
+    llm: LLMClient = Depends(get_llm_client),
+    profile: str = Depends(get_profile),
+    admission: AdmissionController = Depends(get_admission),
+    solver: BatchSolver = Depends(get_batch_solver),
+):
+    # The first question is paid for here, so an empty bucket is still a plain 429.
+    await admitted(admission.check_rate(user_id, tier))
+    prepaid = 1
+
+    async def solve(question: str) -> dict:
+        nonlocal prepaid
+        if prepaid:
+            prepaid -= 1
+        else:
+            # Every further question takes its own token, waiting for the bucket to refill.
+            await admission.pace(user_id, tier, BATCH_RATE_WAIT_SECONDS)
+        # Each question queues fairly for its own model slot, like a single message.
+        response = await llm.generate(personalize(profile, question), slot=model_slot(admission, user_id, tier))
+        result = {"response": response.text}
+        if response.usage is not None:
+            result["usage"] = response.usage.as_dict()
+        return result
+
+    results = solver.run(batch.questions, solve)
+    # Streamed line by line like SSE, so it needs the same no-buffering headers.
+    return StreamingResponse(ndjson_stream(results), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
 @app.post("/api/v1/chat/image")
 async def chat_image(
+    request: Request,
     image: UploadFile = File(...),
     message: str = Form(...),
     chat_id: str = Form(None),
-    token: str = Depends(verify_token)
+    user_id: str = Depends(get_current_user_id),
+    tier: str = Depends(get_tier),
+    llm: LLMClient = Depends(get_llm_client),
+    context: ContextBuilder = Depends(get_context_builder),
+    profile: str = Depends(get_profile),
+    images: ImagePipeline = Depends(get_image_pipeline),
+    db: Database | None = Depends(get_optional_database),
+    admission: AdmissionController = Depends(get_admission),
+    writer: MessageWriter | None = Depends(get_message_writer),
+):
+    await admitted(admission.check_rate(user_id, tier))
+    try:
+        with stage("image"):
+            prepared = await images.prepare(image)
+    except ImageRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    previous_upload = None
+    if db is not None:
+        try:
+            previous_upload = await find_file_by_hash(db, user_id, prepared.sha256)
+        except Exception:
+            logger.warning("Upload dedupe lookup failed", exc_info=True)
+
+    chat_message = ChatMessage(message=message, chat_id=chat_id)
+    file_id = previous_upload["id"] if previous_upload else None
+    with stage("prompt"):
+        prompt, cacheable = await build_prompt(chat_message, user_id, context, profile)
+    question_id = save_message(writer, chat_id, user_id, message, True, file_id=file_id)
+    try:
+        with stage("upstream"):
+            # The rate was checked up front; a model slot is only taken once the image is ready.
+            response = await llm.generate(
+                prompt,
+                images=[prepared.as_part()],
+                cache=cacheable,
+                is_disconnected=request.is_disconnected,
+                slot=model_slot(admission, user_id, tier),
+            )
+    except Overloaded as e:
+        raise too_many_requests(e)
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    answer_id = save_message(writer, chat_id, user_id, response.text, False)
+    if chat_id:
+        context.record(chat_id, user_id, message, response.text, (question_id, answer_id))
+    result = {
+        "response": response.text,
+        "image": prepared.describe(),
+        "file_id": file_id,
+    }
+    if question_id is not None:
+        result["message_ids"] = {"user": question_id, "bot": answer_id}
+    return result
+
+@app.get("/api/v1/chat/sessions")
+async def chat_sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    include_archived: bool = False,
+    user_id: str = Depends(get_current_user_id),
+    db: Database = Depends(get_database),
 ):
-    # For now, just echo back the message and filename
-    # You can add image processing/AI logic here
-    return {"response": f"Received image {image.filename} with message: {message}"}
+    try:
+        return await list_sessions(db, user_id, limit=limit, cursor=cursor, include_archived=include_archived)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/v1/chat/history")
-async def chat_history():
-    # This is a placeholder. You would implement actual chat history retrieval here.
-    return {"message": "Chat history endpoint - Not yet implemented"}
\ No newline at end of file
+async def chat_history(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+    db: Database = Depends(get_database),
+):
+    try:
+        return await list_messages(db, user_id, session_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/chat/search")
+async def chat_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: str | None = None,
+    include_archived: bool = False,
+    user_id: str = Depends(get_current_user_id),
+    db: Database = Depends(get_database),
+):
+    try:
+        return await search_history(db, user_id, q, limit=limit, cursor=cursor, include_archived=include_archived)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/v1/files/upload")
+async def files_upload(
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_current_user_id),
+    uploads: UploadService = Depends(get_upload_service),
+    db: Database | None = Depends(get_optional_database),
+):
+    try:
+        return await uploads.upload(file, user_id, db)
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("File upload failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/files/uploads", status_code=201)
+async def files_upload_create(
+    session: UploadSession,
+    user_id: str = Depends(get_current_user_id),
+    uploads: UploadService = Depends(get_upload_service),
+):
+    try:
+        return await uploads.create(user_id, session.file_name, session.file_size)
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/files/uploads/{upload_id}")
+async def files_upload_status(
+    upload_id: str,
+    user_id: str = Depends(get_current_user_id),
+    uploads: UploadService = Depends(get_upload_service),
+):
+    try:
+        return await uploads.status(upload_id, user_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+@app.put("/api/v1/files/uploads/{upload_id}")
+async def files_upload_append(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0),
+    user_id: str = Depends(get_current_user_id),
+    uploads: UploadService = Depends(get_upload_service),
+    db: Database | None = Depends(get_optional_database),
+):
+    try:
+        return await uploads.append(upload_id, user_id, upload_offset, request.stream(), db)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except OffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "offset": e.offset})
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail="Upload is already in progress")
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def submit_job(job: Job, message: str, context: ContextBuilder, store, broker,
+                     writer: MessageWriter | None) -> dict:
+    if job.chat_id:
+        # The runner saves the answer next to this question; until then the
+        # cached context is stale, so the session is reloaded next time.
+        job.question_id = save_message(writer, job.chat_id, job.user_id, message, True)
+        context.forget(job.chat_id, job.user_id)
+    await store.put(job)
+    await broker.submit(job)
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/api/v1/jobs", status_code=202)
+async def jobs_submit(
+    job_request: JobRequest,
+    user_id: str = Depends(get_current_user_id),
+    context: ContextBuilder = Depends(get_context_builder),
+    profile: str = Depends(get_profile),
+    store=Depends(get_job_store),
+    broker=Depends(get_job_broker),
+    tier: str = Depends(get_tier),
+    admission: AdmissionController = Depends(get_admission),
+    writer: MessageWriter | None = Depends(get_message_writer),
+):
+    # Jobs wait in their own queue, so only the rate limit applies here.
+    await admitted(admission.check_rate(user_id, tier))
+    prompt, cacheable = await build_prompt(job_request, user_id, context, profile)
+    job = Job(uuid.uuid4().hex, user_id, prompt, priority=job_request.priority,
+              cacheable=cacheable, chat_id=job_request.chat_id, created_at=time.time())
+    return await submit_job(job, job_request.message, context, store, broker, writer)
+
+@app.post("/api/v1/jobs/image", status_code=202)
+async def jobs_submit_image(
+    image: UploadFile = File(...),
+    message: str = Form(...),
+    chat_id: str = Form(None),
+    priority: Literal["high", "normal", "low"] = Form("normal"),
+    user_id: str = Depends(get_current_user_id),
+    context: ContextBuilder = Depends(get_context_builder),
+    profile: str = Depends(get_profile),
+    images: ImagePipeline = Depends(get_image_pipeline),
+    uploads: UploadService = Depends(get_upload_service),
+    store=Depends(get_job_store),
+    broker=Depends(get_job_broker),
+    tier: str = Depends(get_tier),
+    admission: AdmissionController = Depends(get_admission),
+    writer: MessageWriter | None = Depends(get_message_writer),
+):
+    await admitted(admission.check_rate(user_id, tier))
+    try:
+        prepared = await images.prepare(image)
+    except ImageRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = await uploads.storage.put(prepared.data)
+    prompt, cacheable = await build_prompt(ChatMessage(message=message, chat_id=chat_id), user_id, context, profile)
+    job = Job(
+        uuid.uuid4().hex, user_id, prompt, priority=priority, cacheable=cacheable,
+        images=[{"key": key, "mime_type": prepared.mime_type, "sha256": prepared.sha256}],
+        chat_id=chat_id, created_at=time.time(),
+    )
+    return await submit_job(job, message, context, store, broker, writer)
+
+@app.get("/api/v1/jobs/{job_id}")
+async def jobs_status(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_SECONDS),
+    user_id: str = Depends(get_current_user_id),
+    store=Depends(get_job_store),
+):
+    """Poll a job; with ``wait`` the call blocks until it finishes or the time is up."""
+    job = await store.wait(job_id, wait)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.public()
@@ -0,0 +1,310 @@
+"""Prometheus metrics for the API, served as text on ``/metrics``.
+
+Everything is updated from the event loop thread, so plain attribute
+arithmetic is enough and the hot path takes no locks (prometheus_client
+takes one per update). Figures other components already keep (cache hits,
+token totals, the admission queue) are read by callbacks at scrape time
+and cost nothing per request.
+"""
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield from child.samples(self.name, dict(zip(self.labelnames, values)))
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            yield name + "_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, cumulative
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+class Collected(_Metric):
+    """A counter or gauge whose values are read from ``collect`` at scrape time.
+
+    ``collect`` returns a number, or a dict from label values (a tuple, one
+    per label name) to numbers.
+    """
+
+    def __init__(self, name: str, help: str, collect: Callable, labelnames: Iterable[str] = (),
+                 type: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+        self.type = type
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield self.name, dict(zip(self.labelnames, label_values)), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"{metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collected(self, name, help, collect, labelnames=(), type="gauge") -> Collected:
+        return self.register(Collected(name, help, collect, labelnames, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "fynq_http_request_seconds", "Time from request start to the last response byte.",
+    ("app", "route", "method", "status"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("fynq_http_requests_in_flight", "Requests being handled.", ("app",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "fynq_stage_seconds", "Time spent in each stage of a chat request.", ("stage",)
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "fynq_llm_seconds",
+    "Upstream model timings: queue_wait for a slot, first_token, total.",
+    ("phase",),
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "fynq_event_loop_lag_seconds", "How late the event loop ran a timer.", buckets=LAG_BUCKETS
+)
+
+
+def stage(name: str):
+    """``with stage("prompt"):`` times a block into ``fynq_stage_seconds``."""
+    return STAGE_SECONDS.labels(name).time()
+
+
+def observe_llm(phase: str, seconds: float) -> None:
+    LLM_SECONDS.labels(phase).observe(seconds)
+
+
+class LoopLagMonitor:
+    """Sleeps ``interval`` seconds at a time and records how late it wakes.
+
+    A blocked event loop (sync I/O, heavy CPU in a handler) shows up here
+    before it shows up anywhere else.
+    """
+
+    def __init__(self, interval: float = 0.5, histogram: Histogram = LOOP_LAG_SECONDS):
+        self.interval = interval
+        self.histogram = histogram
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(0.0, loop.time() - scheduled))
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def metrics_endpoint(token: str | None = None, registry: Registry = REGISTRY):
+    """Starlette endpoint serving ``registry``; with ``token`` it needs that bearer token."""
+    from starlette.responses import Response
+
+    async def endpoint(request):
+        if token and request.headers.get("authorization") != f"Bearer {token}":
+            return Response(status_code=401)
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+
+    return endpoint
+
+
+class MetricsMiddleware:
+    """Counts in-flight requests and times each one by route template."""
+
+    def __init__(self, app, app_label: str = "api"):
+        self.app = app
+        self.app_label = app_label
+        self._in_flight = HTTP_IN_FLIGHT.labels(app_label)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self._in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self._in_flight.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                self.app_label,
+                getattr(route, "path", "unmatched"),
+                scope["method"],
+                str(status),
+            ).observe(time.perf_counter() - start)
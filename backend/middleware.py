@@ -0,0 +1,74 @@
+"""ASGI middleware shared by the API."""
+import json
+
+
+class _BodyTooLarge(BaseException):
+    # BaseException so FastAPI's body parsing does not turn it into its own 400.
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies above a per-path byte limit while they stream in.
+
+    ``limits`` maps path prefixes to the maximum body size. A larger
+    Content-Length is refused before any of the body is read. Chunked uploads
+    are counted as they arrive and cut off at the limit, so the multipart
+    parser never buffers an oversized body.
+    """
+
+    def __init__(self, app, limits: dict[str, int], detail: str = "File too large"):
+        self.app = app
+        self.limits = limits
+        self.detail = detail
+
+    def _limit_for(self, path: str) -> int | None:
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self._limit_for(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": self.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 400,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
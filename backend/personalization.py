@@ -0,0 +1,244 @@
+"""Personalization prompts compiled from the onboarding survey.
+
+Each student's ``survey_responses`` row is turned into a few short lines
+("Prefers visual explanations...") once, and the result is kept in a
+bounded LRU with a TTL, optionally backed by a Redis tier shared by all
+workers. A chat request then costs one dict lookup; students who never
+took the survey are cached too, as an empty fragment.
+
+When a row changes, a trigger (see the ``survey_responses_change_notify``
+migration) sends a Postgres NOTIFY; :class:`SurveyListener` receives it
+in every worker and drops that student's entry. The TTL bounds staleness
+where notifications cannot arrive (SQLite, a dropped listener connection).
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from llm import SingleFlight
+from llm.context import QUESTION_HEADER
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "[Student profile]"
+CHANNEL = "survey_responses_changed"
+# Part of the shared cache key: bump it when the compiled wording changes.
+FRAGMENT_VERSION = "1"
+
+_PHRASES = {
+    "learning_approach": {
+        "visual": "Prefers visual explanations: describe diagrams, graphs and tables.",
+        "auditory": "Learns by listening and discussion: explain conversationally.",
+        "hands_on": "Learns by doing: lead with a worked example and a practice problem.",
+        "reading": "Learns by reading and writing: give structured, written explanations.",
+    },
+    "challenging_subject": {
+        "mathematics": "Finds mathematics hardest.",
+        "science": "Finds physics and chemistry hardest.",
+        "languages": "Finds languages hardest.",
+        "social_studies": "Finds social studies hardest.",
+    },
+    "feedback_preference": {
+        "immediate": "Wants mistakes pointed out straight away.",
+        "detailed": "Wants detailed explanations of why.",
+        "encouraging": "Responds best to encouraging, supportive feedback.",
+        "step_by_step": "Wants step-by-step guidance.",
+    },
+    "study_time": {
+        "less_than_1": "Studies under an hour a day: keep answers focused.",
+        "1_to_2": "Studies 1-2 hours a day.",
+        "2_to_4": "Studies 2-4 hours a day.",
+        "more_than_4": "Studies over 4 hours a day.",
+    },
+}
+_LABELS = {
+    "learning_approach": "Learning approach",
+    "challenging_subject": "Hardest subject",
+    "math_hurdle": "Main maths hurdle",
+    "mistake_reaction": "Reaction to mistakes",
+    "feedback_preference": "Feedback preference",
+    "study_time": "Daily study time",
+    "lesson_preference": "Lesson preference",
+    "revision_method": "Revision method",
+    "gamification_preference": "Gamification",
+    "understanding_check": "Checks understanding by",
+}
+_UNSET = {"", "not_specified", "other"}
+MAX_VALUE_CHARS = 80
+MAX_SUMMARY_CHARS = 300
+
+
+def _clean(value: str, limit: int) -> str:
+    # Survey answers are student-written; keep each to one short line.
+    return " ".join(str(value).split())[:limit]
+
+
+def compile_fragment(row: dict | None) -> str:
+    """The prompt lines for a survey row; empty when there is nothing to say."""
+    if not row:
+        return ""
+    lines = []
+    for field, label in _LABELS.items():
+        value = row.get(field)
+        if value is None or str(value).strip().lower() in _UNSET:
+            continue
+        phrase = _PHRASES.get(field, {}).get(value)
+        lines.append(phrase or f"{label}: {_clean(value, MAX_VALUE_CHARS)}.")
+    if row.get("summary"):
+        lines.append(f"Summary: {_clean(row['summary'], MAX_SUMMARY_CHARS)}")
+    return "\n".join(lines)
+
+
+def personalize(fragment: str, prompt: str) -> str:
+    """Put ``fragment`` in front of ``prompt``, keeping the question marked as such."""
+    if not fragment:
+        return prompt
+    if QUESTION_HEADER not in prompt:
+        prompt = f"{QUESTION_HEADER}\n{prompt}"
+    return f"{PROFILE_HEADER}\n{fragment}\n\n{prompt}"
+
+
+class PersonalizationCache:
+    """LRU + TTL cache of compiled fragments with an optional shared tier.
+
+    ``load(user_id)`` returns the survey row or None. A failing load is
+    logged and answered with no personalization, uncached.
+    """
+
+    def __init__(self, load: Callable[[str], Awaitable[dict | None]], max_entries: int = 10_000,
+                 ttl: float = 3600.0, shared=None, clock=time.monotonic):
+        self.load = load
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.clock = clock
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._flights = SingleFlight()
+
+    async def get(self, user_id: str) -> str:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > self.clock():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+        return await self._flights.do(user_id, lambda: self._fill(user_id))
+
+    async def _fill(self, user_id: str) -> str:
+        invalidations = self.invalidations
+        if self.shared is not None:
+            fragment = await self.shared.get(self._shared_key(user_id))
+            if fragment is not None:
+                self.shared_hits += 1
+                self._store(user_id, fragment)
+                return fragment
+        self.misses += 1
+        try:
+            fragment = compile_fragment(await self.load(user_id))
+        except Exception:
+            logger.warning("Could not load survey for %s", user_id, exc_info=True)
+            return ""
+        # A change reported while we were reading may not be in what we read.
+        if invalidations == self.invalidations:
+            self._store(user_id, fragment)
+            if self.shared is not None:
+                await self.shared.set(self._shared_key(user_id), fragment)
+        return fragment
+
+    def _store(self, user_id: str, fragment: str) -> None:
+        self._entries[user_id] = (self.clock() + self.ttl, fragment)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _shared_key(user_id: str) -> str:
+        return f"v{FRAGMENT_VERSION}:{user_id}"
+
+    async def invalidate(self, user_id: str) -> None:
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+        if self.shared is not None:
+            await self.shared.delete(self._shared_key(user_id))
+
+    def clear(self) -> None:
+        """Forget every local entry, e.g. after notifications may have been missed."""
+        self.invalidations += 1
+        self._entries.clear()
+
+
+class SurveyListener:
+    """LISTENs for survey changes on Postgres and invalidates the cache.
+
+    psycopg2 notifications are read on a thread with its own connection.
+    After a reconnect the local cache is cleared, since notifications sent
+    while disconnected are lost.
+    """
+
+    def __init__(self, database_url: str, cache: PersonalizationCache, channel: str = CHANNEL,
+                 poll_interval: float = 5.0, retry_interval: float = 5.0):
+        self.database_url = database_url
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    async def start(self) -> None:
+        if self._thread is None:
+            loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._run, args=(loop,), name="survey-listener",
+                                            daemon=True)
+            self._thread.start()
+
+    def _connect(self):
+        import psycopg2
+        from sqlalchemy.engine import make_url
+
+        url = make_url(self.database_url)
+        conn = psycopg2.connect(**url.translate_connect_args(username="user", database="dbname"),
+                                **url.query)
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _run(self, loop: asyncio.AbstractEventLoop) -> None:
+        import select
+
+        connected_before = False
+        while not self._stopped.is_set():
+            try:
+                conn = self._connect()
+            except Exception:
+                logger.warning("Survey listener could not connect", exc_info=True)
+                self._stopped.wait(self.retry_interval)
+                continue
+            if connected_before:
+                loop.call_soon_threadsafe(self.cache.clear)
+            connected_before = True
+            try:
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        user_id = conn.notifies.pop(0).payload
+                        asyncio.run_coroutine_threadsafe(self.cache.invalidate(user_id), loop)
+            except Exception:
+                logger.warning("Survey listener lost its connection", exc_info=True)
+            finally:
+                conn.close()
+
+    async def aclose(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            await asyncio.to_thread(self._thread.join, self.poll_interval + 1)
+            self._thread = None
@@ -0,0 +1,217 @@
+"""Content-addressed blob storage for uploaded study material.
+
+Finished files are stored once per SHA-256 under ``objects/ab/abcdef...``;
+that key is what ``uploaded_files.file_path`` records, so the same PDF sent
+by a hundred students takes up space once.
+
+Uploads in progress live under ``partial/`` with a small JSON sidecar.
+Bytes are appended as they arrive off the socket, so nothing is held in
+worker memory, and a client whose connection dropped can ask how much
+arrived and carry on from there, even after a worker restart. Once the
+file is committed the sidecar stays behind as a record of the result,
+for a client that lost the final response, until it is purged as stale.
+
+:class:`LocalStorage` writes to a directory on disk and stands in for
+Supabase Storage; a bucket-backed adapter only has to provide the same
+methods.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator
+
+WRITE_BUFFER_BYTES = 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+HEAD_BYTES = 16
+
+
+class OffsetMismatch(Exception):
+    """The client resumed from the wrong place; ``offset`` is where to resume."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(Exception):
+    """Another request is already appending to this upload."""
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+        self._objects = os.path.join(root, "objects")
+        self._partial = os.path.join(root, "partial")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._partial, exist_ok=True)
+        self._busy: set[str] = set()
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self._partial, upload_id)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self._partial, upload_id + ".json")
+
+    @staticmethod
+    def key_for(sha256: str) -> str:
+        return f"objects/{sha256[:2]}/{sha256}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self.path_for(key))
+
+    async def create(self, upload_id: str, meta: dict) -> None:
+        await asyncio.to_thread(self._create, upload_id, meta)
+
+    def _create(self, upload_id, meta):
+        open(self._data_path(upload_id), "xb").close()
+        with open(self._meta_path(upload_id), "w") as f:
+            json.dump(meta, f)
+
+    async def meta(self, upload_id: str) -> dict | None:
+        return await asyncio.to_thread(self._read_meta, upload_id)
+
+    def _read_meta(self, upload_id):
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    async def received(self, upload_id: str) -> int:
+        return await asyncio.to_thread(os.path.getsize, self._data_path(upload_id))
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Write ``chunks`` at ``offset`` and return the new size.
+
+        ``offset`` must equal what has been received so far. If the stream
+        fails part way, whatever was written stays and the upload resumes
+        from there.
+        """
+        if upload_id in self._busy:
+            raise UploadBusy(upload_id)
+        self._busy.add(upload_id)
+        try:
+            current = await self.received(upload_id)
+            if offset != current:
+                raise OffsetMismatch(current)
+            f = await asyncio.to_thread(open, self._data_path(upload_id), "ab")
+            try:
+                pending: list[bytes] = []
+                pending_bytes = 0
+                try:
+                    async for chunk in chunks:
+                        pending.append(chunk)
+                        pending_bytes += len(chunk)
+                        if pending_bytes >= WRITE_BUFFER_BYTES:
+                            await asyncio.to_thread(f.writelines, pending)
+                            current += pending_bytes
+                            pending, pending_bytes = [], 0
+                finally:
+                    if pending:
+                        await asyncio.to_thread(f.writelines, pending)
+                        current += pending_bytes
+            finally:
+                await asyncio.to_thread(f.close)
+            return current
+        finally:
+            self._busy.discard(upload_id)
+
+    async def digest(self, upload_id: str) -> tuple[str, int, bytes]:
+        """SHA-256, size and leading bytes of a partial upload."""
+        return await asyncio.to_thread(self._digest, upload_id)
+
+    def _digest(self, upload_id):
+        sha = hashlib.sha256()
+        size = 0
+        head = b""
+        with open(self._data_path(upload_id), "rb") as f:
+            while chunk := f.read(HASH_CHUNK_BYTES):
+                if not head:
+                    head = chunk[:HEAD_BYTES]
+                sha.update(chunk)
+                size += len(chunk)
+        return sha.hexdigest(), size, head
+
+    async def commit(self, upload_id: str, sha256: str) -> str:
+        """Move a finished upload to its content address and return the key."""
+        return await asyncio.to_thread(self._commit, upload_id, sha256)
+
+    def _commit(self, upload_id, sha256):
+        key = self.key_for(sha256)
+        target = self.path_for(key)
+        if os.path.exists(target):
+            os.remove(self._data_path(upload_id))
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self._data_path(upload_id), target)
+        return key
+
+    async def finish(self, upload_id: str, meta: dict) -> None:
+        """Replace a committed upload's sidecar with ``meta``, its record."""
+        await asyncio.to_thread(self._write_meta, upload_id, meta)
+
+    def _write_meta(self, upload_id, meta):
+        path = self._meta_path(upload_id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    async def put(self, data: bytes) -> str:
+        """Store ``data`` in one go and return its key."""
+        upload_id = uuid.uuid4().hex
+        return await asyncio.to_thread(self._put, upload_id, data)
+
+    def _put(self, upload_id, data):
+        with open(self._data_path(upload_id), "xb") as f:
+            f.write(data)
+        return self._commit(upload_id, hashlib.sha256(data).hexdigest())
+
+    async def read(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._read, key)
+
+    def _read(self, key):
+        with open(self.path_for(key), "rb") as f:
+            return f.read()
+
+    async def discard(self, upload_id: str) -> None:
+        await asyncio.to_thread(self._discard, upload_id)
+
+    def _discard(self, upload_id):
+        try:
+            os.remove(self._data_path(upload_id))
+        except FileNotFoundError:
+            pass
+        self._remove_meta(upload_id)
+
+    def _remove_meta(self, upload_id):
+        try:
+            os.remove(self._meta_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    async def purge_stale(self, max_age: float) -> int:
+        """Drop uploads nobody has appended to, and records of finished ones,
+        older than ``max_age`` seconds."""
+        return await asyncio.to_thread(self._purge_stale, max_age)
+
+    def _purge_stale(self, max_age):
+        cutoff = time.time() - max_age
+        purged = 0
+        for name in os.listdir(self._partial):
+            upload_id = name.removesuffix(".json")
+            if name.endswith(".tmp") or (name != upload_id and os.path.exists(self._data_path(upload_id))):
+                continue  # an upload in progress is judged by its data
+            try:
+                stale = os.path.getmtime(os.path.join(self._partial, name)) < cutoff
+            except FileNotFoundError:
+                continue
+            if stale and upload_id not in self._busy:
+                self._discard(upload_id)
+                purged += 1
+        return purged
@@ -0,0 +1,71 @@
+"""Server-Sent Events plumbing for streamed chat answers."""
+import asyncio
+import json
+from typing import AsyncIterator, Callable
+
+from llm import DisconnectCheck
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Stop nginx-style proxies from buffering the stream into one response.
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_error(e: Exception) -> dict:
+    return {"detail": str(e)}
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(
+    chunks: AsyncIterator[str],
+    *,
+    done: dict | None = None,
+    is_disconnected: DisconnectCheck | None = None,
+    heartbeat: float = 15.0,
+    buffer: int = 8,
+    describe_error: Callable[[Exception], dict] = sse_error,
+) -> AsyncIterator[str]:
+    """Turn a stream of text chunks into SSE frames.
+
+    Upstream chunks are read by a separate task into a queue of ``buffer``
+    entries. When the client reads slowly the queue fills up and the task
+    stops pulling from the model, so memory per connection stays bounded.
+    While no chunk arrives a ``: keep-alive`` comment is sent every
+    ``heartbeat`` seconds. The stream ends with a ``done`` event (carrying
+    ``done``) or an ``error`` event carrying ``describe_error(exception)``;
+    leaving early cancels the upstream call.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+
+    async def produce():
+        try:
+            async for text in chunks:
+                await queue.put(("chunk", {"text": text}))
+            await queue.put(("done", done or {}))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(("error", describe_error(e)))
+        finally:
+            await chunks.aclose()
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event, data)
+            if event != "chunk":
+                return
+    finally:
+        producer.cancel()
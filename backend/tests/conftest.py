@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import pytest
+
+# Set before main is imported: tests sign their own tokens, never call Gemini
+# and never reach the Supabase project configured in backend/.env.
+os.environ["SUPABASE_JWT_SECRET"] = "test-jwt-secret"
+os.environ["SUPABASE_URL"] = ""
+os.environ["DATABASE_URL"] = ""
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["UPLOAD_STORAGE_DIR"] = tempfile.mkdtemp(prefix="fynq-uploads-")
+# Every test signs in as the same user; admission tests set up their own limits.
+os.environ["RATE_LIMIT_PER_MINUTE"] = "0"
+
+from db import Database, create_sqlite_schema
+
+
+@pytest.fixture
+def db(tmp_path):
+    """An empty SQLite stand-in for the Supabase tables; modules add their own rows."""
+    database = Database(f"sqlite:///{tmp_path / 'fynq.db'}")
+    create_sqlite_schema(database)
+    yield database
+    database.dispose()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "postgres: needs TEST_DATABASE_URL, a disposable Postgres with supabase/migrations applied"
+    )
@@ -0,0 +1,237 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController, FairScheduler, Overloaded, TokenBuckets, tier_from_claims
+from llm import FakeBackend, LLMClient, ResponseCache
+from main import app, get_admission, get_llm_client
+from tokens import auth_headers
+
+
+def test_bucket_allows_burst_then_says_when_to_retry():
+    now = [0.0]
+    buckets = TokenBuckets(clock=lambda: now[0])
+
+    async def take():
+        return await buckets.take("u", rate=1.0, burst=3)
+
+    assert [asyncio.run(take()) for _ in range(3)] == [0, 0, 0]
+    assert asyncio.run(take()) == pytest.approx(1.0)
+    now[0] = 1.0
+    assert asyncio.run(take()) == 0
+
+
+def test_higher_tier_gets_a_bigger_bucket():
+    controller = AdmissionController(rate=1 / 60, burst=2)
+
+    async def allowed(user, tier):
+        count = 0
+        try:
+            while count < 20:
+                await controller.check_rate(user, tier)
+                count += 1
+        except Overloaded:
+            pass
+        return count
+
+    assert asyncio.run(allowed("a", "free")) == 2
+    assert asyncio.run(allowed("b", "plus")) == 8
+
+
+def test_tier_comes_from_app_metadata_only():
+    assert tier_from_claims({"app_metadata": {"tier": "plus"}}) == "plus"
+    assert tier_from_claims({"user_metadata": {"tier": "ultra"}}) == "free"
+    assert tier_from_claims({"app_metadata": {"tier": "gold"}}) == "free"
+
+
+async def grant_order(scheduler, arrivals):
+    order = []
+
+    async def one(flow, weight):
+        await scheduler.acquire(flow, weight)
+        order.append(flow)
+        await asyncio.sleep(0)
+        scheduler.release()
+
+    await scheduler.acquire("holder")
+    tasks = []
+    for flow, weight in arrivals:
+        tasks.append(asyncio.create_task(one(flow, weight)))
+        await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_flooding_user_does_not_delay_others():
+    arrivals = [("flood", 1.0)] * 5 + [("polite", 1.0)]
+    order = asyncio.run(grant_order(FairScheduler(1), arrivals))
+    assert order.index("polite") <= 1
+
+
+def test_returning_user_is_not_queued_behind_a_new_flood():
+    async def main():
+        scheduler = FairScheduler(1, max_queue=100, max_wait=5)
+        # A quiet hour: every one of the student's questions finds a free slot.
+        for _ in range(50):
+            await scheduler.acquire("student")
+            scheduler.release()
+        order = []
+
+        async def one(flow):
+            await scheduler.acquire(flow)
+            order.append(flow)
+            await asyncio.sleep(0)
+            scheduler.release()
+
+        await scheduler.acquire("holder")
+        flood = [asyncio.create_task(one("flood")) for _ in range(20)]
+        await asyncio.sleep(0)
+        student = asyncio.create_task(one("student"))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*flood, student)
+        return order
+
+    assert asyncio.run(main()).index("student") <= 2
+
+
+def test_premium_requests_go_first():
+    arrivals = [("free", 1.0), ("free", 1.0), ("plus", 4.0), ("plus", 4.0)]
+    order = asyncio.run(grant_order(FairScheduler(1), arrivals))
+    assert order == ["plus", "plus", "free", "free"]
+
+
+def test_full_queue_and_long_wait_are_refused_fast():
+    async def main():
+        scheduler = FairScheduler(1, max_queue=1, max_wait=0.05)
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        with pytest.raises(Overloaded) as full:
+            await scheduler.acquire("c")
+        assert time.perf_counter() - start < 0.01
+        with pytest.raises(Overloaded):
+            await waiter
+        assert full.value.retry_after >= 1
+        scheduler.release()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.active == 0
+    assert scheduler.queued == 0
+    assert scheduler.rejected == 2
+
+
+def test_polite_latency_stays_flat_under_a_flood():
+    async def request(scheduler, flow, latencies=None):
+        start = time.perf_counter()
+        try:
+            await scheduler.acquire(flow)
+        except Overloaded:
+            return
+        try:
+            await asyncio.sleep(0.01)  # the model call
+        finally:
+            scheduler.release()
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        scheduler = FairScheduler(2, max_queue=1000)
+        latencies = []
+        flood = [asyncio.create_task(request(scheduler, "flood")) for _ in range(200)]
+        await asyncio.sleep(0)
+        for _ in range(10):
+            await request(scheduler, "polite", latencies)
+        for task in flood:
+            task.cancel()
+        await asyncio.gather(*flood, return_exceptions=True)
+        return latencies
+
+    latencies = asyncio.run(main())
+    # A FIFO queue would put each polite request behind ~100 flood calls (~0.5s).
+    assert max(latencies) < 0.1
+
+
+def test_cached_answer_does_not_wait_for_a_model_slot():
+    async def main():
+        controller = AdmissionController(scheduler=FairScheduler(1, max_wait=0.05))
+        client = LLMClient(FakeBackend(reply="hot answer"), cache=ResponseCache())
+
+        def slot():
+            return controller.acquire("student", "free")
+
+        await client.generate("hot question", slot=slot)
+        busy = await controller.acquire("someone-else", "free")  # a slow upstream call
+        cached = await client.generate("hot question", slot=slot)
+        with pytest.raises(Overloaded):
+            await client.generate("new question", slot=slot)
+        busy.release()
+        return cached
+
+    assert asyncio.run(main()).cached
+
+
+def test_coalesced_callers_share_one_slot():
+    async def main():
+        controller = AdmissionController(scheduler=FairScheduler(1, max_queue=0))
+        client = LLMClient(FakeBackend(reply="answer", latency=0.02), cache=None)
+        taken = []
+
+        def slot():
+            taken.append(1)
+            return controller.acquire("student", "free")
+
+        # With max_queue=0 any second slot request would be refused outright.
+        answers = await asyncio.gather(*(client.generate("same question", slot=slot) for _ in range(8)))
+        return answers, taken, controller.scheduler.active
+
+    answers, taken, active = asyncio.run(main())
+    assert [a.text for a in answers] == ["answer"] * 8
+    assert len(taken) == 1 and active == 0
+
+
+@pytest.fixture
+def limited():
+    controller = AdmissionController(scheduler=FairScheduler(1), rate=1 / 60, burst=1)
+    app.dependency_overrides[get_admission] = lambda: controller
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply="ok"))
+    yield controller
+    app.dependency_overrides.clear()
+
+
+def test_over_the_limit_gets_429_with_retry_after(limited):
+    client = TestClient(app)
+    first = client.post("/api/v1/chat/message", json={"message": "q"}, headers=auth_headers())
+    second = client.post("/api/v1/chat/message", json={"message": "q"}, headers=auth_headers())
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) == 60
+    assert limited.scheduler.active == 0
+
+
+def test_stream_holds_its_slot_until_done(limited):
+    response = TestClient(app).post("/api/v1/chat/stream", json={"message": "q"}, headers=auth_headers())
+    assert response.status_code == 200
+    assert limited.scheduler.active == 0
+
+
+def test_stream_refused_a_slot_ends_with_a_429_error_event():
+    controller = AdmissionController(scheduler=FairScheduler(1, max_queue=0))
+    controller.scheduler.active = 1  # every slot taken by slow calls
+    app.dependency_overrides[get_admission] = lambda: controller
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply="ok"))
+    try:
+        response = TestClient(app).post("/api/v1/chat/stream", json={"message": "q"}, headers=auth_headers())
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert 'event: error\ndata: {"detail": "Too many requests waiting for the model", "status": 429' in response.text
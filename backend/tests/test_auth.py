@@ -0,0 +1,118 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from auth import InvalidToken, JWKSCache, TokenVerifier
+from main import app
+from tokens import make_token
+
+SECRET = os.environ["SUPABASE_JWT_SECRET"]
+
+
+def test_valid_token_is_verified_once_then_served_from_cache():
+    verifier = TokenVerifier(jwt_secret=SECRET)
+    token = make_token("user-1")
+
+    async def run():
+        first = await verifier.verify(token)
+        second = await verifier.verify(token)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["sub"] == second["sub"] == "user-1"
+    assert verifier.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+@pytest.mark.parametrize("token", [
+    "test.jwt.token",
+    jwt.encode({"sub": "u", "aud": "authenticated", "exp": int(time.time()) + 60}, "wrong-secret", algorithm="HS256"),
+    jwt.encode({"sub": "u", "aud": "anon", "exp": int(time.time()) + 60}, SECRET, algorithm="HS256"),
+    jwt.encode({"sub": "u", "aud": "authenticated"}, SECRET, algorithm="HS256"),
+])
+def test_bad_tokens_are_rejected(token):
+    verifier = TokenVerifier(jwt_secret=SECRET)
+    with pytest.raises(InvalidToken):
+        asyncio.run(verifier.verify(token))
+
+
+def test_cached_claims_expire_with_the_token():
+    now = [time.time()]
+    verifier = TokenVerifier(jwt_secret=SECRET, clock=lambda: now[0])
+    token = make_token(expires_in=60)
+    asyncio.run(verifier.verify(token))
+    asyncio.run(verifier.verify(token))
+    now[0] += 120
+    # Past exp the cached entry is not trusted; the token is checked again.
+    asyncio.run(verifier.verify(token))
+    assert verifier.stats()["hits"] == 1
+    assert verifier.stats()["misses"] == 2
+
+
+def test_expired_token_is_rejected():
+    verifier = TokenVerifier(jwt_secret=SECRET)
+    with pytest.raises(InvalidToken):
+        asyncio.run(verifier.verify(make_token(expires_in=-60)))
+
+
+def test_cache_is_bounded():
+    verifier = TokenVerifier(jwt_secret=SECRET, cache_size=3)
+
+    async def run():
+        for i in range(5):
+            await verifier.verify(make_token(f"user-{i}"))
+
+    asyncio.run(run())
+    assert verifier.stats()["entries"] == 3
+
+
+def test_asymmetric_token_uses_jwks_and_refetches_on_unknown_kid():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from jose import jwk
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = jwk.construct(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ),
+        "ES256",
+    ).to_dict()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return {"keys": [{**public, "kid": "key-1"}]}
+
+    verifier = TokenVerifier(jwks=JWKSCache("unused", fetch=fetch, min_refetch_interval=3600))
+    token = jwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 60},
+        pem, algorithm="ES256", headers={"kid": "key-1"},
+    )
+    other = jwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 60},
+        pem, algorithm="ES256", headers={"kid": "key-2"},
+    )
+
+    assert asyncio.run(verifier.verify(token))["sub"] == "user-1"
+    with pytest.raises(InvalidToken):
+        asyncio.run(verifier.verify(other))
+    # key-2 was unknown, but the refetch is rate limited.
+    assert len(fetches) == 1
+
+
+def test_endpoint_rejects_unsigned_token():
+    response = TestClient(app).get(
+        "/api/v1/chat/sessions",
+        headers={"Authorization": "Bearer test.jwt.token"},
+    )
+    assert response.status_code == 401
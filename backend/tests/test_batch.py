@@ -0,0 +1,128 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController
+from batch import BatchSolver
+from llm import FakeBackend, LLMClient
+from main import app, get_admission, get_llm_client
+from tokens import auth_headers
+
+
+class Slow:
+    """solve() that takes the given seconds per question and tracks concurrency."""
+
+    def __init__(self, delays, fail=()):
+        self.delays = delays
+        self.fail = fail
+        self.in_flight = 0
+        self.peak = 0
+        self.cancelled = 0
+
+    async def __call__(self, question):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays[question])
+            if question in self.fail:
+                raise RuntimeError(f"could not solve {question}")
+            return {"response": question.upper()}
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+def collect(solver, questions, solve):
+    async def main():
+        return [result async for result in solver.run(questions, solve)]
+
+    return asyncio.run(main())
+
+
+def test_results_arrive_in_completion_order_with_their_index():
+    solve = Slow({"a": 0.05, "b": 0.01, "c": 0.03})
+    results = collect(BatchSolver(concurrency=3), ["a", "b", "c"], solve)
+    assert [r.get("index") for r in results] == [1, 2, 0, None]
+    assert results[0] == {"index": 1, "response": "B"}
+    assert results[-1] == {"done": True, "succeeded": 3, "failed": 0}
+
+
+def test_fan_out_is_bounded():
+    questions = [f"q{i}" for i in range(20)]
+    solve = Slow({q: 0.01 for q in questions})
+    results = collect(BatchSolver(concurrency=4), questions, solve)
+    assert solve.peak == 4
+    assert sorted(r["index"] for r in results[:-1]) == list(range(20))
+
+
+def test_failed_question_does_not_stop_the_rest():
+    solver = BatchSolver(concurrency=2)
+    results = collect(solver, ["a", "b", "c"], Slow({"a": 0.0, "b": 0.0, "c": 0.0}, fail={"b"}))
+    assert {"index": 1, "error": "could not solve b", "status": 500} in results
+    assert results[-1] == {"done": True, "succeeded": 2, "failed": 1}
+    assert solver.stats() == {"answered": 2, "failed": 1, "cancelled": 0}
+
+
+def test_leaving_early_cancels_the_rest():
+    questions = ["fast", "slow1", "slow2", "slow3"]
+    solve = Slow({"fast": 0.0, "slow1": 5, "slow2": 5, "slow3": 5})
+    solver = BatchSolver(concurrency=3)
+
+    async def main():
+        results = solver.run(questions, solve)
+        first = await results.__anext__()
+        await results.aclose()
+        return first
+
+    assert asyncio.run(main())["index"] == 0
+    assert solve.in_flight == 0 and solve.cancelled == 3
+    assert solver.stats() == {"answered": 1, "failed": 0, "cancelled": 3}
+
+
+def test_batch_endpoint_streams_ndjson():
+    def reply(prompt):
+        if "divide by zero" in prompt:
+            raise ZeroDivisionError("undefined")
+        return f"answer to {prompt}"
+
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply=reply), cache=None)
+    try:
+        client = TestClient(app)
+        response = client.post("/api/v1/chat/batch", headers=auth_headers(),
+                               json={"questions": ["unit of force?", "divide by zero", "unit of power?"]})
+        too_many = client.post("/api/v1/chat/batch", headers=auth_headers(), json={"questions": ["q"] * 51})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    answers = {line["index"]: line for line in lines[:-1]}
+    assert answers[0]["response"] == "answer to unit of force?"
+    assert answers[1]["status"] == 500
+    assert lines[-1] == {"done": True, "succeeded": 2, "failed": 1}
+    assert too_many.status_code == 422
+
+
+def test_every_batch_question_is_charged_to_the_rate_limit():
+    controller = AdmissionController(rate=20, burst=2)
+    app.dependency_overrides[get_admission] = lambda: controller
+    try:
+        client = TestClient(app)
+        start = time.perf_counter()
+        response = client.post("/api/v1/chat/batch", headers=auth_headers(),
+                               json={"questions": [f"question {i}" for i in range(6)]})
+        elapsed = time.perf_counter() - start
+        refused = client.post("/api/v1/chat/batch", headers=auth_headers(), json={"questions": ["one more"]})
+    finally:
+        app.dependency_overrides.clear()
+    # Two from the burst, then four more at 20 per second.
+    assert elapsed >= 0.19
+    assert json.loads(response.text.splitlines()[-1]) == {"done": True, "succeeded": 6, "failed": 0}
+    assert refused.status_code == 429
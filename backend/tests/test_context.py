@@ -0,0 +1,189 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from llm import ContextBuilder, FakeBackend, LLMClient, Turn, estimate_tokens
+from main import app, get_context_builder, get_llm_client
+from tokens import auth_headers
+
+
+def history(count):
+    return [Turn(i % 2 == 0, f"turn {i} " + "x" * 40) for i in range(count)]
+
+
+class Loader:
+    def __init__(self, turns):
+        self.turns = turns
+        self.calls = 0
+
+    async def __call__(self, session_id, user_id, limit):
+        self.calls += 1
+        return self.turns[-limit:]
+
+
+class Summarizer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, summary, turns):
+        self.calls.append(len(turns))
+        await asyncio.sleep(self.delay)
+        return f"{summary} +{len(turns)} turns".strip()
+
+
+def test_prompt_stays_within_budget_for_long_sessions():
+    builder = ContextBuilder(Loader(history(2000)), Summarizer(), token_budget=300, recent_messages=50)
+
+    async def run():
+        return await builder.build("s", "u", "What about the next step?")
+
+    assembled = asyncio.run(run())
+    assert assembled.has_history
+    assert estimate_tokens(assembled.prompt) <= 300
+    assert assembled.prompt.endswith("[Current question]\nWhat about the next step?")
+    assert "turn 1999" in assembled.prompt
+
+
+def test_session_is_loaded_once_and_extended_in_memory():
+    loader = Loader(history(4))
+    builder = ContextBuilder(loader, Summarizer(), recent_messages=10)
+
+    async def run():
+        await builder.build("s", "u", "q1")
+        builder.record("s", "u", "q1", "a1")
+        return await builder.build("s", "u", "q2")
+
+    assembled = asyncio.run(run())
+    assert loader.calls == 1
+    assert "Student: q1\nfynqAI: a1" in assembled.prompt
+
+
+def test_summary_is_refreshed_in_background():
+    summarizer = Summarizer(delay=0.05)
+    builder = ContextBuilder(Loader(history(6)), summarizer, recent_messages=4, summary_backlog=10)
+
+    async def run():
+        first = await builder.build("s", "u", "q")
+        # The request did not wait for the summarizer.
+        assert "[Summary" not in first.prompt
+        await asyncio.sleep(0.1)
+        return await builder.build("s", "u", "q")
+
+    assembled = asyncio.run(run())
+    assert summarizer.calls == [2]
+    assert "[Summary of the earlier conversation]\n+2 turns" in assembled.prompt
+
+
+def test_current_question_is_not_repeated_from_history():
+    turns = history(2) + [Turn(True, "What is torque?")]
+    builder = ContextBuilder(Loader(turns), Summarizer())
+    assembled = asyncio.run(builder.build("s", "u", "What is torque?"))
+    assert assembled.prompt.count("What is torque?") == 1
+
+
+def test_unloadable_session_falls_back_to_plain_question():
+    async def broken(session_id, user_id, limit):
+        raise RuntimeError("db down")
+
+    builder = ContextBuilder(broken, Summarizer())
+    assembled = asyncio.run(builder.build("s", "u", "q"))
+    assert assembled.prompt == "q"
+    assert not assembled.has_history
+
+
+def test_session_answered_elsewhere_is_reloaded_once():
+    turns = [Turn(i % 2 == 0, f"turn {i}", f"m{i}") for i in range(6)]
+    loader = Loader(turns)
+    summarizer = Summarizer()
+
+    async def latest_id(session_id, user_id):
+        return turns[-1].id
+
+    builder = ContextBuilder(loader, summarizer, recent_messages=4, latest_id=latest_id)
+
+    async def run():
+        await builder.build("s", "u", "q1")
+        # This process answers q1; its rows are seen in the database later.
+        builder.record("s", "u", "q1", "a1", ("m6", "m7"))
+        await asyncio.sleep(0.01)  # let the background summary catch up
+        turns.extend([Turn(True, "q1", "m6"), Turn(False, "a1", "m7")])
+        await builder.build("s", "u", "q2")
+        # Another worker answers q2 in the same session.
+        turns.extend([Turn(True, "q2", "m8"), Turn(False, "a2 from elsewhere", "m9")])
+        assembled = await builder.build("s", "u", "q3")
+        await asyncio.sleep(0.01)
+        return assembled
+
+    assembled = asyncio.run(run())
+    assert "fynqAI: a2 from elsewhere" in assembled.prompt
+    assert loader.calls == 2 and builder.reloads == 1
+    # Turns already in the summary are not summarized again after the reload.
+    assert sum(summarizer.calls) == 6
+
+
+def test_someone_elses_session_is_neither_read_nor_extended():
+    turns = [Turn(True, "owner's question", "m0"), Turn(False, "owner's answer", "m1")]
+    owner = {"s": "owner"}
+    loaded = []
+
+    async def load_turns(session_id, user_id, limit):
+        loaded.append(user_id)
+        return turns if owner[session_id] == user_id else []
+
+    async def latest_id(session_id, user_id):
+        return turns[-1].id if owner[session_id] == user_id else None
+
+    builder = ContextBuilder(load_turns, Summarizer(), latest_id=latest_id)
+
+    async def run():
+        await builder.build("s", "owner", "q1")
+        intruder = await builder.build("s", "intruder", "q2")
+        builder.record("s", "intruder", "q2", "intruder's answer")
+        return intruder, await builder.build("s", "owner", "q3")
+
+    intruder, owners = asyncio.run(run())
+    assert not intruder.has_history and "owner's" not in intruder.prompt
+    assert "intruder" not in owners.prompt and "fynqAI: owner's answer" in owners.prompt
+    assert loaded == ["owner", "intruder"]
+
+
+def test_cached_turns_with_nothing_stored_are_reloaded():
+    turns = history(2)
+    loader = Loader(turns)
+    stored = [None]
+
+    async def latest_id(session_id, user_id):
+        return stored[0]
+
+    builder = ContextBuilder(loader, Summarizer(), latest_id=latest_id)
+
+    async def run():
+        await builder.build("s", "u", "q1")
+        # The session's history was deleted, e.g. the chat was cleared.
+        turns.clear()
+        return await builder.build("s", "u", "q2")
+
+    assert asyncio.run(run()).prompt == "q2"
+    assert loader.calls == 2
+
+
+def test_chat_message_sends_session_history():
+    seen = []
+    backend = FakeBackend(reply=lambda p: seen.append(p) or "answer")
+    builder = ContextBuilder(Loader([Turn(True, "earlier question"), Turn(False, "earlier answer")]), Summarizer())
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(backend)
+    app.dependency_overrides[get_context_builder] = lambda: builder
+    try:
+        response = TestClient(app).post(
+            "/api/v1/chat/message",
+            json={"message": "and now?", "chat_id": "session-1"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert "Student: earlier question" in seen[0]
@@ -0,0 +1,118 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from db import list_messages, list_sessions
+from main import app, get_database
+from tokens import TEST_USER_ID as USER, auth_headers
+OTHER = "22222222-2222-2222-2222-222222222222"
+
+
+def ts(i: int) -> str:
+    return f"2025-07-{1 + i // 86400:02d}T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.000Z"
+
+
+def seed(db, session_id, user_id, count, updated=0):
+    asyncio.run(db.execute(
+        "INSERT INTO chat_sessions (id, user_id, title, updated_at) VALUES (:id, :user_id, :title, :updated_at)",
+        {"id": session_id, "user_id": user_id, "title": f"Session {session_id}", "updated_at": ts(updated)},
+    ))
+    if count:
+        asyncio.run(db.execute(
+            "INSERT INTO messages (id, session_id, content, is_user, created_at)"
+            " VALUES (:id, :session_id, :content, :is_user, :created_at)",
+            [
+                # Pairs of messages share a timestamp so the id tie-breaker is exercised.
+                {"id": f"{session_id}-{i:05d}", "session_id": session_id, "content": f"message {i}",
+                 "is_user": i % 2 == 0, "created_at": ts(i // 2)}
+                for i in range(count)
+            ],
+        ))
+
+
+def test_message_pages_walk_back_without_gaps(db):
+    seed(db, "s1", USER, 125)
+    seen = []
+    cursor = None
+    while True:
+        page = asyncio.run(list_messages(db, USER, "s1", limit=50, cursor=cursor))
+        seen = [m["content"] for m in page["messages"]] + seen
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"message {i}" for i in range(125)]
+
+
+def test_first_page_is_latest_messages_oldest_first(db):
+    seed(db, "s1", USER, 10)
+    page = asyncio.run(list_messages(db, USER, "s1", limit=3))
+    assert [m["content"] for m in page["messages"]] == ["message 7", "message 8", "message 9"]
+    assert page["messages"][0] == {
+        "id": "s1-00007", "content": "message 7", "sender": "bot", "created_at": ts(3),
+    }
+
+
+def test_other_users_session_is_empty(db):
+    seed(db, "s1", USER, 5)
+    page = asyncio.run(list_messages(db, OTHER, "s1"))
+    assert page == {"messages": [], "next_cursor": None}
+
+
+def test_sessions_most_recent_first_and_archived_hidden(db):
+    for i in range(5):
+        seed(db, f"s{i}", USER, 0, updated=i)
+    seed(db, "other", OTHER, 0, updated=10)
+    asyncio.run(db.execute("UPDATE chat_sessions SET is_archived = 1 WHERE id = 's4'"))
+
+    first = asyncio.run(list_sessions(db, USER, limit=2))
+    assert [s["id"] for s in first["sessions"]] == ["s3", "s2"]
+    second = asyncio.run(list_sessions(db, USER, limit=2, cursor=first["next_cursor"]))
+    assert [s["id"] for s in second["sessions"]] == ["s1", "s0"]
+    assert second["next_cursor"] is None
+
+    archived = asyncio.run(list_sessions(db, USER, include_archived=True))
+    assert archived["sessions"][0]["id"] == "s4"
+
+
+def test_page_cost_does_not_grow_with_session_length(db):
+    seed(db, "short", USER, 20)
+    seed(db, "long", USER, 2000)
+
+    def best_of(session_id):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            asyncio.run(list_messages(db, USER, session_id, limit=20))
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    assert best_of("long") < best_of("short") * 5 + 0.005
+
+
+def test_history_endpoint(db):
+    seed(db, "s1", USER, 3)
+    app.dependency_overrides[get_database] = lambda: db
+    try:
+        client = TestClient(app)
+        response = client.get(
+            "/api/v1/chat/history",
+            params={"session_id": "s1", "limit": 2},
+            headers=auth_headers(),
+        )
+        bad_cursor = client.get(
+            "/api/v1/chat/history",
+            params={"session_id": "s1", "cursor": "not-a-cursor"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["content"] for m in body["messages"]] == ["message 1", "message 2"]
+    assert body["next_cursor"]
+    assert bad_cursor.status_code == 400
@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from images import ImagePipeline, ImageRejected, read_capped, sniff_image_type
+from llm import FakeBackend, LLMClient
+from main import app, get_image_pipeline, get_llm_client
+from tokens import auth_headers
+
+
+class Upload:
+    """Minimal stand-in for UploadFile."""
+
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+        self.reads = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return self.stream.read(size)
+
+
+def photo(width=4000, height=3000, format="JPEG") -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 180, 160)).save(out, format=format)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("head,expected", [
+    (b"\xff\xd8\xff\xe0" + b"0" * 12, "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n" + b"0" * 8, "image/png"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\x00\x00\x00\x18ftypheic\x00\x00", "image/heic"),
+    (b"not an image....", None),
+])
+def test_sniff_image_type(head, expected):
+    assert sniff_image_type(head) == expected
+
+
+def test_read_capped_stops_at_the_cap():
+    upload = Upload(b"0" * 1000)
+    with pytest.raises(ImageRejected, match="File too large"):
+        asyncio.run(read_capped(upload, max_bytes=100, chunk_size=10))
+    # It gave up right after crossing the cap instead of reading everything.
+    assert upload.reads == 11
+
+
+def test_large_photo_is_downscaled_in_process_pool():
+    pipeline = ImagePipeline(max_side=1024, workers=1)
+    try:
+        prepared = asyncio.run(pipeline.prepare(Upload(photo())))
+    finally:
+        pipeline.shutdown()
+    assert (prepared.width, prepared.height) == (1024, 768)
+    assert prepared.mime_type == "image/jpeg"
+    assert len(prepared.data) < prepared.original_bytes
+
+
+def test_png_diagrams_stay_png():
+    pipeline = ImagePipeline(max_side=256, workers=0)
+    prepared = asyncio.run(pipeline.prepare(Upload(photo(1000, 500, "PNG"))))
+    assert prepared.mime_type == "image/png"
+    assert (prepared.width, prepared.height) == (256, 128)
+
+
+def test_same_photo_is_processed_once():
+    pipeline = ImagePipeline(workers=0)
+    data = photo(800, 600)
+
+    async def run():
+        first = await pipeline.prepare(Upload(data))
+        second = await pipeline.prepare(Upload(data))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert (pipeline.hits, pipeline.misses) == (1, 1)
+
+
+def test_corrupt_image_is_rejected():
+    pipeline = ImagePipeline(workers=0)
+    with pytest.raises(ImageRejected, match="Invalid image"):
+        asyncio.run(pipeline.prepare(Upload(b"\xff\xd8\xff\xe0" + b"0" * 100)))
+
+
+def test_oversized_body_is_refused_before_it_is_read():
+    body = b"x" * (6 * 1024 * 1024)
+    response = TestClient(app).post(
+        "/api/v1/chat/image",
+        content=body,
+        headers={**auth_headers(), "Content-Type": "multipart/form-data; boundary=x",
+                 "Origin": "http://localhost:8080"},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "File too large"}
+    # The browser can only read the reason if the refusal carries CORS headers.
+    assert response.headers["access-control-allow-origin"] == "http://localhost:8080"
+
+
+def test_chat_image_sends_prepared_image_to_model():
+    backend = FakeBackend(reply="The answer is 42.")
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(backend)
+    app.dependency_overrides[get_image_pipeline] = lambda: ImagePipeline(max_side=512, workers=0)
+    try:
+        response = TestClient(app).post(
+            "/api/v1/chat/image",
+            files={"image": ("worksheet.jpg", photo(), "image/jpeg")},
+            data={"message": "Solve question 3"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"] == "The answer is 42."
+    assert (body["image"]["width"], body["image"]["height"]) == (512, 384)
+    assert backend.images_seen == 1
@@ -0,0 +1,183 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from db import MessageWriter
+from jobs import FAILED, QUEUED, SUCCEEDED, InMemoryBroker, InMemoryJobStore, Job, JobRunner
+from llm import FakeBackend, LLMClient
+from main import app, get_job_broker, get_job_store, get_message_writer, get_upload_service
+from storage import LocalStorage
+from tokens import TEST_USER_ID, auth_headers
+from uploads import UploadService
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path / "storage"))
+
+
+def test_broker_runs_higher_priority_first():
+    order = []
+
+    async def run(job_id):
+        order.append(job_id)
+
+    async def main():
+        broker = InMemoryBroker(run, workers=1)
+        for priority in ("low", "normal", "high"):
+            await broker.submit(Job(priority, "u", "q", priority=priority))
+        await broker.join()
+        await broker.aclose()
+
+    asyncio.run(main())
+    assert order == ["high", "normal", "low"]
+
+
+def test_runner_stores_answer_and_failure(storage):
+    def reply(prompt):
+        if prompt == "bad":
+            raise RuntimeError("quota exceeded")
+        return f"answer to {prompt}"
+
+    store = InMemoryJobStore()
+    runner = JobRunner(LLMClient(FakeBackend(reply=reply)), store, storage)
+
+    async def main():
+        await store.put(Job("a", "u", "good"))
+        await store.put(Job("b", "u", "bad"))
+        await runner.run("a")
+        await runner.run("b")
+        return await store.get("a"), await store.get("b")
+
+    good, bad = asyncio.run(main())
+    assert good.status == SUCCEEDED
+    assert good.result["response"] == "answer to good"
+    assert good.finished_at is not None
+    assert bad.status == FAILED
+    assert bad.error == "quota exceeded"
+
+
+def test_redelivered_job_is_not_run_twice(storage):
+    backend = FakeBackend()
+    store = InMemoryJobStore()
+    runner = JobRunner(LLMClient(backend, coalesce=False), store, storage)
+
+    async def main():
+        await store.put(Job("a", "u", "q"))
+        await runner.run("a")
+        await runner.run("a")
+
+    asyncio.run(main())
+    assert backend.calls == 1
+
+
+def test_wait_returns_when_job_finishes_or_times_out():
+    store = InMemoryJobStore()
+
+    async def main():
+        await store.put(Job("a", "u", "q"))
+        pending = await store.wait("a", 0.01)
+
+        async def finish():
+            await asyncio.sleep(0.01)
+            await store.put(Job("a", "u", "q", status=SUCCEEDED))
+
+        finisher = asyncio.create_task(finish())
+        finished = await store.wait("a", 5)
+        await finisher
+        return pending, finished
+
+    pending, finished = asyncio.run(main())
+    assert pending.status == QUEUED
+    assert finished.status == SUCCEEDED
+
+
+def test_store_forgets_expired_jobs():
+    now = [0.0]
+    store = InMemoryJobStore(ttl=10, clock=lambda: now[0])
+    asyncio.run(store.put(Job("a", "u", "q")))
+    now[0] = 11
+    assert asyncio.run(store.get("a")) is None
+
+
+@pytest.fixture
+def job_app(storage):
+    backend = FakeBackend(reply=lambda prompt: f"solved: {prompt}", latency=0.01)
+    store = InMemoryJobStore()
+    broker = InMemoryBroker(JobRunner(LLMClient(backend), store, storage).run)
+    app.dependency_overrides[get_job_store] = lambda: store
+    app.dependency_overrides[get_job_broker] = lambda: broker
+    app.dependency_overrides[get_upload_service] = lambda: UploadService(storage)
+    # One client for the whole test so in-process workers share its event loop.
+    with TestClient(app) as client:
+        yield client, backend
+    app.dependency_overrides.clear()
+
+
+def test_submit_then_wait_for_result(job_app):
+    client, _ = job_app
+    submitted = client.post("/api/v1/jobs", json={"message": "integrate x^2", "priority": "low"},
+                            headers=auth_headers())
+    assert submitted.status_code == 202
+    assert submitted.json()["status"] == QUEUED
+    job_id = submitted.json()["job_id"]
+
+    job = client.get(f"/api/v1/jobs/{job_id}?wait=5", headers=auth_headers()).json()
+    assert job["status"] == SUCCEEDED
+    assert job["priority"] == "low"
+    assert job["result"]["response"] == "solved: integrate x^2"
+
+    other = auth_headers("22222222-2222-2222-2222-222222222222")
+    assert client.get(f"/api/v1/jobs/{job_id}", headers=other).status_code == 404
+
+
+def test_image_job_reads_prepared_image_from_storage(job_app):
+    client, backend = job_app
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (255, 255, 255)).save(out, format="PNG")
+    submitted = client.post(
+        "/api/v1/jobs/image",
+        files={"image": ("worksheet.png", out.getvalue(), "image/png")},
+        data={"message": "solve question 3"},
+        headers=auth_headers(),
+    )
+    assert submitted.status_code == 202
+    job = client.get(f"/api/v1/jobs/{submitted.json()['job_id']}?wait=5", headers=auth_headers()).json()
+    assert job["status"] == SUCCEEDED
+    assert backend.images_seen == 1
+
+
+def test_unknown_priority_is_rejected(job_app):
+    client, _ = job_app
+    response = client.post("/api/v1/jobs", json={"message": "q", "priority": "urgent"}, headers=auth_headers())
+    assert response.status_code == 422
+
+
+def test_job_question_and_answer_are_saved_to_the_chat(storage, db):
+    session = "33333333-3333-3333-3333-333333333333"
+    asyncio.run(db.execute("INSERT INTO chat_sessions (id, user_id) VALUES (:id, :user_id)",
+                           {"id": session, "user_id": TEST_USER_ID}))
+    writer = MessageWriter(lambda: db)
+    store = InMemoryJobStore()
+    broker = InMemoryBroker(JobRunner(LLMClient(FakeBackend(reply="x^3/3 + C")), store, storage, writer=writer).run)
+    app.dependency_overrides[get_job_store] = lambda: store
+    app.dependency_overrides[get_job_broker] = lambda: broker
+    app.dependency_overrides[get_message_writer] = lambda: writer
+    try:
+        with TestClient(app) as client:
+            submitted = client.post("/api/v1/jobs", json={"message": "integrate x^2", "chat_id": session},
+                                    headers=auth_headers())
+            job = client.get(f"/api/v1/jobs/{submitted.json()['job_id']}?wait=5", headers=auth_headers()).json()
+    finally:
+        app.dependency_overrides.clear()
+    asyncio.run(writer.flush())
+    rows = asyncio.run(db.fetch_all("SELECT id, content, is_user FROM messages ORDER BY created_at"))
+    assert [(r["content"], bool(r["is_user"])) for r in rows] == [("integrate x^2", True), ("x^3/3 + C", False)]
+    assert job["result"]["message_ids"] == {"user": rows[0]["id"], "bot": rows[1]["id"]}
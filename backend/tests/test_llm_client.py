@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from llm import ClientDisconnected, FakeBackend, LLMClient, LLMTimeoutError
+from main import app, get_llm_client
+from tokens import auth_headers
+
+
+def test_generate_returns_backend_text():
+    client = LLMClient(FakeBackend(reply=lambda p: p.upper()))
+    response = asyncio.run(client.generate("hello"))
+    assert response.text == "HELLO"
+    assert response.model == "fake"
+
+
+def test_concurrency_is_bounded():
+    backend = FakeBackend(latency=0.02)
+    client = LLMClient(backend, max_concurrency=3)
+
+    async def burst():
+        await asyncio.gather(*(client.generate(f"q{i}") for i in range(10)))
+
+    asyncio.run(burst())
+    assert backend.calls == 10
+    assert backend.max_in_flight == 3
+
+
+def test_throughput_scales_with_concurrency():
+    backend = FakeBackend(latency=0.1)
+    client = LLMClient(backend, max_concurrency=20)
+
+    async def burst():
+        start = time.perf_counter()
+        await asyncio.gather(*(client.generate(f"q{i}") for i in range(20)))
+        return time.perf_counter() - start
+
+    # 20 sequential calls would take 2s; overlapped they take ~one round trip.
+    assert asyncio.run(burst()) < 0.5
+
+
+def test_timeout_cancels_upstream_call():
+    backend = FakeBackend(latency=1.0)
+    client = LLMClient(backend, timeout=0.05)
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(client.generate("slow"))
+
+
+def test_disconnect_cancels_upstream_call():
+    backend = FakeBackend(latency=1.0)
+    client = LLMClient(backend, poll_interval=0.01)
+
+    async def gone():
+        return True
+
+    async def run():
+        with pytest.raises(ClientDisconnected):
+            await client.generate("q", is_disconnected=gone)
+        await asyncio.sleep(0.01)
+        return backend.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_chat_message_uses_injected_client():
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply="x = 2 or x = 4"))
+    try:
+        response = TestClient(app).post(
+            "/api/v1/chat/message",
+            json={"message": "roots of x^2 - 6x + 8 = 0"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert response.json()["response"] == "x = 2 or x = 4"
+
+
+def test_chat_message_timeout_is_504():
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(latency=1.0), timeout=0.05)
+    try:
+        response = TestClient(app).post(
+            "/api/v1/chat/message",
+            json={"message": "hi"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 504
+
+
+def test_fake_backend_error_rate_is_repeatable():
+    async def outcomes(seed):
+        client = LLMClient(FakeBackend(error_rate=0.3, seed=seed), coalesce=False)
+        results = []
+        for i in range(50):
+            try:
+                await client.generate(f"q{i}")
+                results.append(True)
+            except RuntimeError:
+                results.append(False)
+        return results
+
+    first, second = asyncio.run(outcomes(7)), asyncio.run(outcomes(7))
+    assert first == second
+    assert 5 < first.count(False) < 25
@@ -4,16 +4,11 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
 
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app
+from main import app
+from tokens import auth_headers
 
 client = TestClient(app)
 
-# Dummy JWT for testing (should match your backend's secret for real tests)
-DUMMY_JWT = "Bearer test.jwt.token"
-
-def auth_headers():
-    return {"Authorization": DUMMY_JWT}
-
 def test_root():
     response = client.get("/")
     assert response.status_code == 200
@@ -63,7 +58,7 @@ def test_files_upload_valid(tmp_path):
             files={"file": ("small.jpg", f, "image/jpeg")},
             headers=auth_headers()
         )
-    # Will fail unless DUMMY_JWT is valid and Supabase is configured, but should not be 400/403
+    # Will fail unless Supabase is configured, but should not be 400/403
     assert response.status_code in (200, 500)
 
 def test_chat_image_unauthenticated(tmp_path):
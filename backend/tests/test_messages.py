@@ -0,0 +1,154 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from db import Database, MessageWriter
+import main
+from main import app, get_message_writer, load_recent_turns
+from tokens import TEST_USER_ID as USER, auth_headers
+
+SESSION = "33333333-3333-3333-3333-333333333333"
+OTHER_SESSION = "44444444-4444-4444-4444-444444444444"
+
+
+@pytest.fixture
+def db(db):
+    asyncio.run(db.execute(
+        "INSERT INTO chat_sessions (id, user_id, updated_at) VALUES (:id, :user_id, :updated_at)",
+        [
+            {"id": SESSION, "user_id": USER, "updated_at": "2025-07-01T00:00:00.000Z"},
+            {"id": OTHER_SESSION, "user_id": "someone-else", "updated_at": "2025-07-01T00:00:00.000Z"},
+        ],
+    ))
+    return db
+
+
+def rows(db, session_id=SESSION):
+    return asyncio.run(db.fetch_all(
+        "SELECT id, content, is_user, created_at FROM messages WHERE session_id = :s ORDER BY created_at, id",
+        {"s": session_id},
+    ))
+
+
+def updated_at(db, session_id=SESSION):
+    found = asyncio.run(db.fetch_all("SELECT updated_at FROM chat_sessions WHERE id = :s", {"s": session_id}))
+    return found[0]["updated_at"]
+
+
+def test_batch_is_one_transaction_in_order(db):
+    writer = MessageWriter(lambda: db)
+    ids = [writer.add(SESSION, USER, f"message {i}", i % 2 == 0) for i in range(5)]
+    asyncio.run(writer.flush())
+    saved = rows(db)
+    assert [r["id"] for r in saved] == ids
+    assert [r["content"] for r in saved] == [f"message {i}" for i in range(5)]
+    assert writer.stats() == {"pending": 0, "written": 5, "batches": 1, "failures": 0, "dropped": 0}
+    assert updated_at(db) == saved[-1]["created_at"]
+
+
+def test_full_batch_is_written_without_waiting_for_the_timer(db):
+    writer = MessageWriter(lambda: db, batch_size=3, flush_interval=60)
+
+    async def main():
+        await writer.start()
+        for i in range(3):
+            writer.add(SESSION, USER, f"message {i}", True)
+        for _ in range(100):
+            if not writer.pending:
+                break
+            await asyncio.sleep(0.01)
+        await writer.aclose()
+
+    asyncio.run(main())
+    assert len(rows(db)) == 3
+    assert writer.batches == 1
+
+
+def test_messages_only_land_in_the_users_own_sessions(db):
+    writer = MessageWriter(lambda: db)
+    writer.add(OTHER_SESSION, USER, "sneaky", True)
+    asyncio.run(writer.flush())
+    assert rows(db, OTHER_SESSION) == []
+    assert updated_at(db, OTHER_SESSION) == "2025-07-01T00:00:00.000Z"
+
+
+def test_rejected_row_is_dropped_and_the_rest_written(db):
+    writer = MessageWriter(lambda: db)
+    writer.add(SESSION, USER, "fine", True)
+    writer.add(SESSION, USER, None, False)  # violates NOT NULL
+    writer.add(SESSION, USER, "also fine", True)
+    asyncio.run(writer.flush())
+    assert [r["content"] for r in rows(db)] == ["fine", "also fine"]
+    assert writer.dropped == 1
+
+
+def test_unwritten_messages_survive_shutdown(db, tmp_path):
+    spill = str(tmp_path / "spill.jsonl")
+    down = Database(f"sqlite:///{tmp_path / 'missing' / 'down.db'}")
+    writer = MessageWriter(lambda: down, spill_path=spill, shutdown_timeout=1)
+    first = writer.add(SESSION, USER, "question", True)
+    writer.add(SESSION, USER, "answer", False)
+    asyncio.run(writer.aclose())
+    with open(spill) as f:
+        assert json.loads(f.readline())["id"] == first
+
+    restarted = MessageWriter(lambda: db, spill_path=spill)
+
+    async def main():
+        await restarted.start()
+        await restarted.flush()
+        await restarted.aclose()
+
+    asyncio.run(main())
+    assert [r["content"] for r in rows(db)] == ["question", "answer"]
+    assert not os.path.exists(spill)
+
+
+@pytest.fixture
+def writer(db):
+    writer = MessageWriter(lambda: db)
+    app.dependency_overrides[get_message_writer] = lambda: writer
+    yield writer
+    app.dependency_overrides.clear()
+
+
+def test_chat_message_saves_question_and_answer(db, writer):
+    client = TestClient(app)
+    response = client.post("/api/v1/chat/message", json={"message": "unit of torque?", "chat_id": SESSION},
+                           headers=auth_headers())
+    ids = response.json()["message_ids"]
+    asyncio.run(writer.flush())
+    saved = rows(db)
+    assert [(r["id"], bool(r["is_user"])) for r in saved] == [(ids["user"], True), (ids["bot"], False)]
+    assert saved[1]["content"] == response.json()["response"]
+
+    # Without a session there is nothing to save into.
+    response = client.post("/api/v1/chat/message", json={"message": "hi"}, headers=auth_headers())
+    assert "message_ids" not in response.json()
+
+
+def test_streamed_answer_is_saved_once_complete(db, writer):
+    with TestClient(app).stream("POST", "/api/v1/chat/stream", json={"message": "hi", "chat_id": SESSION},
+                                headers=auth_headers()) as response:
+        body = response.read().decode()
+    done = json.loads(body.split("event: done\ndata: ")[1].split("\n")[0])
+    asyncio.run(writer.flush())
+    assert [r["id"] for r in rows(db)] == [done["message_ids"]["user"], done["message_ids"]["bot"]]
+
+
+def test_context_sees_turns_still_waiting_to_be_written(db, monkeypatch):
+    writer = MessageWriter(lambda: db)
+    monkeypatch.setattr(main, "message_writer", writer)
+    monkeypatch.setattr(main, "_database", db)
+    writer.add(SESSION, USER, "stored question", True)
+    asyncio.run(writer.flush())
+    queued = writer.add(SESSION, USER, "queued answer", False)
+    turns = asyncio.run(load_recent_turns(SESSION, USER, 10))
+    assert [(t.text, t.id) for t in turns][-1] == ("queued answer", queued)
+    assert [t.text for t in turns] == ["stored question", "queued answer"]
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from llm import FakeBackend, LLMClient
+from main import app, get_llm_client
+from metrics import Registry, LoopLagMonitor
+from tokens import auth_headers
+
+
+def sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not in output")
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("t_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.labels("auth").observe(value)
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert sample(text, 't_seconds_bucket{stage="auth",le="0.1"}') == 1
+    assert sample(text, 't_seconds_bucket{stage="auth",le="1.0"}') == 3
+    assert sample(text, 't_seconds_bucket{stage="auth",le="+Inf"}') == 4
+    assert sample(text, 't_seconds_count{stage="auth"}') == 4
+    assert sample(text, 't_seconds_sum{stage="auth"}') == 6.05
+
+
+def test_collected_values_are_read_at_scrape_time():
+    registry = Registry()
+    hits = {"n": 0}
+    registry.collected("t_hits_total", "Test.", lambda: {("hit",): hits["n"]}, ("result",), type="counter")
+    hits["n"] = 7
+    assert sample(registry.render(), 't_hits_total{result="hit"}') == 7
+
+
+def test_loop_lag_monitor_sees_a_blocked_loop():
+    registry = Registry()
+    histogram = registry.histogram("t_lag_seconds", "Test.", buckets=(0.05,))
+    monitor = LoopLagMonitor(interval=0.01, histogram=histogram)
+
+    async def main():
+        await monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # blocks the loop
+        await asyncio.sleep(0.02)
+        await monitor.aclose()
+
+    asyncio.run(main())
+    text = registry.render()
+    assert sample(text, "t_lag_seconds_count") > sample(text, 't_lag_seconds_bucket{le="0.05"}')
+
+
+def test_chat_request_shows_up_in_metrics():
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend())
+    try:
+        client = TestClient(app)
+        before = client.get("/metrics").text
+        response = client.post("/api/v1/chat/message", json={"message": "metrics?"}, headers=auth_headers())
+        after = client.get("/metrics")
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert after.headers["content-type"].startswith("text/plain; version=0.0.4")
+    route = 'fynq_http_request_seconds_count{app="api",route="/api/v1/chat/message",method="POST",status="200"}'
+    assert route in after.text
+    for name in ("auth", "admission", "prompt", "upstream", "serialize"):
+        key = f'fynq_stage_seconds_count{{stage="{name}"}}'
+        assert sample(after.text, key) == (sample(before, key) if key in before else 0) + 1
+    assert 'fynq_llm_tokens_total{kind="output"}' in after.text
+    assert "fynq_http_requests_in_flight" in after.text
+
+
+def test_upstream_timings_are_observed():
+    seen = []
+    client = LLMClient(FakeBackend(reply="abcdef", chunk_size=2, latency=0.01),
+                       observe=lambda phase, seconds: seen.append(phase))
+
+    async def main():
+        await client.generate("q")
+        async for _ in client.stream("other q"):
+            pass
+
+    asyncio.run(main())
+    assert seen == ["queue_wait", "first_token", "total"] * 2
+    assert client.in_flight == 0
@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from db import get_survey_response
+from llm import FakeBackend, LLMClient
+from main import app, get_llm_client, get_personalization
+from personalization import PROFILE_HEADER, PersonalizationCache, compile_fragment, personalize
+from tokens import TEST_USER_ID as USER, auth_headers
+
+SURVEY = {
+    "learning_approach": "visual",
+    "challenging_subject": "mathematics",
+    "math_hurdle": "not_specified",
+    "mistake_reaction": "not_specified",
+    "feedback_preference": "step_by_step",
+    "study_time": "1_to_2",
+    "lesson_preference": "not_specified",
+    "revision_method": "not_specified",
+    "gamification_preference": "not_specified",
+    "understanding_check": "not_specified",
+    "summary": None,
+}
+
+
+@pytest.fixture
+def db(db):
+    asyncio.run(db.execute(
+        "INSERT INTO survey_responses (id, user_id, learning_approach, challenging_subject, math_hurdle,"
+        " mistake_reaction, feedback_preference, study_time, lesson_preference, revision_method,"
+        " gamification_preference, understanding_check, summary) VALUES ('s1', :user_id, :learning_approach,"
+        " :challenging_subject, :math_hurdle, :mistake_reaction, :feedback_preference, :study_time,"
+        " :lesson_preference, :revision_method, :gamification_preference, :understanding_check, :summary)",
+        {**SURVEY, "user_id": USER},
+    ))
+    return db
+
+
+class CountingLoad:
+    def __init__(self, db):
+        self.db = db
+        self.calls = 0
+
+    async def __call__(self, user_id):
+        self.calls += 1
+        return await get_survey_response(self.db, user_id)
+
+
+def test_survey_compiles_to_short_lines():
+    fragment = compile_fragment(SURVEY)
+    assert fragment.splitlines() == [
+        "Prefers visual explanations: describe diagrams, graphs and tables.",
+        "Finds mathematics hardest.",
+        "Wants step-by-step guidance.",
+        "Studies 1-2 hours a day.",
+    ]
+    assert compile_fragment(None) == ""
+    # Free-text answers are kept to a single bounded line.
+    assert compile_fragment({"math_hurdle": "word\nproblems " * 50}) == "Main maths hurdle: " + ("word problems " * 6)[:80] + "."
+
+
+def test_fragment_is_loaded_once_then_served_from_memory(db):
+    load = CountingLoad(db)
+    cache = PersonalizationCache(load)
+
+    async def main():
+        return await asyncio.gather(*(cache.get(USER) for _ in range(5))), await cache.get(USER)
+
+    fragments, again = asyncio.run(main())
+    assert set(fragments) == {again} and again.startswith("Prefers visual")
+    assert load.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_survey_is_reloaded_after_invalidation(db):
+    load = CountingLoad(db)
+    cache = PersonalizationCache(load)
+    assert "visual" in asyncio.run(cache.get(USER))
+    asyncio.run(db.execute("UPDATE survey_responses SET learning_approach = 'hands_on' WHERE user_id = :u", {"u": USER}))
+    assert "visual" in asyncio.run(cache.get(USER))  # not told yet
+    asyncio.run(cache.invalidate(USER))
+    assert asyncio.run(cache.get(USER)).startswith("Learns by doing")
+    assert load.calls == 2
+
+
+def test_missing_survey_is_cached_and_expires(db):
+    now = [0.0]
+    load = CountingLoad(db)
+    cache = PersonalizationCache(load, ttl=60, clock=lambda: now[0])
+    assert asyncio.run(cache.get("no-survey")) == ""
+    assert asyncio.run(cache.get("no-survey")) == ""
+    assert load.calls == 1
+    now[0] = 61
+    asyncio.run(cache.get("no-survey"))
+    assert load.calls == 2
+
+
+def test_load_failure_means_no_personalization():
+    async def broken(user_id):
+        raise RuntimeError("database down")
+
+    cache = PersonalizationCache(broken)
+    assert asyncio.run(cache.get(USER)) == ""
+    assert asyncio.run(cache.get(USER)) == ""
+    assert cache.misses == 2  # not cached
+
+
+def test_profile_goes_in_front_of_the_question():
+    prompt = personalize("Wants step-by-step guidance.", "unit of torque?")
+    assert prompt == f"{PROFILE_HEADER}\nWants step-by-step guidance.\n\n[Current question]\nunit of torque?"
+    assert personalize("", "unit of torque?") == "unit of torque?"
+
+
+def test_chat_prompt_carries_the_profile(db):
+    app.dependency_overrides[get_personalization] = lambda: PersonalizationCache(lambda user_id: get_survey_response(db, user_id))
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply=lambda prompt: prompt), cache=None)
+    try:
+        response = TestClient(app).post("/api/v1/chat/message", json={"message": "unit of torque?"},
+                                        headers=auth_headers())
+    finally:
+        app.dependency_overrides.clear()
+    assert response.json()["response"].startswith(f"{PROFILE_HEADER}\nPrefers visual explanations")
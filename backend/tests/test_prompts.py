@@ -0,0 +1,65 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+
+import pytest
+
+from llm import FakeBackend, LLMClient, PromptRegistry, ResponseCache
+
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "..", "prompt.txt")
+
+
+def test_register_loads_and_versions_prompt():
+    registry = PromptRegistry()
+    prompt = registry.register("tutor", PROMPT_PATH)
+    assert registry.get("tutor") is prompt
+    assert prompt.version.startswith("tutor@")
+    assert "fynq" in prompt.text
+    assert prompt.tokens > 1000
+
+
+def test_version_changes_with_text():
+    registry = PromptRegistry()
+    first = registry.add("tutor", "Be kind.")
+    second = registry.add("tutor", "Be kind and concise.")
+    assert first.version != second.version
+    assert registry.get("tutor") is second
+
+
+def test_unknown_prompt():
+    with pytest.raises(KeyError):
+        PromptRegistry().get("missing")
+
+
+def test_prompt_version_isolates_cached_answers():
+    cache = ResponseCache()
+    backend = FakeBackend(reply="answer")
+    old = LLMClient(backend, cache=cache, prompt_version="tutor@aaa")
+    new = LLMClient(backend, cache=cache, prompt_version="tutor@bbb")
+
+    async def run():
+        await old.generate("q")
+        return await new.generate("q")
+
+    assert not asyncio.run(run()).cached
+    assert backend.calls == 2
+
+
+def test_usage_shows_context_cache_savings():
+    prompt = PromptRegistry().register("tutor", PROMPT_PATH)
+    plain = LLMClient(FakeBackend(system_prompt=prompt))
+    cached = LLMClient(FakeBackend(system_prompt=prompt, context_cached=True))
+
+    async def run(client):
+        response = await client.generate("What is the unit of torque?")
+        async for _ in client.stream("And of angular momentum?"):
+            pass
+        return response
+
+    assert asyncio.run(run(plain)).usage.cached_input_tokens == 0
+    response = asyncio.run(run(cached))
+    assert response.usage.cached_input_tokens == prompt.tokens
+    assert cached.usage.requests == 2
+    assert cached.usage.as_dict()["cached_input_ratio"] > 0.9
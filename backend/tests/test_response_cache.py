@@ -0,0 +1,114 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+
+from llm import FakeBackend, LLMClient, ResponseCache, normalize_prompt
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DictRedis:
+    """In-memory stand-in for RedisTier."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+
+def test_normalize_prompt_ignores_spacing_and_case():
+    assert normalize_prompt("Roots of  x^2 - 6x + 8 = 0") == normalize_prompt("roots of x^2-6x+8=0")
+    assert normalize_prompt(r"$$\left( x+1 \right)^2$$") == normalize_prompt(r"$(x + 1)^2$")
+    assert normalize_prompt(r"a \, b") == normalize_prompt("a b")
+
+
+def test_normalize_prompt_keeps_latex_command_case():
+    assert normalize_prompt(r"\Delta x") != normalize_prompt(r"\delta x")
+
+
+def test_key_depends_on_model_and_prompt_version():
+    cache = ResponseCache()
+    base = cache.key("q", "gemini-2.5-flash", "v1")
+    assert cache.key("Q ", "gemini-2.5-flash", "v1") == base
+    assert cache.key("q", "gemini-2.5-pro", "v1") != base
+    assert cache.key("q", "gemini-2.5-flash", "v2") != base
+
+
+def test_exact_mode_does_not_normalize():
+    cache = ResponseCache(normalize=False)
+    assert cache.key("Q", "m") != cache.key("q", "m")
+
+
+def test_lru_eviction_and_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+
+    async def run():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        assert await cache.get("a") == "1"  # a is now most recent
+        await cache.set("c", "3")
+        assert await cache.get("b") is None
+        clock.now = 11
+        assert await cache.get("a") is None
+
+    asyncio.run(run())
+    assert cache.evictions == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_client_serves_repeated_question_from_cache():
+    backend = FakeBackend(reply="x = 2 or x = 4")
+    client = LLMClient(backend, cache=ResponseCache())
+
+    async def run():
+        first = await client.generate("roots of x^2 - 6x + 8 = 0")
+        second = await client.generate("Roots of x^2-6x+8=0")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert backend.calls == 1
+    assert not first.cached and second.cached
+    assert second.text == first.text
+
+
+def test_stream_fills_and_uses_cache():
+    backend = FakeBackend(reply="a long answer", chunk_size=3)
+    client = LLMClient(backend, cache=ResponseCache())
+
+    async def run():
+        first = [c async for c in client.stream("q")]
+        second = [c async for c in client.stream("q")]
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert backend.calls == 1
+    assert "".join(first) == "".join(second) == "a long answer"
+
+
+def test_shared_tier_is_shared_between_workers():
+    shared = DictRedis()
+    worker_a = LLMClient(FakeBackend(reply="42"), cache=ResponseCache(shared=shared))
+    backend_b = FakeBackend(reply="42")
+    worker_b = LLMClient(backend_b, cache=ResponseCache(shared=shared))
+
+    async def run():
+        await worker_a.generate("q")
+        return await worker_b.generate("q")
+
+    assert asyncio.run(run()).cached
+    assert backend_b.calls == 0
+    assert worker_b.cache.shared_hits == 1
@@ -0,0 +1,105 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from llm import CircuitBreaker, FakeBackend, LLMClient, RoutingBackend, classify
+from main import app
+
+
+class Scripted(FakeBackend):
+    """A fake whose calls take the given latencies in turn, then none."""
+
+    def __init__(self, delays=(), **kwargs):
+        super().__init__(**kwargs)
+        self.delays = iter(delays)
+
+    async def generate(self, prompt, images=None):
+        self.latency = next(self.delays, 0.0)
+        return await super().generate(prompt, images)
+
+
+def test_classifier_separates_lookups_from_problems():
+    assert classify("what's the unit of torque?") == ("fast", "simple")
+    assert classify(r"Integrate $x^2 \sin x$ with respect to x") == ("strong", "math")
+    assert classify("what is this?", has_images=True) == ("strong", "image")
+    assert classify("Answer these:\n1. define work\n2. define power")[0] == "strong"
+    # Only the current question counts, not the conversation in front of it.
+    prompt = "[Recent conversation]\nStudent: solve \\int x^2 dx = ?\n\n[Current question]\nthanks, what's next?"
+    assert classify(prompt) == ("fast", "simple")
+
+
+def test_questions_go_to_their_tier():
+    fast, strong = FakeBackend(name="lite"), FakeBackend(name="flash")
+    router = RoutingBackend(fast, strong)
+    assert asyncio.run(router.generate("unit of charge?")).model == "lite"
+    assert asyncio.run(router.generate(r"Evaluate $\lim_{x \to 0} \sin x / x$")).model == "flash"
+    assert router.routes == {("fast", "simple"): 1, ("strong", "math"): 1}
+
+
+def test_slow_call_is_hedged_and_backup_wins():
+    fast = Scripted([0.001] * 30 + [2.0, 0.001], name="lite")
+    router = RoutingBackend(fast, FakeBackend(name="flash"), hedge_budget=0.5)
+
+    async def main():
+        for _ in range(30):
+            await router.generate("unit of charge?")
+        start = time.perf_counter()
+        response = await router.generate("unit of charge?")
+        return response, time.perf_counter() - start
+
+    response, elapsed = asyncio.run(main())
+    assert response.model == "lite"
+    assert elapsed < 1.0
+    assert router.hedges == {"fired": 1, "won": 1}
+    assert fast.in_flight == 0  # the slow copy was cancelled
+
+
+def test_failures_fall_back_then_open_the_circuit():
+    fast = FakeBackend(name="lite", error_rate=1.0)
+    strong = FakeBackend(name="flash")
+    router = RoutingBackend(fast, strong, breaker_failures=3)
+
+    async def main():
+        return [(await router.generate("unit of charge?")).model for _ in range(5)]
+
+    assert asyncio.run(main()) == ["flash"] * 5
+    assert fast.calls == 3
+    assert router.fallbacks == 3
+    assert router.routes[("strong", "circuit_open")] == 2
+    assert router.breakers["fast"].is_open
+
+
+def test_stream_falls_back_before_its_first_chunk():
+    router = RoutingBackend(FakeBackend(name="lite", error_rate=1.0), FakeBackend(reply="from flash", name="flash"))
+    client = LLMClient(router, cache=None)
+
+    async def main():
+        return [chunk async for chunk in client.stream("unit of charge?")]
+
+    assert "".join(asyncio.run(main())) == "from flash"
+    assert router.fallbacks == 1
+
+
+def test_breaker_probes_after_reset_and_closes_on_success():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, reset_after=10, clock=lambda: now[0])
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.allow()       # one probe
+    assert not breaker.allow()   # and only one
+    breaker.success()
+    assert breaker.allow() and not breaker.is_open
+
+
+def test_routing_decisions_are_exported():
+    text = TestClient(app).get("/metrics").text
+    assert "# TYPE fynq_llm_routes_total counter" in text
+    assert 'fynq_llm_circuit_open{tier="fast"} 0' in text
@@ -0,0 +1,180 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from db import Database, MessageWriter, search_history, search_text
+from main import app, get_database
+from tokens import TEST_USER_ID as USER, auth_headers
+
+OTHER = "22222222-2222-2222-2222-222222222222"
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+needs_postgres = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def session(db, session_id, user_id=USER, title="New Chat", messages=(), archived=False):
+    asyncio.run(db.execute(
+        "INSERT INTO chat_sessions (id, user_id, title, is_archived, updated_at)"
+        " VALUES (:id, :user_id, :title, :archived, '2025-07-01T00:00:00.000Z')",
+        {"id": session_id, "user_id": user_id, "title": title, "archived": archived},
+    ))
+    if messages:
+        asyncio.run(db.execute(
+            "INSERT INTO messages (id, session_id, content, is_user, created_at)"
+            " VALUES (:id, :session_id, :content, :is_user, :created_at)",
+            [
+                {"id": f"{session_id}-{i:05d}", "session_id": session_id, "content": content,
+                 "is_user": i % 2 == 0, "created_at": f"2025-07-01T00:{i // 60 % 60:02d}:{i % 60:02d}.000Z"}
+                for i, content in enumerate(messages)
+            ],
+        ))
+
+
+def search(db, query, **kwargs):
+    return asyncio.run(search_history(db, USER, query, **kwargs))
+
+
+def test_latex_is_indexed_as_words():
+    text = search_text(r"$\left( \dfrac{\sin\theta}{2} \right)$ and ∫ x dx")
+    assert text.split() == ["(", "frac", "sin", "theta", "2", ")", "and", "int", "x", "dx"]
+
+
+def test_finds_messages_and_titles_of_own_sessions_only(db):
+    session(db, "s1", title="Projectile motion", messages=[
+        "Explain projectile motion", "A projectile follows a parabola when launched at angle θ.",
+    ])
+    session(db, "s2", messages=["What is torque?", "Torque is the turning effect of a force."])
+    session(db, "other", user_id=OTHER, title="Projectile", messages=["projectile homework"])
+
+    results = search(db, "projectiles")["results"]
+    assert {(r["session_id"], r["message_id"]) for r in results} == {("s1", None), ("s1", "s1-00000"), ("s1", "s1-00001")}
+    assert results[0]["message_id"] is None  # titles are weighted up
+    assert [r["session_id"] for r in search(db, "torq")["results"]] == ["s2", "s2"]
+    # Symbols and their LaTeX names find each other.
+    assert [r["message_id"] for r in search(db, r"\theta")["results"]] == ["s1-00001"]
+
+
+def test_layout_commands_do_not_match_words(db):
+    session(db, "s1", messages=[r"$\left( x + 1 \right)^2$", "Turn right at the corner"])
+    assert [r["message_id"] for r in search(db, "right")["results"]] == ["s1-00001"]
+
+
+def test_snippet_is_cut_around_the_match(db):
+    session(db, "s1", messages=["filler " * 60 + "the projectile lands " + "more " * 60])
+    result = search(db, "projectile")["results"][0]
+    assert result["snippet"].startswith("…") and result["snippet"].endswith("…")
+    start, end = result["highlights"][0]
+    assert result["snippet"][start:end] == "projectile"
+    assert result["sender"] == "user"
+
+
+def test_results_page_without_repeats(db):
+    session(db, "s1", messages=[f"velocity question {i}" for i in range(45)], archived=True)
+    assert search(db, "velocity")["results"] == []
+    seen, cursor = [], None
+    while True:
+        page = search(db, "velocity", limit=20, cursor=cursor, include_archived=True)
+        seen += [r["message_id"] for r in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"s1-{i:05d}" for i in range(45)]
+
+
+def test_messages_are_searchable_as_soon_as_written(db):
+    session(db, "33333333-3333-3333-3333-333333333333")
+    writer = MessageWriter(lambda: db)
+    writer.add("33333333-3333-3333-3333-333333333333", USER, "What is angular momentum?", True)
+    assert search(db, "angular")["results"] == []
+    asyncio.run(writer.flush())
+    assert len(search(db, "angular")["results"]) == 1
+    asyncio.run(db.execute("DELETE FROM messages"))
+    assert search(db, "angular")["results"] == []
+
+
+def test_search_is_fast_with_thousands_of_messages(db):
+    topics = ["projectile motion", "torque and rotation", "ohm's law", r"\int x^2 dx", "mole concept"]
+    for s in range(20):
+        session(db, f"s{s}", messages=[f"Question about {topics[i % 5]} number {i}" for i in range(250)])
+    search(db, "rotation")  # warm up
+    start = time.perf_counter()
+    page = search(db, "rotation")
+    assert time.perf_counter() - start < 0.1
+    assert len(page["results"]) == 20 and page["next_cursor"]
+
+
+def test_search_endpoint(db):
+    session(db, "s1", title="Kinematics")
+    app.dependency_overrides[get_database] = lambda: db
+    try:
+        client = TestClient(app)
+        found = client.get("/api/v1/chat/search", params={"q": "kinematic"}, headers=auth_headers())
+        no_words = client.get("/api/v1/chat/search", params={"q": "$$"}, headers=auth_headers())
+    finally:
+        app.dependency_overrides.clear()
+    assert found.status_code == 200
+    assert found.json()["results"][0]["title"] == "Kinematics"
+    assert no_words.status_code == 400
+
+
+@pytest.fixture
+def pg():
+    """Two fresh users on the Postgres at TEST_DATABASE_URL, removed afterwards."""
+    database = Database(TEST_DATABASE_URL)
+    users = [str(uuid.uuid4()), str(uuid.uuid4())]
+    asyncio.run(database.execute("INSERT INTO auth.users (id) VALUES (:id)", [{"id": u} for u in users]))
+    yield database, users
+    asyncio.run(database.execute("DELETE FROM auth.users WHERE id = :id", [{"id": u} for u in users]))
+    database.dispose()
+
+
+def pg_session(db, user_id, title, messages):
+    session_id = str(uuid.uuid4())
+    asyncio.run(db.execute_all([
+        ("INSERT INTO public.chat_sessions (id, user_id, title) VALUES (:id, :user_id, :title)",
+         {"id": session_id, "user_id": user_id, "title": title}),
+        ("INSERT INTO public.messages (session_id, content, is_user) VALUES (:session_id, :content, :is_user)",
+         [{"session_id": session_id, "content": c, "is_user": i % 2 == 0} for i, c in enumerate(messages)]),
+    ]))
+    return session_id
+
+
+@pytest.mark.postgres
+@needs_postgres
+def test_postgres_search_finds_own_messages_only(pg):
+    db, (user, other) = pg
+    mine = pg_session(db, user, "Projectile motion", [
+        "Explain projectile motion", r"It follows a parabola at angle $\theta$.",
+    ])
+    pg_session(db, other, "Projectile", ["projectile homework"])
+    # The trigger copies the session's owner onto each message.
+    rows = asyncio.run(db.fetch_all("SELECT DISTINCT user_id FROM public.messages WHERE session_id = :id", {"id": mine}))
+    assert [str(r["user_id"]) for r in rows] == [user]
+
+    results = asyncio.run(search_history(db, user, "projectiles"))["results"]
+    assert {r["session_id"] for r in results} == {mine}
+    assert len(results) == 2 and results[0]["message_id"] is None
+    assert [r["sender"] for r in asyncio.run(search_history(db, user, "θ"))["results"]] == ["bot"]
+
+
+@pytest.mark.postgres
+@needs_postgres
+def test_postgres_message_search_is_one_user_scoped_index_scan(pg):
+    db, (user, _) = pg
+    pg_session(db, user, "Kinematics", ["velocity question"])
+    with db.engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = conn.execute(text(
+            "EXPLAIN SELECT m.id FROM public.messages m WHERE m.user_id = :user_id"
+            " AND to_tsvector('english', public.fynq_search_text(m.content)) @@ to_tsquery('english', 'velocity')"
+        ), {"user_id": user}).scalars().all()
+    index_cond = next(line for line in plan if "Index Cond" in line)
+    assert "idx_messages_search" in "\n".join(plan)
+    assert "user_id" in index_cond and "@@" in index_cond
@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+
+from llm import FakeBackend, LLMClient, SingleFlight
+
+
+def test_identical_requests_share_one_upstream_call():
+    backend = FakeBackend(reply="x = 2 or x = 4", latency=0.05)
+    client = LLMClient(backend)
+
+    async def burst():
+        return await asyncio.gather(*(client.generate("roots of x^2 - 6x + 8 = 0") for _ in range(30)))
+
+    responses = asyncio.run(burst())
+    assert backend.calls == 1
+    assert {r.text for r in responses} == {"x = 2 or x = 4"}
+    assert client.flights.requests == 30
+    assert client.flights.upstream_calls == 1
+
+
+def test_coalescing_can_be_disabled():
+    backend = FakeBackend(latency=0.01)
+    client = LLMClient(backend, coalesce=False)
+
+    async def burst():
+        await asyncio.gather(*(client.generate("q") for _ in range(5)))
+
+    asyncio.run(burst())
+    assert backend.calls == 5
+
+
+def test_error_reaches_every_waiter():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def burst():
+        return await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flights.upstream_calls == 1
+    assert flights.in_flight() == 0
+
+
+def test_one_waiter_leaving_does_not_cancel_the_others():
+    backend = FakeBackend(reply="done", latency=0.05)
+    client = LLMClient(backend)
+
+    async def run():
+        leaver = asyncio.create_task(client.generate("q"))
+        stayer = asyncio.create_task(client.generate("q"))
+        await asyncio.sleep(0.01)
+        leaver.cancel()
+        return await stayer
+
+    assert asyncio.run(run()).text == "done"
+    assert backend.calls == 1
+
+
+def test_upstream_cancelled_when_every_waiter_leaves():
+    backend = FakeBackend(latency=1.0)
+    client = LLMClient(backend)
+
+    async def run():
+        tasks = [asyncio.create_task(client.generate("q")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0.01)
+        return client.flights.in_flight()
+
+    assert asyncio.run(run()) == 0
+    assert backend.in_flight == 0
+
+
+def test_late_stream_subscriber_gets_full_answer():
+    answer = "concept, steps, boxed answer, practice problem"
+    backend = FakeBackend(reply=answer, chunk_size=4, chunk_delay=0.005)
+    client = LLMClient(backend)
+
+    async def read(delay):
+        await asyncio.sleep(delay)
+        return "".join([c async for c in client.stream("q")])
+
+    async def run():
+        return await asyncio.gather(read(0), read(0.02), read(0.04))
+
+    assert asyncio.run(run()) == [answer] * 3
+    assert backend.calls == 1
+
+
+def test_stream_error_reaches_every_subscriber():
+    def boom(prompt):
+        raise RuntimeError("blocked")
+
+    client = LLMClient(FakeBackend(reply=boom, latency=0.01))
+
+    async def read():
+        return [c async for c in client.stream("q")]
+
+    async def run():
+        return await asyncio.gather(read(), read(), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+
+def test_request_right_after_the_last_waiter_leaves_starts_afresh():
+    flights = SingleFlight()
+
+    async def answer(text, delay):
+        await asyncio.sleep(delay)
+        return text
+
+    async def run():
+        leaver = asyncio.create_task(flights.do("k", lambda: answer("stale", 1.0)))
+        await asyncio.sleep(0.01)
+        leaver.cancel()
+        await asyncio.sleep(0)  # the leaver cancels the call, whose done-callback has not run yet
+        return await flights.do("k", lambda: answer("fresh", 0.01))
+
+    assert asyncio.run(run()) == "fresh"
+    assert flights.upstream_calls == 2
+
+
+def test_stream_subscriber_right_after_the_last_one_leaves_gets_a_full_answer():
+    answer = "concept, steps, boxed answer"
+    backend = FakeBackend(reply=answer, chunk_size=4, chunk_delay=0.01)
+    client = LLMClient(backend)
+
+    async def run():
+        chunks = client.stream("q")
+        await chunks.__anext__()
+        await chunks.aclose()
+        return "".join([c async for c in client.stream("q")])
+
+    assert asyncio.run(run()) == answer
+    assert backend.calls == 2
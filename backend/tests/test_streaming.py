@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from llm import FakeBackend, LLMClient
+from main import app, get_llm_client
+from streaming import sse_stream
+from tokens import auth_headers
+
+
+def parse_events(body: str):
+    events = []
+    for frame in body.split("\n\n"):
+        if frame.startswith("event: "):
+            name, data = frame.split("\n", 1)
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+def test_chat_stream_sends_chunks_then_done():
+    answer = "Step 1: factor. Step 2: x = 2 or x = 4."
+    app.dependency_overrides[get_llm_client] = lambda: LLMClient(FakeBackend(reply=answer, chunk_size=5))
+    try:
+        response = TestClient(app).post(
+            "/api/v1/chat/stream",
+            json={"message": "roots of x^2 - 6x + 8 = 0"},
+            headers=auth_headers(),
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert events[-1] == ("done", {"model": "fake"})
+    assert "".join(data["text"] for name, data in events if name == "chunk") == answer
+    assert len(events) > 2
+
+
+def test_heartbeat_while_waiting_for_first_chunk():
+    client = LLMClient(FakeBackend(latency=0.2))
+    frames = asyncio.run(collect(sse_stream(client.stream("q"), heartbeat=0.05)))
+    assert frames[0] == ": keep-alive\n\n"
+    assert frames[-1].startswith("event: done")
+
+
+def test_upstream_error_becomes_error_event():
+    def boom(prompt):
+        raise RuntimeError("quota exceeded")
+
+    client = LLMClient(FakeBackend(reply=boom))
+    frames = asyncio.run(collect(sse_stream(client.stream("q"))))
+    assert parse_events("".join(frames)) == [("error", {"detail": "quota exceeded"})]
+
+
+def test_disconnect_cancels_upstream():
+    backend = FakeBackend(latency=1.0)
+    client = LLMClient(backend)
+
+    async def gone():
+        return True
+
+    async def run():
+        frames = await collect(sse_stream(client.stream("q"), is_disconnected=gone, heartbeat=0.01))
+        await asyncio.sleep(0.01)
+        return frames
+
+    assert asyncio.run(run()) == []
+    assert backend.in_flight == 0
+
+
+def test_slow_reader_applies_backpressure():
+    backend = FakeBackend(reply="x" * 1000, chunk_size=1)
+    client = LLMClient(backend)
+    produced = []
+
+    async def counting(chunks):
+        async for chunk in chunks:
+            produced.append(chunk)
+            yield chunk
+
+    async def run():
+        stream = sse_stream(counting(client.stream("q")), buffer=4)
+        await anext(stream)
+        await asyncio.sleep(0.05)
+        ahead = len(produced)
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+        return ahead
+
+    # One chunk delivered, at most `buffer` queued and one held by the producer.
+    assert asyncio.run(run()) <= 6
+    assert backend.in_flight == 0
@@ -0,0 +1,134 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+
+import asyncio
+import hashlib
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, get_optional_database, get_upload_service
+from storage import LocalStorage
+from tokens import auth_headers
+from uploads import UploadService, sniff_file_type
+
+PDF = b"%PDF-1.7\n" + bytes(range(256)) * 400
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path / "storage"))
+
+
+@pytest.fixture
+def client(storage, db):
+    app.dependency_overrides[get_upload_service] = lambda: UploadService(storage, chunk_bytes=1024)
+    app.dependency_overrides[get_optional_database] = lambda: db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def objects(storage):
+    return [name for _, _, names in os.walk(os.path.join(storage.root, "objects")) for name in names]
+
+
+def test_sniff_file_type():
+    assert sniff_file_type(PDF[:16]) == "application/pdf"
+    assert sniff_file_type(b"\xff\xd8\xff\xe0" + b"0" * 12) == "image/jpeg"
+    assert sniff_file_type(b"import sys\n") is None
+
+
+def test_single_upload_is_content_addressed_and_deduplicated(client, storage, db):
+    first = client.post("/api/v1/files/upload", files={"file": ("notes.pdf", PDF, "application/pdf")},
+                        headers=auth_headers())
+    second = client.post("/api/v1/files/upload", files={"file": ("copy.pdf", PDF, "application/pdf")},
+                         headers=auth_headers())
+    assert first.status_code == 200 and second.status_code == 200
+    sha256 = hashlib.sha256(PDF).hexdigest()
+    assert first.json()["sha256"] == sha256
+    assert first.json()["file_path"] == f"objects/{sha256[:2]}/{sha256}"
+    assert first.json()["file_type"] == "application/pdf"
+    assert second.json()["deduplicated"] is True
+    assert second.json()["file_id"] == first.json()["file_id"]
+    assert objects(storage) == [sha256]
+    with open(storage.path_for(first.json()["file_path"]), "rb") as f:
+        assert f.read() == PDF
+
+
+def test_rejected_upload_leaves_nothing_behind(client, storage):
+    response = client.post("/api/v1/files/upload", files={"file": ("a.txt", b"hello", "text/plain")},
+                           headers=auth_headers())
+    assert response.status_code == 400
+    assert objects(storage) == []
+    assert os.listdir(os.path.join(storage.root, "partial")) == []
+
+
+def test_resumable_upload_picks_up_after_a_dropped_connection(client, storage):
+    created = client.post("/api/v1/files/uploads", json={"file_name": "book.pdf", "file_size": len(PDF)},
+                          headers=auth_headers())
+    assert created.status_code == 201
+    upload_id = created.json()["upload_id"]
+    url = f"/api/v1/files/uploads/{upload_id}"
+
+    part = client.put(url, content=PDF[:40000], headers={**auth_headers(), "Upload-Offset": "0"})
+    assert part.json() == {**created.json(), "offset": 40000}
+
+    # The retry after the drop starts from the wrong place and is told where to resume.
+    stale = client.put(url, content=PDF[:1000], headers={**auth_headers(), "Upload-Offset": "0"})
+    assert stale.status_code == 409
+    assert stale.json()["offset"] == 40000
+    assert client.get(url, headers=auth_headers()).json()["offset"] == 40000
+
+    done = client.put(url, content=PDF[40000:], headers={**auth_headers(), "Upload-Offset": "40000"})
+    assert done.status_code == 200
+    assert done.json()["complete"] is True
+    assert done.json()["file_size"] == len(PDF)
+    assert done.json()["file_id"]
+    assert objects(storage) == [hashlib.sha256(PDF).hexdigest()]
+    # A client that lost that response learns the result from the status or a resend.
+    assert client.get(url, headers=auth_headers()).json() == done.json()
+    resent = client.put(url, content=PDF[40000:], headers={**auth_headers(), "Upload-Offset": "40000"})
+    assert resent.json() == done.json()
+    assert client.get(url, headers=auth_headers("22222222-2222-2222-2222-222222222222")).status_code == 404
+
+
+def test_resumable_upload_rejects_bytes_past_declared_size(client):
+    upload_id = client.post("/api/v1/files/uploads", json={"file_name": "a.pdf", "file_size": 10},
+                            headers=auth_headers()).json()["upload_id"]
+    response = client.put(f"/api/v1/files/uploads/{upload_id}", content=PDF[:100],
+                          headers={**auth_headers(), "Upload-Offset": "0"})
+    assert response.status_code == 400
+
+
+def test_upload_sessions_are_private(client):
+    upload_id = client.post("/api/v1/files/uploads", json={"file_name": "a.pdf", "file_size": 10},
+                            headers=auth_headers()).json()["upload_id"]
+    other = auth_headers("22222222-2222-2222-2222-222222222222")
+    assert client.get(f"/api/v1/files/uploads/{upload_id}", headers=other).status_code == 404
+    assert client.get("/api/v1/files/uploads/..%2F..%2Fetc", headers=auth_headers()).status_code == 404
+
+
+def test_oversized_resumable_upload_is_refused_up_front(client):
+    response = client.post("/api/v1/files/uploads", json={"file_name": "a.pdf", "file_size": 10 ** 12},
+                           headers=auth_headers())
+    assert response.status_code == 400
+    assert "File too large" in response.text
+
+
+def test_stale_uploads_and_finished_records_are_purged(storage):
+    async def main():
+        await storage.create("a" * 32, {"user_id": "u"})  # abandoned part way
+        await storage.create("b" * 32, {"user_id": "u"})  # finished; only its record is left
+        await storage.commit("b" * 32, hashlib.sha256(b"").hexdigest())
+        await storage.finish("b" * 32, {"user_id": "u", "stored": {"complete": True}})
+        await storage.create("c" * 32, {"user_id": "u"})
+        old = time.time() - 100
+        for name in os.listdir(os.path.join(storage.root, "partial")):
+            if not name.startswith("c"):
+                os.utime(os.path.join(storage.root, "partial", name), (old, old))
+        return await storage.purge_stale(50)
+
+    assert asyncio.run(main()) == 2
+    assert sorted(os.listdir(os.path.join(storage.root, "partial"))) == ["c" * 32, "c" * 32 + ".json"]
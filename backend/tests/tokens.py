@@ -0,0 +1,16 @@
+import os
+import time
+
+from jose import jwt
+
+TEST_USER_ID = "11111111-1111-1111-1111-111111111111"
+
+
+def make_token(sub: str = TEST_USER_ID, expires_in: int = 3600, **claims) -> str:
+    payload = {"sub": sub, "aud": "authenticated", "role": "authenticated",
+               "exp": int(time.time()) + expires_in, **claims}
+    return jwt.encode(payload, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+
+
+def auth_headers(sub: str = TEST_USER_ID) -> dict:
+    return {"Authorization": f"Bearer {make_token(sub)}"}
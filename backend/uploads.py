@@ -0,0 +1,172 @@
+"""Uploads of study material: PDFs and worksheet photos.
+
+Small files come in a single multipart POST. Large ones go through a
+resumable session, in the spirit of tus:
+
+1. ``POST /api/v1/files/uploads`` with the name and size opens a session.
+2. The client PUTs the bytes, in as many pieces as it likes, each with an
+   ``Upload-Offset`` header saying where it starts.
+3. After a dropped connection, ``GET`` on the session returns the offset
+   to resume from.
+
+Either way the bytes are streamed to :mod:`storage` as they arrive, typed
+by their magic bytes once complete, and stored under their SHA-256. A
+user uploading a file they already uploaded gets the existing
+``uploaded_files`` row back.
+"""
+import re
+import uuid
+from typing import AsyncIterator
+
+from db import find_file_by_hash, insert_uploaded_file
+from images import MAX_IMAGE_BYTES, READ_CHUNK_BYTES, sniff_image_type
+from storage import LocalStorage
+
+MAX_UPLOAD_BYTES = MAX_IMAGE_BYTES
+MAX_RESUMABLE_BYTES = 50 * 1024 * 1024
+CHUNK_BYTES = 4 * 1024 * 1024
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadRejected(ValueError):
+    """The upload cannot be accepted; the message is the 400 detail."""
+
+
+class UploadNotFound(LookupError):
+    """No such upload session for this user (or it has expired)."""
+
+
+def sniff_file_type(head: bytes) -> str | None:
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return sniff_image_type(head)
+
+
+async def read_chunks(upload, chunk_size: int = READ_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+async def capped(chunks: AsyncIterator[bytes], start: int, limit: int,
+                 detail: str = "File too large") -> AsyncIterator[bytes]:
+    """Pass ``chunks`` through, failing before the total passes ``limit``."""
+    total = start
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > limit:
+            raise UploadRejected(detail)
+        yield chunk
+
+
+class UploadService:
+    def __init__(self, storage: LocalStorage, max_bytes: int = MAX_UPLOAD_BYTES,
+                 max_resumable_bytes: int = MAX_RESUMABLE_BYTES, chunk_bytes: int = CHUNK_BYTES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.max_resumable_bytes = max_resumable_bytes
+        self.chunk_bytes = chunk_bytes
+
+    async def upload(self, upload, user_id: str, db=None) -> dict:
+        """Store a whole file sent in one request."""
+        upload_id = uuid.uuid4().hex
+        file_name = upload.filename or "upload"
+        await self.storage.create(upload_id, {"user_id": user_id, "file_name": file_name})
+        try:
+            await self.storage.append(upload_id, 0, capped(read_chunks(upload), 0, self.max_bytes))
+            return await self._complete(upload_id, user_id, file_name, db)
+        finally:
+            # Nothing to keep: a one-shot upload cannot be asked about later.
+            await self.storage.discard(upload_id)
+
+    async def create(self, user_id: str, file_name: str, file_size: int) -> dict:
+        if file_size <= 0:
+            raise UploadRejected("Empty file")
+        if file_size > self.max_resumable_bytes:
+            raise UploadRejected("File too large")
+        upload_id = uuid.uuid4().hex
+        await self.storage.create(
+            upload_id, {"user_id": user_id, "file_name": file_name, "file_size": file_size}
+        )
+        return self._progress(upload_id, 0, file_size)
+
+    async def status(self, upload_id: str, user_id: str) -> dict:
+        """Progress, or the stored file if the last piece is already in."""
+        meta = await self._meta(upload_id, user_id)
+        if "stored" in meta:
+            return meta["stored"]
+        return self._progress(upload_id, await self.storage.received(upload_id), meta["file_size"])
+
+    async def append(self, upload_id: str, user_id: str, offset: int,
+                     chunks: AsyncIterator[bytes], db=None) -> dict:
+        """Write the next piece of a resumable upload.
+
+        Raises :class:`storage.OffsetMismatch` if ``offset`` is not where
+        the upload stands. Returns the progress, or the stored file once
+        the last byte is in; resending the last piece returns it again.
+        """
+        meta = await self._meta(upload_id, user_id)
+        if "stored" in meta:
+            return meta["stored"]
+        file_size = meta["file_size"]
+        chunks = capped(chunks, offset, file_size, detail="Upload is larger than declared")
+        received = await self.storage.append(upload_id, offset, chunks)
+        if received < file_size:
+            return self._progress(upload_id, received, file_size)
+        try:
+            stored = await self._complete(upload_id, user_id, meta["file_name"], db)
+        except BaseException:
+            await self.storage.discard(upload_id)
+            raise
+        # Kept so a client that lost this response can still learn the result.
+        await self.storage.finish(upload_id, {**meta, "stored": stored})
+        return stored
+
+    async def _meta(self, upload_id: str, user_id: str) -> dict:
+        meta = await self.storage.meta(upload_id) if _UPLOAD_ID.match(upload_id) else None
+        if meta is None or meta["user_id"] != user_id or "file_size" not in meta:
+            raise UploadNotFound(upload_id)
+        return meta
+
+    def _progress(self, upload_id: str, offset: int, file_size: int) -> dict:
+        return {
+            "upload_id": upload_id,
+            "offset": offset,
+            "file_size": file_size,
+            "chunk_size": self.chunk_bytes,
+            "complete": False,
+        }
+
+    async def _complete(self, upload_id: str, user_id: str, file_name: str, db) -> dict:
+        sha256, size, head = await self.storage.digest(upload_id)
+        file_type = sniff_file_type(head)
+        if file_type is None:
+            await self.storage.discard(upload_id)
+            raise UploadRejected("Invalid file type")
+        key = await self.storage.commit(upload_id, sha256)
+        stored = {
+            "file_id": None,
+            "file_name": file_name,
+            "file_type": file_type,
+            "file_size": size,
+            "file_path": key,
+            "sha256": sha256,
+            "deduplicated": False,
+            "complete": True,
+        }
+        if db is None:
+            return stored
+        existing = await find_file_by_hash(db, user_id, sha256)
+        if existing is not None:
+            return {**stored, **_renamed(existing), "deduplicated": True}
+        stored["file_id"] = await insert_uploaded_file(
+            db, user_id, file_name=file_name, file_type=file_type, file_size=size,
+            file_path=key, sha256=sha256,
+        )
+        return stored
+
+
+def _renamed(row: dict) -> dict:
+    row = dict(row)
+    row["file_id"] = row.pop("id")
+    return row
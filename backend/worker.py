@@ -0,0 +1,64 @@
+"""Celery entry point for job mode.
+
+    JOB_BROKER=celery REDIS_URL=redis://... \\
+        celery -A worker worker -Q fynq.jobs.high,fynq.jobs.normal,fynq.jobs.low
+
+Workers share the API's configuration, job store and upload storage. Each
+worker process runs one event loop on a thread of its own, created after
+the fork, and jobs are submitted to it; background tasks such as the
+Gemini context-cache refresher and the message writer that saves answers
+to their chat sessions keep running between jobs. Scale workers
+(and choose which queues each one drains) independently of the API.
+"""
+import asyncio
+import threading
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from jobs import RUN_TASK
+from main import job_celery, job_runner, llm_client, message_writer
+
+if job_celery is None:
+    raise RuntimeError("Start workers with JOB_BROKER=celery")
+
+celery = job_celery
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """This process's loop, started on first use.
+
+    Never created at import: Celery imports this module before forking, and
+    children must not share the parent's selector and self-pipe.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="job-loop", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(llm_client.start(), loop).result()
+            if message_writer is not None:
+                asyncio.run_coroutine_threadsafe(message_writer.start(), loop).result()
+            _loop = loop
+        return _loop
+
+
+@worker_process_init.connect
+def _start(**kwargs):
+    _event_loop()
+
+
+@worker_process_shutdown.connect
+def _stop(**kwargs):
+    if _loop is not None:
+        if message_writer is not None:
+            # Flushes what is queued; anything unwritten is spilled for the next start.
+            asyncio.run_coroutine_threadsafe(message_writer.aclose(), _loop).result(timeout=15)
+        asyncio.run_coroutine_threadsafe(llm_client.aclose(), _loop).result(timeout=10)
+        _loop.call_soon_threadsafe(_loop.stop)
+
+
+@celery.task(name=RUN_TASK)
+def run_job(job_id: str) -> None:
+    asyncio.run_coroutine_threadsafe(job_runner.run(job_id), _event_loop()).result()
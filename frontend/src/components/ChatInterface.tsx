@@ -17,7 +17,7 @@ interface ChatInterfaceProps {
 
 const ChatInterface: React.FC<ChatInterfaceProps> = ({ currentSessionId, hasMessages, onSendMessage }) => {
   const { user } = useAuth();
-  const { currentMessages, addMessage, startNewChat } = useChat();
+  const { currentMessages, addMessage, saveMessage, confirmMessage, startNewChat } = useChat();
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [selectedImage, setSelectedImage] = useState<File | null>(null);
@@ -25,6 +25,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ currentSessionId, hasMess
   const fileInputRef = useRef<HTMLInputElement>(null);
   const textareaRef = useRef<HTMLTextAreaElement>(null);
   const lastAIMessageRef = useRef<HTMLDivElement | null>(null);
+  // Whether the backend saves messages itself; unknown until its first reply.
+  const backendSaves = useRef<boolean | null>(null);
 
   // Auto-scroll to bottom when new messages arrive, but only if needed
   useEffect(() => {
@@ -63,24 +65,35 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ currentSessionId, hasMess
     setInput('');
     setIsLoading(true);
 
+    // Show the question now. A backend with a database saves it before asking
+    // the model and says so with message ids; without one we save it first.
+    const savedHere = backendSaves.current === false;
+    const question = await addMessage(sessionId, messageText, 'user', savedHere);
     try {
-      // Add user message with sender field
-      await addMessage(sessionId, messageText, 'user');
-
       let response;
       if (selectedImage) {
-        response = await uploadImageToGemini(selectedImage, messageText);
+        response = await uploadImageToGemini(selectedImage, messageText, sessionId);
         setSelectedImage(null);
       } else {
-        response = await sendMessageToGemini(messageText);
+        response = await sendMessageToGemini(messageText, sessionId);
       }
 
-      // Add AI response with sender field
+      const ids = response?.message_ids;
+      backendSaves.current = Boolean(ids);
+      if (ids) {
+        confirmMessage(question, ids.user);
+      } else if (!savedHere) {
+        await saveMessage(question);
+      }
       if (response?.response) {
-        await addMessage(sessionId, response.response, 'bot');
+        const answer = await addMessage(sessionId, response.response, 'bot', !ids);
+        if (ids) confirmMessage(answer, ids.bot);
       }
     } catch (error) {
       console.error('Error sending message:', error);
+      // Until a reply has shown whether the backend saves, save the question
+      // ourselves rather than lose it.
+      if (backendSaves.current === null) await saveMessage(question);
       toast({
         title: "Error",
         description: "Failed to send message. Please try again.",
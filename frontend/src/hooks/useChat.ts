@@ -95,10 +95,20 @@ export const useChat = () => {
     return session;
   };
 
-  // Add message to session (optimistic)
-  const addMessage = async (sessionId: string, content: string, sender: 'user' | 'bot') => {
+  // Swap a message's temporary entry for its saved copy.
+  const replaceMessage = (sessionId: string, tempId: string, saved: Message) => {
+    setCurrentMessages(prev => {
+      const updated = [...prev.filter(m => m.id !== tempId && m.id !== saved.id), saved];
+      localforage.setItem(MESSAGES_KEY(sessionId), updated);
+      return updated;
+    });
+  };
+
+  // Add message to session (optimistic). With sync off it is only shown:
+  // save it later with saveMessage, or confirmMessage once the backend has.
+  const addMessage = async (sessionId: string, content: string, sender: 'user' | 'bot', sync = true) => {
     // Optimistically add to UI/cache
-    const tempId = 'temp-' + Date.now();
+    const tempId = 'temp-' + Date.now() + '-' + sender;
     const optimisticMsg: Message = {
       id: tempId,
       content,
@@ -111,20 +121,26 @@ export const useChat = () => {
       localforage.setItem(MESSAGES_KEY(sessionId), updated);
       return updated;
     });
-    // Sync to Supabase
-    const result = await chatMessageService.addMessage(sessionId, content, sender);
+    if (!sync) return optimisticMsg;
+    return saveMessage(optimisticMsg);
+  };
+
+  // Sync a message shown with sync off to Supabase.
+  const saveMessage = async (message: Message) => {
+    const result = await chatMessageService.addMessage(message.session_id, message.content, message.sender);
     if (result) {
-      setCurrentMessages(prev => {
-        const updated = [...prev.filter(m => m.id !== tempId), result];
-        localforage.setItem(MESSAGES_KEY(sessionId), updated);
-        return updated;
-      });
-      await loadMessages(sessionId);
+      replaceMessage(message.session_id, message.id, result);
+      await loadMessages(message.session_id);
       await loadSessions();
     }
     return result;
   };
 
+  // The backend saved a message shown with sync off under `id`.
+  const confirmMessage = (message: Message, id: string) => {
+    replaceMessage(message.session_id, message.id, { ...message, id });
+  };
+
   // Delete session
   const deleteSession = async (sessionId: string) => {
     const success = await chatSessionService.deleteSession(sessionId);
@@ -168,6 +184,8 @@ export const useChat = () => {
     loading,
     createSession,
     addMessage,
+    saveMessage,
+    confirmMessage,
     deleteSession,
     switchToSession,
     startNewChat,
@@ -37,7 +37,7 @@ async function fetchWithAuth(url: string, options: RequestInit = {}, onAuthError
   }
 }
 
-export const sendMessageToGemini = async (message: string, chat_id?: number, onAuthError?: () => void) => {
+export const sendMessageToGemini = async (message: string, chat_id?: string, onAuthError?: () => void) => {
   return fetchWithAuth(
     `${API_BASE_URL}/api/v1/chat/message`,
     {
@@ -48,12 +48,80 @@ export const sendMessageToGemini = async (message: string, chat_id?: number, onA
   );
 };
 
-export const uploadImageToGemini = async (file: File, message: string = '', chat_id?: number, onAuthError?: () => void) => {
+// Streams the answer over Server-Sent Events, calling onChunk as text arrives.
+// Resolves with the full answer once the server sends its `done` event.
+export const streamMessageFromGemini = async (
+  message: string,
+  onChunk: (text: string) => void,
+  chat_id?: string,
+  onAuthError?: () => void,
+  signal?: AbortSignal
+) => {
+  const token = getToken();
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+  if (token) {
+    headers['Authorization'] = `Bearer ${token}`;
+  }
+
+  const response = await fetch(`${API_BASE_URL}/api/v1/chat/stream`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify({ message, chat_id }),
+    signal,
+  });
+
+  if (response.status === 401 || response.status === 403) {
+    if (onAuthError) onAuthError();
+    throw new Error('Authentication required');
+  }
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({}));
+    throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      // Lines starting with ':' are heartbeats.
+      const event = frame.match(/^event: (.*)$/m)?.[1];
+      const data = frame.match(/^data: (.*)$/m)?.[1];
+      if (!event || !data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === 'chunk') {
+        answer += payload.text;
+        onChunk(payload.text);
+      } else if (event === 'error') {
+        throw new Error(payload.detail || 'Streaming failed');
+      } else if (event === 'done') {
+        return { response: answer, ...payload };
+      }
+    }
+  }
+
+  return { response: answer };
+};
+
+export const uploadImageToGemini = async (file: File, message: string = '', chat_id?: string, onAuthError?: () => void) => {
   const token = getToken();
   const formData = new FormData();
   formData.append('image', file);
   formData.append('message', message);
-  if (chat_id) formData.append('chat_id', chat_id.toString());
+  if (chat_id) formData.append('chat_id', chat_id);
   
   const headers: Record<string, string> = {};
   if (token) {
@@ -84,7 +152,74 @@ export const uploadImageToGemini = async (file: File, message: string = '', chat
   }
 };
 
+// Larger files go through a resumable session so a dropped connection
+// does not restart the upload from zero.
+const SINGLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
+export const uploadFileResumable = async (
+  file: File,
+  onProgress?: (sent: number, total: number) => void,
+  onAuthError?: () => void,
+) => {
+  const session = await fetchWithAuth(
+    `${API_BASE_URL}/api/v1/files/uploads`,
+    { method: 'POST', body: JSON.stringify({ file_name: file.name, file_size: file.size }) },
+    onAuthError
+  );
+  const url = `${API_BASE_URL}/api/v1/files/uploads/${session.upload_id}`;
+  let offset: number = session.offset;
+  let failures = 0;
+
+  while (true) {
+    const token = getToken();
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/octet-stream',
+      'Upload-Offset': offset.toString(),
+    };
+    if (token) headers['Authorization'] = `Bearer ${token}`;
+
+    let response: Response;
+    try {
+      response = await fetch(url, {
+        method: 'PUT',
+        headers,
+        body: file.slice(offset, offset + session.chunk_size),
+      });
+    } catch (error) {
+      // Network drop: ask the server how much arrived and carry on from there.
+      if (++failures > UPLOAD_RETRIES) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+      const status = await fetchWithAuth(url, {}, onAuthError);
+      // The last piece may have landed even though its response was lost.
+      if (status.complete) return status;
+      offset = status.offset;
+      continue;
+    }
+
+    if (response.status === 401 || response.status === 403) {
+      if (onAuthError) onAuthError();
+      throw new Error('Authentication required');
+    }
+    const data = await response.json().catch(() => ({}));
+    if (response.status === 409 && typeof data.offset === 'number') {
+      offset = data.offset;
+      continue;
+    }
+    if (!response.ok) {
+      throw new Error(data.detail || `HTTP error! status: ${response.status}`);
+    }
+    if (data.complete) return data;
+    offset = data.offset;
+    failures = 0;
+    if (onProgress) onProgress(offset, file.size);
+  }
+};
+
 export const uploadFile = async (file: File, onAuthError?: () => void) => {
+  if (file.size > SINGLE_UPLOAD_MAX_BYTES) {
+    return uploadFileResumable(file, undefined, onAuthError);
+  }
   const token = getToken();
   const formData = new FormData();
   formData.append('file', file);
@@ -118,9 +253,24 @@ export const uploadFile = async (file: File, onAuthError?: () => void) => {
   }
 };
 
-export const getChatHistory = async (onAuthError?: () => void) => {
+// Pages are newest-first; pass the returned next_cursor to load older messages.
+export const getChatHistory = async (sessionId: string, cursor?: string, limit: number = 50, onAuthError?: () => void) => {
+  const params = new URLSearchParams({ session_id: sessionId, limit: limit.toString() });
+  if (cursor) params.set('cursor', cursor);
+  return fetchWithAuth(
+    `${API_BASE_URL}/api/v1/chat/history?${params}`,
+    {
+      method: 'GET',
+    },
+    onAuthError
+  );
+};
+
+export const getChatSessions = async (cursor?: string, limit: number = 20, onAuthError?: () => void) => {
+  const params = new URLSearchParams({ limit: limit.toString() });
+  if (cursor) params.set('cursor', cursor);
   return fetchWithAuth(
-    `${API_BASE_URL}/api/v1/chat/history`,
+    `${API_BASE_URL}/api/v1/chat/sessions?${params}`,
     {
       method: 'GET',
     },
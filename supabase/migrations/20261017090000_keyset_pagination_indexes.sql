@@ -0,0 +1,17 @@
+-- Indexes for keyset (cursor) pagination of chat history served by the backend.
+-- Pages are read with
+--   WHERE session_id = $1 AND (created_at, id) < ($2, $3) ORDER BY created_at DESC, id DESC
+-- and
+--   WHERE user_id = $1 AND (updated_at, id) < ($2, $3) ORDER BY updated_at DESC, id DESC
+-- so every page is a bounded index range scan regardless of how long the history is.
+
+-- messages: content is not INCLUDEd because long AI answers would exceed the
+-- btree tuple size limit; the heap fetch is limited to the rows of one page.
+CREATE INDEX IF NOT EXISTS idx_messages_session_created
+  ON public.messages (session_id, created_at DESC, id DESC)
+  INCLUDE (is_user);
+
+-- chat_sessions: covers the sidebar projection for index-only scans.
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated
+  ON public.chat_sessions (user_id, updated_at DESC, id DESC)
+  INCLUDE (title, created_at, is_archived);
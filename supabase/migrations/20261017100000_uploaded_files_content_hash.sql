@@ -0,0 +1,7 @@
+-- Content hash of uploaded files so identical uploads (the same worksheet
+-- photo or PDF sent twice) can be recognised without re-reading storage.
+ALTER TABLE public.uploaded_files
+ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_user_sha256
+  ON public.uploaded_files (user_id, content_sha256);
@@ -0,0 +1,21 @@
+-- Tell API workers when a student's survey changes so they drop the
+-- personalization prompt compiled from it. The payload is the user id;
+-- workers LISTEN on survey_responses_changed.
+CREATE OR REPLACE FUNCTION public.notify_survey_response_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    PERFORM pg_notify('survey_responses_changed', OLD.user_id::text);
+  ELSE
+    PERFORM pg_notify('survey_responses_changed', NEW.user_id::text);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS survey_responses_change_notify ON public.survey_responses;
+CREATE TRIGGER survey_responses_change_notify
+AFTER INSERT OR UPDATE OR DELETE ON public.survey_responses
+FOR EACH ROW EXECUTE FUNCTION public.notify_survey_response_change();
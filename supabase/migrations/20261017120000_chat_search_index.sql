@@ -0,0 +1,48 @@
+-- Full-text search over chat titles and messages, served by the backend's
+-- /api/v1/chat/search. Queries use exactly the indexed expressions,
+--   to_tsvector('english', public.fynq_search_text(content)) @@ to_tsquery('english', $1)
+-- so a match is a GIN lookup. Expression indexes rather than stored tsvector
+-- columns: nothing is added to the rows the frontend selects, the tables
+-- are not rewritten, and every insert or edit updates the index whoever
+-- makes it.
+
+-- LaTeX as students would type it: symbols and commands become words,
+-- layout commands are dropped. Mirrors search_text() in backend/db/search.py.
+CREATE OR REPLACE FUNCTION public.fynq_search_text(body text)
+RETURNS text
+LANGUAGE plpgsql
+IMMUTABLE PARALLEL SAFE
+AS $$
+DECLARE
+  t text := coalesce(body, '');
+BEGIN
+  t := replace(t, 'α', ' alpha ');
+  t := replace(t, 'β', ' beta ');
+  t := replace(t, 'γ', ' gamma ');
+  t := replace(t, 'δ', ' delta ');
+  t := replace(t, 'Δ', ' delta ');
+  t := replace(t, 'θ', ' theta ');
+  t := replace(t, 'λ', ' lambda ');
+  t := replace(t, 'μ', ' mu ');
+  t := replace(t, 'π', ' pi ');
+  t := replace(t, 'σ', ' sigma ');
+  t := replace(t, 'φ', ' phi ');
+  t := replace(t, 'ω', ' omega ');
+  t := replace(t, '∫', ' int ');
+  t := replace(t, '∑', ' sum ');
+  t := replace(t, '√', ' sqrt ');
+  t := replace(t, '∞', ' infty ');
+  t := regexp_replace(t,
+    '\\(left|right|big|Big|bigg|Bigg|displaystyle|textstyle|quad|qquad|mathrm|mathbf|mathit|mathsf|mathcal|text|textrm|textbf|operatorname|begin|end|limits|nolimits)(?![a-zA-Z])',
+    ' ', 'g');
+  t := regexp_replace(t, '\\[dt]frac(?![a-zA-Z])', ' frac ', 'g');
+  t := regexp_replace(t, '\\([a-zA-Z]+)', ' \1 ', 'g');
+  RETURN regexp_replace(t, '[{}^_$\\]', ' ', 'g');
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_messages_search
+  ON public.messages USING GIN (to_tsvector('english', public.fynq_search_text(content)));
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_search
+  ON public.chat_sessions USING GIN (to_tsvector('english', public.fynq_search_text(title)));
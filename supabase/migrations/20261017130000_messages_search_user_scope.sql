@@ -0,0 +1,44 @@
+-- Scope message search to one user inside the index. idx_messages_search
+-- indexes every user's messages, so a common word ("force", "velocity")
+-- first matches the whole table and only then is cut down to one student's
+-- sessions by the join: the cost grows with all users' history, not theirs.
+--
+-- messages gets a copy of its session's user_id, filled by a trigger so it
+-- is right whoever inserts the row, and the GIN index leads with it
+-- (btree_gin provides GIN operator classes for uuid). Search then reads
+--   WHERE m.user_id = $1 AND to_tsvector('english', public.fynq_search_text(content)) @@ $2
+-- and both conditions are answered from the one index: only this user's
+-- entries for the query words are visited.
+--
+-- Sessions keep their title index: a student has tens of sessions, and
+-- idx_chat_sessions_user_updated already narrows the title search to them.
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE public.messages ADD COLUMN IF NOT EXISTS user_id UUID;
+
+CREATE OR REPLACE FUNCTION public.fynq_messages_set_user_id()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  SELECT s.user_id INTO NEW.user_id FROM public.chat_sessions s WHERE s.id = NEW.session_id;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS messages_set_user_id ON public.messages;
+CREATE TRIGGER messages_set_user_id
+  BEFORE INSERT OR UPDATE OF session_id ON public.messages
+  FOR EACH ROW EXECUTE FUNCTION public.fynq_messages_set_user_id();
+
+UPDATE public.messages m
+SET user_id = s.user_id
+FROM public.chat_sessions s
+WHERE s.id = m.session_id AND m.user_id IS DISTINCT FROM s.user_id;
+
+ALTER TABLE public.messages ALTER COLUMN user_id SET NOT NULL;
+
+DROP INDEX IF EXISTS public.idx_messages_search;
+CREATE INDEX idx_messages_search
+  ON public.messages USING GIN (user_id, to_tsvector('english', public.fynq_search_text(content)));